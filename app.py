@@ -2,24 +2,234 @@ import streamlit as st
 import pandas as pd
 import sqlite3
 import seaborn as sns
-import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
 from datetime import datetime, date, timedelta
 import os
 import hashlib
+import hmac
 import matplotlib.dates as mdates
 from io import BytesIO
 import folium
-from streamlit_folium import folium_static
+from folium.plugins import FastMarkerCluster
+import base64
+import bisect
+import csv
+import glob
+import gzip
+import html
+import itertools
+import json
+import logging
+import numpy as np
 import time
+import re
+import tempfile
+import queue
+import threading
+from collections import Counter, OrderedDict, deque
+from contextlib import contextmanager
 
 # Database setup
 DB_PATH = "fleet.db"  # Store in root directory
+DB_POOL_SIZE = 8
+DB_BUSY_TIMEOUT_MS = 5000
 
-def initialize_database():
+# Performance instrumentation
+METRICS_BUFFER_SIZE = 50000  # most recent timings held in memory between flushes
+METRIC_NAME_CHARS = 300
+
+class MetricsRecorder:
+    """Ring buffer of SQL and page timings shared by all sessions
+
+    Entries are [recorded_at, kind, name, page, duration_ms, row_count,
+    queries, rerun] lists; a statement's entry keeps growing as its rows are
+    fetched. The per-thread context names the page a session thread is
+    rendering, so its SQL is attributed to it, and pauses recording while the
+    buffer itself is being flushed.
+    """
+
+    def __init__(self, size=METRICS_BUFFER_SIZE):
+        self.entries = deque(maxlen=size)
+        self.context = threading.local()
+        self._drain_lock = threading.Lock()
+
+    def record(self, kind, name, page, seconds, row_count, queries=None, rerun=None):
+        if getattr(self.context, 'paused', False):
+            return None
+        entry = [time.time(), kind, name, page, seconds * 1000, row_count, queries, rerun]
+        self.entries.append(entry)
+        return entry
+
+    def record_sql(self, sql, seconds, row_count):
+        context = self.context
+        page = getattr(context, 'page', None)
+        entry = self.record('sql', _metric_name(sql), page, seconds, row_count)
+        if entry is not None and page is not None:
+            context.queries += 1
+            context.rows += row_count
+        return entry
+
+    def add_fetch(self, entry, seconds, row_count):
+        if entry is None:
+            return
+        entry[4] += seconds * 1000
+        entry[5] += row_count
+        if entry[3] is not None and getattr(self.context, 'page', None) == entry[3]:
+            self.context.rows += row_count
+
+    def drain(self, settle_seconds=1.0):
+        """Remove and return entries older than settle_seconds; newer ones may still be fetching"""
+        cutoff = time.time() - settle_seconds
+        drained = []
+        with self._drain_lock:
+            while self.entries and self.entries[0][0] < cutoff:
+                drained.append(self.entries.popleft())
+        return drained
+
+@st.cache_resource
+def get_metrics_recorder():
+    return MetricsRecorder()
+
+_METRIC_NAMES = {}
+
+def _metric_name(sql):
+    """Whitespace-collapsed statement text, memoised since most statements are module constants"""
+    name = _METRIC_NAMES.get(sql)
+    if name is None:
+        name = ' '.join(sql.split())[:METRIC_NAME_CHARS]
+        if len(_METRIC_NAMES) < METRICS_BUFFER_SIZE:
+            _METRIC_NAMES[sql] = name
+    return name
+
+class TimedCursor(sqlite3.Cursor):
+    """Cursor that times each statement and counts the rows it changes or fetch*() returns"""
+    _metric = None
+
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._metric = self.connection.metrics.record_sql(
+                sql, time.perf_counter() - started, max(self.rowcount, 0))
+
+    def executemany(self, sql, seq_of_parameters):
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self._metric = self.connection.metrics.record_sql(
+                sql, time.perf_counter() - started, max(self.rowcount, 0))
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = super().fetchone()
+        self.connection.metrics.add_fetch(self._metric, time.perf_counter() - started, 0 if row is None else 1)
+        return row
+
+    def fetchmany(self, size=None):
+        started = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self.connection.metrics.add_fetch(self._metric, time.perf_counter() - started, len(rows))
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = super().fetchall()
+        self.connection.metrics.add_fetch(self._metric, time.perf_counter() - started, len(rows))
+        return rows
+
+class TimedConnection(sqlite3.Connection):
+    """Connection whose statements, including the execute() shortcuts and pandas reads, go through TimedCursor"""
+    metrics = None
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+class ConnectionPool:
+    """Thread-safe pool of SQLite connections shared by all sessions"""
+
+    def __init__(self, db_path, size=DB_POOL_SIZE):
+        self.db_path = db_path
+        self.size = size
+        self._idle = queue.LifoQueue(maxsize=size)
+        self._lock = threading.Lock()
+        self._created = 0
+
+    def _connect(self):
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=DB_BUSY_TIMEOUT_MS / 1000,
+            check_same_thread=False,  # connections move between session threads via the pool
+            factory=TimedConnection,
+        )
+        conn.metrics = get_metrics_recorder()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA busy_timeout={DB_BUSY_TIMEOUT_MS}")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        conn.execute("PRAGMA cache_size=-16000")  # 16 MB page cache per connection
+        return conn
+
+    def acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                return self._connect()
+        # Pool exhausted, wait for another session to hand a connection back
+        return self._idle.get(timeout=DB_BUSY_TIMEOUT_MS / 1000)
+
+    def release(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        self._idle.put_nowait(conn)
+
+@st.cache_resource
+def get_connection_pool(db_path):
+    # Streamlit reruns the script on every interaction; creating the pool is
+    # the once-per-process point where pending schema migrations are applied
+    pool = ConnectionPool(db_path)
+    conn = pool.acquire()
+    try:
+        migrate_database(conn)
+    finally:
+        pool.release(conn)
+    return pool
+
+@contextmanager
+def get_db(db_path=None):
+    """Borrow a pooled connection; commits on success and rolls back on error"""
+    pool = get_connection_pool(db_path or DB_PATH)
+    conn = pool.acquire()
+    try:
+        yield conn
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        pool.release(conn)
+
+# Schema migrations
+# End date stored for open-ended assignments by every "active until" expression.
+# The planner only uses idx_assignment_active_until when a query's expression
+# text matches the index exactly, so all of them are built from this one value.
+OPEN_END_DATE = '9999-12-31'
+
+def _migrate_initial_schema(conn):
     """Create database tables if they don't exist"""
-    conn = sqlite3.connect(DB_PATH)
     cursor = conn.cursor()
-    
+
     # Create tables
     cursor.execute('''
     CREATE TABLE IF NOT EXISTS vehicle (
@@ -108,12 +318,651 @@ def initialize_database():
         INSERT OR IGNORE INTO users (username, password, role)
         VALUES (?, ?, ?)
     ''', ('admin', hashed, 'admin'))
-    
+
+def _migrate_hot_query_indexes(conn):
+    """Secondary indexes for the assignment/maintenance/compliance hot queries"""
+    cursor = conn.cursor()
+
+    # Expression index behind ACTIVE_ASSIGNMENT; SQLite rejects date('now') in a
+    # partial index predicate, so "active" is a range scan on the open-until date
+    cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_assignment_active_until ON assignment(COALESCE(end_date, '{OPEN_END_DATE}'))")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_assignment_plate ON assignment(plate_number, start_date)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_assignment_driver ON assignment(driver_id, start_date)")
+    # Open-ended assignments are the ones that never age out of "active"
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_assignment_open ON assignment(plate_number, driver_id) WHERE end_date IS NULL")
+
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_maintenance_plate ON maintenance(plate_number, last_service_date)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_maintenance_next_service ON maintenance(next_service_date)")
+
+    # Partial index: the handful of vehicles missing an inspection, not half the table
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_compliance_inspection_missing ON compliance(plate_number) WHERE yearly_inspection = 'No'")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_compliance_inspection ON compliance(inspection_date)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_compliance_insurance ON compliance(insurance_date)")
+
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_change_log_time ON change_log(change_time)")
+    cursor.execute("ANALYZE")
+
+def _migrate_gps_ping(conn):
+    """Time series of telematics positions, one row per ping"""
+    cursor = conn.cursor()
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS gps_ping (
+        id INTEGER PRIMARY KEY,
+        assignment_id INTEGER,
+        plate_number TEXT NOT NULL,
+        ping_time TEXT NOT NULL,
+        lat REAL NOT NULL,
+        lon REAL NOT NULL,
+        speed REAL,
+        heading REAL,
+        FOREIGN KEY(assignment_id) REFERENCES assignment(id),
+        FOREIGN KEY(plate_number) REFERENCES vehicle(plate_number)
+    )''')
+    # Serves both "latest ping per vehicle" and per-vehicle track history
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_gps_ping_plate_time ON gps_ping(plate_number, ping_time)")
+
+def _migrate_geofence(conn):
+    """Region polygons and the per-ping inside/outside flag used to count excursions"""
+    cursor = conn.cursor()
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS geofence (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        work_place TEXT NOT NULL,
+        name TEXT NOT NULL,
+        polygon TEXT NOT NULL  -- JSON [[lat, lon], ...]
+    )''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_geofence_work_place ON geofence(work_place)")
+    cursor.execute("ALTER TABLE gps_ping ADD COLUMN outside_fence INTEGER NOT NULL DEFAULT 0")
+
+def _execute_script(conn, script):
+    """Run ;-separated statements inside the caller's transaction (executescript would COMMIT first)"""
+    statement = ""
+    for part in script.split(";"):
+        statement += part + ";"
+        if sqlite3.complete_statement(statement):
+            if statement.strip(" \n;"):
+                conn.execute(statement)
+            statement = ""
+
+# Last day an assignment counts as active (see ACTIVE_ASSIGNMENT); '' marks never-assigned vehicles
+_ACTIVE_UNTIL = "COALESCE({}.end_date, '" + OPEN_END_DATE + "')"
+
+def _migrate_report_summaries(conn):
+    """Report aggregates kept current by triggers so report pages read a few rows.
+
+    Counts that depend on today's date are stored as histograms over the day
+    an assignment (or a vehicle's latest assignment) stops being active, so
+    "active as of today" is a SUM over the buckets >= date('now').
+    """
+    _execute_script(conn, f'''
+    CREATE TABLE IF NOT EXISTS summary_vehicles_by_assignment (
+        assigned_for TEXT PRIMARY KEY,  -- '' for vehicles without one
+        vehicle_count INTEGER NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS summary_drivers_by_reporting (
+        reporting_to TEXT PRIMARY KEY,  -- '' for drivers without one
+        driver_count INTEGER NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS summary_assignments_by_end (
+        active_until TEXT PRIMARY KEY,
+        assignment_count INTEGER NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS vehicle_active_until (
+        plate_number TEXT PRIMARY KEY,
+        active_until TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_vehicle_active_until ON vehicle_active_until(active_until);
+    CREATE TABLE IF NOT EXISTS summary_vehicles_by_end (
+        active_until TEXT PRIMARY KEY,
+        vehicle_count INTEGER NOT NULL
+    );
+
+    CREATE TRIGGER IF NOT EXISTS trg_vehicle_insert_summary AFTER INSERT ON vehicle BEGIN
+        INSERT INTO summary_vehicles_by_assignment VALUES (COALESCE(NEW.assigned_for, ''), 1)
+            ON CONFLICT(assigned_for) DO UPDATE SET vehicle_count = vehicle_count + 1;
+        INSERT INTO vehicle_active_until VALUES (NEW.plate_number, COALESCE(
+            (SELECT MAX({_ACTIVE_UNTIL.format("assignment")}) FROM assignment WHERE plate_number = NEW.plate_number), ''));
+    END;
+    CREATE TRIGGER IF NOT EXISTS trg_vehicle_delete_summary AFTER DELETE ON vehicle BEGIN
+        UPDATE summary_vehicles_by_assignment SET vehicle_count = vehicle_count - 1
+            WHERE assigned_for = COALESCE(OLD.assigned_for, '');
+        DELETE FROM vehicle_active_until WHERE plate_number = OLD.plate_number;
+    END;
+    CREATE TRIGGER IF NOT EXISTS trg_vehicle_update_summary AFTER UPDATE OF assigned_for ON vehicle
+    WHEN OLD.assigned_for IS NOT NEW.assigned_for BEGIN
+        UPDATE summary_vehicles_by_assignment SET vehicle_count = vehicle_count - 1
+            WHERE assigned_for = COALESCE(OLD.assigned_for, '');
+        INSERT INTO summary_vehicles_by_assignment VALUES (COALESCE(NEW.assigned_for, ''), 1)
+            ON CONFLICT(assigned_for) DO UPDATE SET vehicle_count = vehicle_count + 1;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_driver_insert_summary AFTER INSERT ON driver BEGIN
+        INSERT INTO summary_drivers_by_reporting VALUES (COALESCE(NEW.reporting_to, ''), 1)
+            ON CONFLICT(reporting_to) DO UPDATE SET driver_count = driver_count + 1;
+    END;
+    CREATE TRIGGER IF NOT EXISTS trg_driver_delete_summary AFTER DELETE ON driver BEGIN
+        UPDATE summary_drivers_by_reporting SET driver_count = driver_count - 1
+            WHERE reporting_to = COALESCE(OLD.reporting_to, '');
+    END;
+    CREATE TRIGGER IF NOT EXISTS trg_driver_update_summary AFTER UPDATE OF reporting_to ON driver
+    WHEN OLD.reporting_to IS NOT NEW.reporting_to BEGIN
+        UPDATE summary_drivers_by_reporting SET driver_count = driver_count - 1
+            WHERE reporting_to = COALESCE(OLD.reporting_to, '');
+        INSERT INTO summary_drivers_by_reporting VALUES (COALESCE(NEW.reporting_to, ''), 1)
+            ON CONFLICT(reporting_to) DO UPDATE SET driver_count = driver_count + 1;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_assignment_insert_summary AFTER INSERT ON assignment BEGIN
+        INSERT INTO summary_assignments_by_end VALUES ({_ACTIVE_UNTIL.format("NEW")}, 1)
+            ON CONFLICT(active_until) DO UPDATE SET assignment_count = assignment_count + 1;
+        UPDATE vehicle_active_until SET active_until = {_ACTIVE_UNTIL.format("NEW")}
+            WHERE plate_number = NEW.plate_number AND active_until < {_ACTIVE_UNTIL.format("NEW")};
+    END;
+    CREATE TRIGGER IF NOT EXISTS trg_assignment_delete_summary AFTER DELETE ON assignment BEGIN
+        UPDATE summary_assignments_by_end SET assignment_count = assignment_count - 1
+            WHERE active_until = {_ACTIVE_UNTIL.format("OLD")};
+        UPDATE vehicle_active_until SET active_until = COALESCE(
+            (SELECT MAX({_ACTIVE_UNTIL.format("assignment")}) FROM assignment WHERE plate_number = OLD.plate_number), '')
+            WHERE plate_number = OLD.plate_number;
+    END;
+    CREATE TRIGGER IF NOT EXISTS trg_assignment_update_summary AFTER UPDATE OF plate_number, end_date ON assignment
+    WHEN OLD.plate_number IS NOT NEW.plate_number OR OLD.end_date IS NOT NEW.end_date BEGIN
+        UPDATE summary_assignments_by_end SET assignment_count = assignment_count - 1
+            WHERE active_until = {_ACTIVE_UNTIL.format("OLD")};
+        INSERT INTO summary_assignments_by_end VALUES ({_ACTIVE_UNTIL.format("NEW")}, 1)
+            ON CONFLICT(active_until) DO UPDATE SET assignment_count = assignment_count + 1;
+        UPDATE vehicle_active_until SET active_until = COALESCE(
+            (SELECT MAX({_ACTIVE_UNTIL.format("assignment")}) FROM assignment WHERE plate_number = vehicle_active_until.plate_number), '')
+            WHERE plate_number IN (OLD.plate_number, NEW.plate_number);
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_vehicle_active_insert AFTER INSERT ON vehicle_active_until BEGIN
+        INSERT INTO summary_vehicles_by_end VALUES (NEW.active_until, 1)
+            ON CONFLICT(active_until) DO UPDATE SET vehicle_count = vehicle_count + 1;
+    END;
+    CREATE TRIGGER IF NOT EXISTS trg_vehicle_active_delete AFTER DELETE ON vehicle_active_until BEGIN
+        UPDATE summary_vehicles_by_end SET vehicle_count = vehicle_count - 1 WHERE active_until = OLD.active_until;
+    END;
+    CREATE TRIGGER IF NOT EXISTS trg_vehicle_active_update AFTER UPDATE OF active_until ON vehicle_active_until
+    WHEN OLD.active_until IS NOT NEW.active_until BEGIN
+        UPDATE summary_vehicles_by_end SET vehicle_count = vehicle_count - 1 WHERE active_until = OLD.active_until;
+        INSERT INTO summary_vehicles_by_end VALUES (NEW.active_until, 1)
+            ON CONFLICT(active_until) DO UPDATE SET vehicle_count = vehicle_count + 1;
+    END;
+    ''')
+    rebuild_report_summaries(conn)
+
+def rebuild_report_summaries(conn):
+    """Recompute every summary table from the base tables (backfill and drift repair)"""
+    _execute_script(conn, f'''
+    DELETE FROM summary_vehicles_by_assignment;
+    INSERT INTO summary_vehicles_by_assignment
+        SELECT COALESCE(assigned_for, ''), COUNT(*) FROM vehicle GROUP BY 1;
+    DELETE FROM summary_drivers_by_reporting;
+    INSERT INTO summary_drivers_by_reporting
+        SELECT COALESCE(reporting_to, ''), COUNT(*) FROM driver GROUP BY 1;
+    DELETE FROM summary_assignments_by_end;
+    INSERT INTO summary_assignments_by_end
+        SELECT {_ACTIVE_UNTIL.format("assignment")}, COUNT(*) FROM assignment GROUP BY 1;
+    DELETE FROM vehicle_active_until;
+    DELETE FROM summary_vehicles_by_end;
+    INSERT INTO vehicle_active_until
+        SELECT plate_number, COALESCE(
+            (SELECT MAX({_ACTIVE_UNTIL.format("assignment")}) FROM assignment WHERE plate_number = vehicle.plate_number), '')
+        FROM vehicle;
+    ''')
+
+def _migrate_compliance_expiry(conn):
+    """Stored insurance/inspection expiry dates (kept by triggers) and the alert table the scan fills"""
+    _execute_script(conn, '''
+    ALTER TABLE compliance ADD COLUMN insurance_expiry TEXT;
+    ALTER TABLE compliance ADD COLUMN inspection_expiry TEXT;
+    UPDATE compliance SET insurance_expiry = date(insurance_date, '+1 year'),
+                          inspection_expiry = date(inspection_date, '+1 year');
+    CREATE INDEX IF NOT EXISTS idx_compliance_insurance_expiry ON compliance(insurance_expiry);
+    CREATE INDEX IF NOT EXISTS idx_compliance_inspection_expiry ON compliance(inspection_expiry);
+
+    CREATE TRIGGER IF NOT EXISTS trg_compliance_insert_expiry AFTER INSERT ON compliance BEGIN
+        UPDATE compliance SET insurance_expiry = date(NEW.insurance_date, '+1 year'),
+                              inspection_expiry = date(NEW.inspection_date, '+1 year')
+        WHERE plate_number = NEW.plate_number;
+    END;
+    CREATE TRIGGER IF NOT EXISTS trg_compliance_update_expiry AFTER UPDATE OF insurance_date, inspection_date
+    ON compliance BEGIN
+        UPDATE compliance SET insurance_expiry = date(NEW.insurance_date, '+1 year'),
+                              inspection_expiry = date(NEW.inspection_date, '+1 year')
+        WHERE plate_number = NEW.plate_number;
+    END;
+
+    CREATE TABLE IF NOT EXISTS compliance_alert (
+        id INTEGER PRIMARY KEY,
+        plate_number TEXT NOT NULL,
+        alert_type TEXT NOT NULL,
+        due_date TEXT,  -- NULL for a missing inspection
+        bucket TEXT NOT NULL,
+        scanned_on TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_compliance_alert_due ON compliance_alert(due_date);
+    CREATE INDEX IF NOT EXISTS idx_compliance_alert_bucket ON compliance_alert(bucket, due_date);
+    CREATE INDEX IF NOT EXISTS idx_compliance_alert_type ON compliance_alert(alert_type, due_date);
+    ''')
+
+# Ordered (version, description, step) list; append new steps, never edit applied ones
+MIGRATIONS = [
+    (1, "initial schema", _migrate_initial_schema),
+    (2, "hot query indexes", _migrate_hot_query_indexes),
+    (3, "gps ping history", _migrate_gps_ping),
+    (4, "assignment last_update index", lambda conn: conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_assignment_last_update ON assignment(last_update)")),
+    (5, "geofences", _migrate_geofence),
+    (6, "assignment start_date index", lambda conn: conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_assignment_start ON assignment(start_date)")),
+    (7, "report summary tables", _migrate_report_summaries),
+    (8, "change log filter indexes", lambda conn: _execute_script(conn, '''
+        CREATE INDEX IF NOT EXISTS idx_change_log_user_time ON change_log(username, change_time);
+        CREATE INDEX IF NOT EXISTS idx_change_log_table_time ON change_log(table_name, change_time);
+    ''')),
+    (9, "odometer readings", lambda conn: _execute_script(conn, '''
+        CREATE TABLE IF NOT EXISTS odometer_reading (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            plate_number TEXT NOT NULL,
+            reading_date TEXT NOT NULL,
+            km INTEGER NOT NULL,
+            FOREIGN KEY(plate_number) REFERENCES vehicle(plate_number)
+        );
+        CREATE INDEX IF NOT EXISTS idx_odometer_plate_date ON odometer_reading(plate_number, reading_date);
+    ''')),
+    (10, "fuel fill ledger", lambda conn: _execute_script(conn, '''
+        CREATE TABLE IF NOT EXISTS fuel_fill (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            plate_number TEXT NOT NULL,
+            fill_date TEXT NOT NULL,
+            liters REAL NOT NULL,
+            odometer_km INTEGER NOT NULL,
+            cost REAL,
+            station TEXT,
+            FOREIGN KEY(plate_number) REFERENCES vehicle(plate_number)
+        );
+        CREATE INDEX IF NOT EXISTS idx_fuel_fill_date ON fuel_fill(fill_date);
+        CREATE INDEX IF NOT EXISTS idx_fuel_fill_plate_date ON fuel_fill(plate_number, fill_date);
+    ''')),
+    (11, "trips and daily distance", lambda conn: _execute_script(conn, '''
+        CREATE TABLE IF NOT EXISTS trip (
+            id INTEGER PRIMARY KEY,
+            plate_number TEXT NOT NULL,
+            start_time TEXT NOT NULL,
+            end_time TEXT NOT NULL,
+            distance_km REAL NOT NULL,
+            max_speed REAL,
+            pings INTEGER NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_trip_plate_start ON trip(plate_number, start_time);
+        CREATE INDEX IF NOT EXISTS idx_trip_start ON trip(start_time);
+        CREATE TABLE IF NOT EXISTS daily_distance (
+            plate_number TEXT NOT NULL,
+            day TEXT NOT NULL,
+            km REAL NOT NULL,
+            trips INTEGER NOT NULL,
+            driving_minutes REAL NOT NULL,
+            PRIMARY KEY (plate_number, day)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS idx_daily_distance_day ON daily_distance(day);
+    ''')),
+    (12, "compliance expiry dates and alerts", _migrate_compliance_expiry),
+    (13, "performance metrics", lambda conn: _execute_script(conn, '''
+        CREATE TABLE IF NOT EXISTS perf_metric (
+            id INTEGER PRIMARY KEY,
+            recorded_at TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            name TEXT NOT NULL,
+            page TEXT,
+            duration_ms REAL NOT NULL,
+            row_count INTEGER NOT NULL,
+            queries INTEGER,
+            rerun INTEGER
+        );
+        CREATE INDEX IF NOT EXISTS idx_perf_metric_time ON perf_metric(recorded_at);
+    ''')),
+    (14, "covering odometer window index", lambda conn: _execute_script(conn, '''
+        CREATE INDEX IF NOT EXISTS idx_odometer_plate_date_km ON odometer_reading(plate_number, reading_date, km);
+        DROP INDEX IF EXISTS idx_odometer_plate_date;
+    ''')),
+    (15, "assignment span change log", lambda conn: _execute_script(conn, '''
+        CREATE TABLE IF NOT EXISTS assignment_span_change (
+            id INTEGER PRIMARY KEY,
+            plate_number TEXT,
+            driver_id INTEGER
+        );
+        CREATE TRIGGER IF NOT EXISTS trg_assignment_span_update
+        AFTER UPDATE OF plate_number, driver_id, start_date, end_date ON assignment BEGIN
+            INSERT INTO assignment_span_change (plate_number, driver_id)
+            VALUES (OLD.plate_number, OLD.driver_id), (NEW.plate_number, NEW.driver_id);
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_assignment_span_delete AFTER DELETE ON assignment BEGIN
+            INSERT INTO assignment_span_change (plate_number, driver_id) VALUES (OLD.plate_number, OLD.driver_id);
+        END;
+    ''')),
+    (16, "assignment position version", lambda conn: _execute_script(conn, '''
+        ALTER TABLE assignment ADD COLUMN position_version INTEGER NOT NULL DEFAULT 0;
+        CREATE INDEX IF NOT EXISTS idx_assignment_position_version ON assignment(position_version);
+        CREATE TRIGGER IF NOT EXISTS trg_assignment_position_insert AFTER INSERT ON assignment BEGIN
+            UPDATE assignment SET position_version = (SELECT MAX(position_version) FROM assignment) + 1
+            WHERE id = NEW.id;
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_assignment_position_update
+        AFTER UPDATE OF gps_position, last_update, geofence_violations ON assignment BEGIN
+            UPDATE assignment SET position_version = (SELECT MAX(position_version) FROM assignment) + 1
+            WHERE id = NEW.id;
+        END;
+    ''')),
+]
+
+def get_schema_version(conn):
+    row = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()
+    return row[0] or 0
+
+def migrate_database(conn):
+    """Apply pending migrations, each in its own write transaction"""
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS schema_version (
+        version INTEGER PRIMARY KEY,
+        description TEXT NOT NULL,
+        applied_at TEXT NOT NULL
+    )''')
     conn.commit()
-    conn.close()
 
-# Initialize database on startup
-initialize_database()
+    for version, description, step in MIGRATIONS:
+        if version <= get_schema_version(conn):
+            continue
+        # BEGIN IMMEDIATE serialises concurrent processes racing to migrate
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if version <= get_schema_version(conn):
+                conn.rollback()
+                continue
+            step(conn)
+            conn.execute(
+                "INSERT INTO schema_version (version, description, applied_at) VALUES (?, ?, ?)",
+                (version, description, datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    return get_schema_version(conn)
+
+# Index-friendly "assignment is active" predicate (see idx_assignment_active_until).
+# Dates are stored as ISO text, so comparisons never need DATE() around the column.
+ACTIVE_ASSIGNMENT = f"COALESCE(end_date, '{OPEN_END_DATE}') >= date('now')"
+
+# Tables whose size grows with history; hot queries must never full-scan them
+HISTORY_TABLES = ('assignment', 'maintenance', 'compliance', 'change_log', 'gps_ping', 'fuel_fill', 'trip',
+                  'daily_distance', 'perf_metric', 'odometer_reading')
+SQL_KEYWORDS = {'WHERE', 'JOIN', 'LEFT', 'INNER', 'ON', 'GROUP', 'ORDER', 'LIMIT', 'USING'}
+
+def find_unbounded_reads(conn, queries):
+    """Return (name, plan detail) for every unbounded read of a history table.
+
+    That is a full SCAN, or a SEARCH that seeks only key equality on a
+    non-unique index, e.g. one driver's whole assignment history per joined
+    row. A SEARCH is bounded by a range on the index, a rowid or unique
+    lookup, a partial index, or a LIMIT on the query.
+    """
+    # Scanning a partial index only touches the rows matching its predicate
+    partial_indexes, unique_indexes, key_columns = set(), set(), {}
+    for table in HISTORY_TABLES:
+        for row in conn.execute(f"PRAGMA index_list({table})"):
+            if row[4]:
+                partial_indexes.add(row[1])
+            if row[2]:
+                unique_indexes.add(row[1])
+        key_columns[table] = sum(1 for row in conn.execute(f"PRAGMA table_info({table})") if row[5])
+    reads = []
+    for name, sql in queries.items():
+        # Plans name tables by their alias, so map aliases back to tables
+        aliases = {}
+        for table, alias in re.findall(r'\b(?:FROM|JOIN)\s+(\w+)(?:\s+(?:AS\s+)?(\w+))?', sql, re.IGNORECASE):
+            aliases[table] = table
+            if alias and alias.upper() not in SQL_KEYWORDS:
+                aliases[alias] = table
+        # A LIMIT bounds the outer query when it ends the statement, and a
+        # subquery (EXISTS, a correlated "latest row" lookup) when it has one
+        outer_limit = re.search(r'\bLIMIT\b[^()]*$', sql, re.IGNORECASE) is not None
+        inner_limit = re.search(r'\bLIMIT\b', sql, re.IGNORECASE) is not None
+        # Plans don't depend on bound values, so placeholders get NULLs
+        plan = conn.execute(f"EXPLAIN QUERY PLAN {sql}", [None] * sql.count('?')).fetchall()
+        parents = {row[0]: row[1] for row in plan}
+        details = {row[0]: row[3] for row in plan}
+        for row in plan:
+            node, in_subquery = row[1], False
+            while node:
+                in_subquery = in_subquery or 'SCALAR SUBQUERY' in details.get(node, '')
+                node = parents.get(node, 0)
+            limited = outer_limit or (in_subquery and inner_limit)
+            words = row[3].split()
+            if len(words) < 2 or aliases.get(words[1]) not in HISTORY_TABLES:
+                continue
+            if partial_indexes.intersection(words):
+                continue
+            if words[0] == 'SCAN':
+                reads.append((name, row[3]))
+            elif words[0] == 'SEARCH' and not limited:
+                constraint = row[3][row[3].rfind('('):]
+                seeks_row = (
+                    'rowid=' in constraint or unique_indexes.intersection(words)
+                    # WITHOUT ROWID primary key, with every key column pinned
+                    or ('USING PRIMARY KEY' in row[3] and constraint.count('=?') >= key_columns[aliases[words[1]]])
+                )
+                if not seeks_row and '>' not in constraint and '<' not in constraint:
+                    reads.append((name, row[3]))
+    return reads
+
+# Query caching
+QUERY_CACHE_TTL = 300  # seconds; also bounds staleness of date('now') based results
+_CACHES_BY_TABLE = {}
+
+def cached_query(*tables, ttl=QUERY_CACHE_TTL, resource=False):
+    """st.cache_data shared by all sessions and cleared when any of `tables` is written
+
+    resource=True caches the returned object itself (st.cache_resource) for
+    structures that are expensive to build and never mutated by callers.
+    """
+    def decorator(func):
+        cache = st.cache_resource if resource else st.cache_data
+        cached = cache(ttl=ttl, show_spinner=False)(func)
+        for table in tables:
+            _CACHES_BY_TABLE.setdefault(table, []).append(cached)
+        return cached
+    return decorator
+
+@st.cache_resource
+def get_table_versions():
+    """Write counter per table, shared by all sessions; keys caches that outlive a rerun"""
+    return Counter()
+
+def invalidate_tables(*tables):
+    """Drop cached query results that read any of `tables`; call after every write"""
+    get_table_versions().update(tables)
+    for table in tables:
+        for cached in _CACHES_BY_TABLE.get(table, ()):
+            cached.clear()
+
+# Background jobs
+@st.cache_resource
+def start_periodic_job(name, interval_seconds, _job):
+    """Run _job every interval_seconds on a daemon thread, started once per server process"""
+    def run():
+        while True:
+            try:
+                _job()
+            except Exception:
+                logging.getLogger(__name__).exception("Background job %s failed", name)
+            time.sleep(interval_seconds)
+
+    thread = threading.Thread(target=run, name=name, daemon=True)
+    thread.start()
+    return thread
+
+# Paginated grids
+GRID_PAGE_SIZES = (25, 50, 100)
+GRID_TABLES = ('vehicle', 'driver', 'change_log', 'compliance_alert')
+
+@cached_query(*GRID_TABLES)
+def count_rows(table, where_sql, params):
+    with get_db() as conn:
+        return conn.execute(f"SELECT COUNT(*) FROM {table} {where_sql}", params).fetchone()[0]
+
+def _seek_predicate(sort_column, key_column, last_value, last_key, descending):
+    """Keyset condition for rows after (last_value, last_key) in ORDER BY order"""
+    # SQLite sorts NULLs first ascending and last descending
+    if descending:
+        if last_value is None:
+            return f"({sort_column} IS NULL AND {key_column} < ?)", [last_key]
+        return (f"({sort_column} < ? OR {sort_column} IS NULL OR ({sort_column} = ? AND {key_column} < ?))",
+                [last_value, last_value, last_key])
+    if last_value is None:
+        return f"({sort_column} IS NOT NULL OR {key_column} > ?)", [last_key]
+    return f"({sort_column} > ? OR ({sort_column} = ? AND {key_column} > ?))", [last_value, last_value, last_key]
+
+def _to_sql_value(value):
+    if pd.isna(value):
+        return None
+    return value.item() if hasattr(value, 'item') else value
+
+def paginated_grid(key, table, columns, key_column, sort_columns, filters=None, descending=False,
+                   empty_message="No rows found", conditions=()):
+    """Render a page of `table` with filters, sorting and seek pagination done in SQLite.
+
+    `filters` maps column -> allowed values (selectbox) or None (substring search).
+    `conditions` are extra (sql, params) clauses from the caller's own widgets.
+    Column and table names come from code, never from user input.
+    """
+    filters = filters or {}
+    state = st.session_state
+    select_columns = list(dict.fromkeys([*columns, key_column, *sort_columns]))
+
+    controls = st.columns(len(filters) + 3)
+    clauses = [sql for sql, _ in conditions]
+    params = [value for _, values in conditions for value in values]
+    for box, (column, options) in zip(controls, filters.items()):
+        label = column.replace('_', ' ').title()
+        if options:
+            value = box.selectbox(label, ("All", *options), key=f"{key}_filter_{column}")
+            if value != "All":
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        else:
+            value = box.text_input(label, key=f"{key}_filter_{column}").strip()
+            if value:
+                clauses.append(f"{column} LIKE ?")
+                params.append(f"%{value}%")
+    sort_column = controls[-3].selectbox("Sort By", sort_columns, key=f"{key}_sort")
+    order = controls[-2].selectbox("Order", ("Ascending", "Descending"), index=int(descending), key=f"{key}_order")
+    page_size = controls[-1].selectbox("Rows", GRID_PAGE_SIZES, index=1, key=f"{key}_page_size")
+    descending = order == "Descending"
+
+    # Cursors are the (sort value, key) of the last row of each page already shown
+    signature = (tuple(clauses), tuple(params), sort_column, descending, page_size)
+    if state.get(f"{key}_signature") != signature:
+        state[f"{key}_signature"] = signature
+        state[f"{key}_cursors"] = []
+    cursors = state[f"{key}_cursors"]
+
+    where_sql = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    page_clauses, page_params = list(clauses), list(params)
+    if cursors:
+        seek_sql, seek_params = _seek_predicate(sort_column, key_column, *cursors[-1], descending)
+        page_clauses.append(seek_sql)
+        page_params.extend(seek_params)
+    page_where = f"WHERE {' AND '.join(page_clauses)}" if page_clauses else ""
+    direction = "DESC" if descending else "ASC"
+
+    with get_db() as conn:
+        page = pd.read_sql(
+            f"SELECT {', '.join(select_columns)} FROM {table} {page_where} "
+            f"ORDER BY {sort_column} {direction}, {key_column} {direction} LIMIT ?",
+            conn, params=page_params + [page_size + 1]
+        )
+    has_next = len(page) > page_size
+    page = page.iloc[:page_size]
+    total = count_rows(table, where_sql, tuple(params))
+
+    if page.empty:
+        st.info(empty_message)
+        return page
+
+    st.dataframe(page[columns], hide_index=True)
+
+    def next_page():
+        last = page.iloc[-1]
+        cursors.append((_to_sql_value(last[sort_column]), _to_sql_value(last[key_column])))
+
+    first_row = len(cursors) * page_size + 1
+    nav_prev, nav_info, nav_next = st.columns([1, 4, 1])
+    nav_prev.button("Previous", key=f"{key}_prev", disabled=not cursors, on_click=cursors.pop)
+    nav_info.caption(f"Rows {first_row}-{first_row + len(page) - 1} of {total}")
+    nav_next.button("Next", key=f"{key}_next", disabled=not has_next, on_click=next_page)
+    return page
+
+# Chart rendering
+CHART_CACHE_SIZE = 128  # rendered PNGs kept across all sessions
+
+class ChartCache:
+    """Thread-safe LRU of rendered chart PNG bytes"""
+
+    def __init__(self, max_items=CHART_CACHE_SIZE):
+        self.max_items = max_items
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            png = self._items.get(key)
+            if png is not None:
+                self._items.move_to_end(key)
+            return png
+
+    def put(self, key, png):
+        with self._lock:
+            self._items[key] = png
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+@st.cache_resource
+def get_chart_cache():
+    return ChartCache()
+
+def _data_fingerprint(data):
+    digest = hashlib.sha1()
+    digest.update(repr(getattr(data, 'columns', getattr(data, 'name', None))).encode())
+    digest.update(pd.util.hash_pandas_object(data, index=True).values.tobytes())
+    return digest.hexdigest()
+
+def render_chart(name, data, draw, title=None, rotation=0, figsize=(6.4, 4.8)):
+    """Show `draw(ax, data)` as a PNG, rendering only when `data` changes.
+
+    Uses the object-oriented Figure API rather than pyplot, so nothing is
+    registered in pyplot's global figure list and sessions can render
+    concurrently.
+    """
+    cache = get_chart_cache()
+    key = (name, _data_fingerprint(data))
+    png = cache.get(key)
+    if png is None:
+        fig = Figure(figsize=figsize)
+        ax = fig.subplots()
+        draw(ax, data)
+        if title:
+            ax.set_title(title)
+        if rotation:
+            ax.tick_params(axis='x', labelrotation=rotation)
+        buffer = BytesIO()
+        fig.savefig(buffer, format='png', bbox_inches='tight')
+        fig.clear()
+        png = buffer.getvalue()
+        cache.put(key, png)
+    st.image(png, width="stretch")
 
 # Enums
 VEHICLE_TYPES = ('Pickup', 'Land Cruiser', 'Prado', 'V8', 'Hardtop', 'Minibus', 'Bus', 'Crane', 'ISUZU FSR', 'Other')
@@ -129,110 +978,685 @@ MAINTENANCE_CENTERS = ('EEP', 'Moenco', 'Other')
 YES_NO = ('Yes', 'No')
 
 # User Authentication
+# scrypt cost: ~45 ms and 16 MiB per hash here, so 4 simultaneous logins on
+# one core stay under 250 ms at p95 (see `benchmark.py login --tune`)
+PASSWORD_SCRYPT_N = 2 ** 14
+PASSWORD_SCRYPT_R = 8
+PASSWORD_SCRYPT_P = 1
+PASSWORD_SALT_BYTES = 16
+
+def hash_password(password, n=PASSWORD_SCRYPT_N, r=PASSWORD_SCRYPT_R, p=PASSWORD_SCRYPT_P):
+    """Salted scrypt hash stored as scrypt$n$r$p$salt$digest (base64 fields)"""
+    salt = os.urandom(PASSWORD_SALT_BYTES)
+    digest = hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p, maxmem=256 * n * r)
+    return f"scrypt${n}${r}${p}${base64.b64encode(salt).decode()}${base64.b64encode(digest).decode()}"
+
+def check_password(stored, password):
+    """(matches, needs_rehash) for a stored hash, accepting legacy unsalted SHA-256 hex"""
+    if not stored.startswith("scrypt$"):
+        legacy = hashlib.sha256(password.encode()).hexdigest()
+        return hmac.compare_digest(stored, legacy), True
+    try:
+        _, n, r, p, salt, digest = stored.split("$")
+        n, r, p = int(n), int(r), int(p)
+        candidate = hashlib.scrypt(password.encode(), salt=base64.b64decode(salt, validate=True), n=n, r=r, p=p,
+                                   maxmem=256 * n * r)
+        expected = base64.b64decode(digest, validate=True)
+    except ValueError:
+        # Truncated or corrupted hash (binascii.Error is a ValueError): a failed login, not a crash
+        return False, False
+    # Only a cheaper hash is upgraded; one stored at a higher cost is never weakened
+    outdated = n < PASSWORD_SCRYPT_N or r < PASSWORD_SCRYPT_R or p < PASSWORD_SCRYPT_P
+    return hmac.compare_digest(candidate, expected), outdated
+
+@st.cache_resource
+def get_dummy_password_hash():
+    """Hash checked for unknown usernames so they cost the same as a wrong password"""
+    return hash_password(os.urandom(16).hex())
+
 def create_user(username, password, role='user'):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    hashed = hashlib.sha256(password.encode()).hexdigest()
+    hashed = hash_password(password)
     try:
-        cursor.execute('INSERT INTO users VALUES (?, ?, ?)', (username, hashed, role))
-        conn.commit()
+        with get_db() as conn:
+            conn.execute('INSERT INTO users VALUES (?, ?, ?)', (username, hashed, role))
+            log_change(conn, "INSERT", "users", username)
+        invalidate_tables("change_log")
         return True
     except sqlite3.IntegrityError:
         return False  # User already exists
-    finally:
-        conn.close()
 
 def verify_user(username, password):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    hashed = hashlib.sha256(password.encode()).hexdigest()
-    cursor.execute('SELECT * FROM users WHERE username=? AND password=?', (username, hashed))
-    result = cursor.fetchone()
-    conn.close()
-    return result if result else None
-
-def get_user_role(username):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute('SELECT role FROM users WHERE username=?', (username,))
-    result = cursor.fetchone()
-    conn.close()
-    return result[0] if result else None
+    """Role of the user if the password matches, else None.
+
+    Legacy SHA-256 hashes and hashes made with lower scrypt costs are
+    replaced with a current hash on the first successful login.
+    """
+    with get_db() as conn:
+        row = conn.execute('SELECT password, role FROM users WHERE username=?', (username,)).fetchone()
+    if row is None:
+        check_password(get_dummy_password_hash(), password)
+        return None
+    stored, role = row
+    matches, needs_rehash = check_password(stored, password)
+    if not matches:
+        return None
+    if needs_rehash:
+        with get_db() as conn:
+            # Only replace the hash we verified, in case it changed meanwhile
+            conn.execute('UPDATE users SET password=? WHERE username=? AND password=?',
+                         (hash_password(password), username, stored))
+    return role
+
+@cached_query("change_log")
+def get_change_log_users():
+    with get_db() as conn:
+        return [row[0] for row in conn.execute("SELECT DISTINCT username FROM change_log ORDER BY username")]
+
+def _date_range_conditions(start_date, end_date):
+    """change_time bounds for an inclusive date range; either end may be None"""
+    conditions = []
+    if start_date:
+        conditions.append(("change_time >= ?", (start_date.strftime('%Y-%m-%d'),)))
+    if end_date:
+        conditions.append(("change_time < ?", ((end_date + timedelta(days=1)).strftime('%Y-%m-%d'),)))
+    return conditions
 
 def view_change_log():
     st.title("Change Log")
+    col1, col2 = st.columns(2)
+    start_date = col1.date_input("From", value=None, key="change_log_from")
+    end_date = col2.date_input("To", value=None, key="change_log_to")
     try:
-        conn = sqlite3.connect(DB_PATH)
-        log = pd.read_sql("SELECT * FROM change_log ORDER BY change_time DESC", conn)
-        conn.close()
-        
-        if not log.empty:
-            st.dataframe(log)
-        else:
-            st.info("No changes logged yet")
+        paginated_grid(
+            "change_log", "change_log",
+            columns=["change_time", "username", "change_type", "table_name", "record_id"],
+            key_column="id",
+            sort_columns=("change_time", "username", "table_name"),
+            filters={"username": get_change_log_users(), "table_name": AUDITED_TABLES, "change_type": CHANGE_TYPES},
+            descending=True,
+            empty_message="No changes logged in this period",
+            conditions=_date_range_conditions(start_date, end_date),
+        )
     except Exception as e:
         st.error(f"Database error: {str(e)}")
 
-# New function to log changes
-def log_change(change_type, table_name, record_id):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute('''
+    with st.expander("Archived Entries", expanded=False):
+        st.caption(f"Entries older than {CHANGE_LOG_RETENTION_DAYS} days are moved daily into monthly "
+                   f"gzip NDJSON files under `{change_log_archive_dir()}`.")
+        with st.form("change_log_archive_search"):
+            col1, col2 = st.columns(2)
+            archive_from = col1.date_input("From", value=date.today() - timedelta(days=365))
+            archive_to = col2.date_input("To", value=date.today())
+            col1, col2 = st.columns(2)
+            username = col1.text_input("Username (exact, optional)").strip()
+            table_name = col2.selectbox("Table", ("All", *AUDITED_TABLES))
+            searched = st.form_submit_button("Search Archive")
+        if searched:
+            try:
+                results = search_change_log_archive(archive_from, archive_to, username or None,
+                                                    None if table_name == "All" else table_name)
+                if results.empty:
+                    st.info("No archived entries match")
+                else:
+                    st.dataframe(results, hide_index=True)
+                    st.download_button("Download Results", results.to_csv(index=False),
+                                       file_name=f"change_log_{archive_from}_{archive_to}.csv", mime="text/csv")
+            except Exception as e:
+                st.error(f"Error: {str(e)}")
+        if st.button("Archive Now"):
+            try:
+                st.success(f"Archived {archive_change_log()} entries")
+            except Exception as e:
+                st.error(f"Error: {str(e)}")
+
+# Performance metrics
+METRICS_FLUSH_INTERVAL = 60  # seconds between ring buffer flushes
+METRICS_RETENTION_DAYS = 14
+PERF_WINDOWS = {"Last hour": timedelta(hours=1), "Last 24 hours": timedelta(days=1), "Last 7 days": timedelta(days=7)}
+PERF_SLOWEST_LIMIT = 20
+
+PERF_METRICS_SQL = '''
+    SELECT recorded_at, kind, name, page, duration_ms, row_count, queries, rerun
+    FROM perf_metric
+    WHERE recorded_at >= ?
+'''
+
+@contextmanager
+def timed_page(name):
+    """Record a page run's duration, statements and rows, tagging the SQL it runs with the page name.
+
+    The rerun number counts script and fragment runs per session, so pages
+    that trigger extra st.rerun() calls or frequent fragment ticks stand out.
+    """
+    recorder = get_metrics_recorder()
+    context = recorder.context
+    if getattr(context, 'page', None) is not None:
+        # Nested, e.g. a fragment during a full run: it counts toward the outer page
+        yield
+        return
+    rerun = st.session_state.get("perf_reruns", 0) + 1
+    st.session_state.perf_reruns = rerun
+    context.page, context.queries, context.rows = name, 0, 0
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        context.page = None
+        recorder.record('page', name, name, time.perf_counter() - started, context.rows, context.queries, rerun)
+
+def flush_metrics():
+    """Move settled ring buffer entries into perf_metric and drop rows past retention; returns rows written"""
+    recorder = get_metrics_recorder()
+    entries = recorder.drain()
+    rows = [(datetime.fromtimestamp(entry[0]).strftime('%Y-%m-%d %H:%M:%S'), *entry[1:]) for entry in entries]
+    cutoff = (datetime.now() - timedelta(days=METRICS_RETENTION_DAYS)).strftime('%Y-%m-%d %H:%M:%S')
+    # The flush's own statements would otherwise refill the buffer it empties
+    recorder.context.paused = True
+    try:
+        with get_db() as conn:
+            conn.executemany('''
+                INSERT INTO perf_metric (recorded_at, kind, name, page, duration_ms, row_count, queries, rerun)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', rows)
+            conn.execute("DELETE FROM perf_metric WHERE recorded_at < ?", (cutoff,))
+    finally:
+        recorder.context.paused = False
+    return len(rows)
+
+def summarize_latencies(metrics, by):
+    """Runs and p50/p95/max duration per `by` group, slowest p95 first"""
+    durations = metrics.groupby(by)['duration_ms']
+    summary = pd.DataFrame({
+        'runs': durations.size(),
+        'p50_ms': durations.quantile(0.5),
+        'p95_ms': durations.quantile(0.95),
+        'max_ms': durations.max(),
+        'total_ms': durations.sum(),
+        'avg_rows': metrics.groupby(by)['row_count'].mean(),
+    })
+    return summary.sort_values('p95_ms', ascending=False).round(1).reset_index()
+
+def view_performance():
+    st.title("Performance")
+
+    if st.session_state.get("role") != "admin":
+        st.warning("Only administrators can access this page")
+        return
+
+    window = st.selectbox("Window", tuple(PERF_WINDOWS), key="perf_window")
+    st.caption(f"Page and SQL timings are buffered in memory and written every {METRICS_FLUSH_INTERVAL} seconds; "
+               f"opening this page writes them immediately. History is kept for {METRICS_RETENTION_DAYS} days.")
+    try:
+        flush_metrics()
+        since = (datetime.now() - PERF_WINDOWS[window]).strftime('%Y-%m-%d %H:%M:%S')
+        with get_db() as conn:
+            metrics = pd.read_sql(PERF_METRICS_SQL, conn, params=(since,))
+    except Exception as e:
+        st.error(f"Database error: {str(e)}")
+        return
+
+    if metrics.empty:
+        st.info("No timings recorded in this window")
+        return
+
+    pages = metrics[metrics['kind'] == 'page']
+    queries = metrics[metrics['kind'] == 'sql'].assign(page=lambda df: df['page'].fillna("(background)"))
+
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Page Runs", len(pages))
+    col2.metric("Page p95 (ms)", f"{pages['duration_ms'].quantile(0.95):.0f}" if not pages.empty else "-")
+    col3.metric("Statements", len(queries))
+    col4.metric("Statement p95 (ms)", f"{queries['duration_ms'].quantile(0.95):.1f}" if not queries.empty else "-")
+
+    st.subheader("Pages")
+    if pages.empty:
+        st.info("No page runs recorded in this window")
+    else:
+        page_summary = summarize_latencies(pages, 'name').merge(
+            pages.groupby('name').agg(avg_queries=('queries', 'mean'), max_rerun=('rerun', 'max')).round(1).reset_index(),
+            on='name')
+        st.dataframe(page_summary.rename(columns={'name': 'page'}), hide_index=True)
+
+    st.subheader("Statements")
+    if queries.empty:
+        st.info("No statements recorded in this window")
+    else:
+        page_filter = st.selectbox("Issued by", ("All", *sorted(queries['page'].unique())), key="perf_page")
+        if page_filter != "All":
+            queries = queries[queries['page'] == page_filter]
+        st.dataframe(summarize_latencies(queries, 'name').head(PERF_SLOWEST_LIMIT).rename(columns={'name': 'statement'}),
+                     hide_index=True)
+
+        st.subheader("Slowest Statements")
+        slowest = queries.nlargest(PERF_SLOWEST_LIMIT, 'duration_ms')
+        st.dataframe(slowest[['recorded_at', 'page', 'duration_ms', 'row_count', 'name']]
+                     .round({'duration_ms': 1}).rename(columns={'name': 'statement'}), hide_index=True)
+
+# Audit trail
+AUDITED_TABLES = ('vehicle', 'driver', 'assignment', 'compliance', 'maintenance', 'odometer_reading',
+                  'fuel_fill', 'geofence', 'users')
+CHANGE_TYPES = ('INSERT', 'UPDATE', 'DELETE')
+
+def current_username():
+    """Signed-in user for audit rows; 'system' for scripts and benchmarks without a login"""
+    return st.session_state.get("username") or "system"
+
+def log_changes(conn, change_type, table_name, record_ids, username=None):
+    """Audit rows written on the caller's connection, committing or rolling back with the change.
+
+    Callers invalidate "change_log" together with the changed table.
+    """
+    username = username or current_username()
+    changed_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    conn.executemany('''
         INSERT INTO change_log (username, change_type, table_name, record_id, change_time)
         VALUES (?, ?, ?, ?, ?)
-    ''', (
-        st.session_state.username,
-        change_type,
-        table_name,
-        str(record_id),
-        datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-    ))
-    conn.commit()
-    conn.close()
+    ''', [(username, change_type, table_name, str(record_id), changed_at) for record_id in record_ids])
+
+def log_change(conn, change_type, table_name, record_id, username=None):
+    log_changes(conn, change_type, table_name, [record_id], username)
+
+# Change log retention
+CHANGE_LOG_RETENTION_DAYS = 180
+CHANGE_LOG_ARCHIVE_INTERVAL = 24 * 3600  # seconds between retention runs
+CHANGE_LOG_COLUMNS = ('id', 'username', 'change_type', 'table_name', 'record_id', 'change_time')
+CHANGE_LOG_ARCHIVE_CHUNK_ROWS = 10000
+
+def change_log_archive_dir():
+    """Monthly YYYY-MM.ndjson.gz archives, kept next to the database file"""
+    return os.path.join(os.path.dirname(os.path.abspath(DB_PATH)), "change_log_archive")
+
+def _month_start(day):
+    return day.replace(day=1)
+
+def _next_month(day):
+    return (day.replace(day=1) + timedelta(days=32)).replace(day=1)
+
+def archive_change_log(retention_days=CHANGE_LOG_RETENTION_DAYS):
+    """Move entries older than the retention window into monthly archives; returns rows moved.
+
+    Each month is appended to its file as a new gzip member and fsynced
+    before the rows are deleted, all inside one transaction. A crash can
+    leave rows both archived and live (searches drop duplicate ids) but
+    never loses them.
+    """
+    cutoff = date.today() - timedelta(days=retention_days)
+    directory = change_log_archive_dir()
+    archived = 0
+    with get_db() as conn:
+        oldest = conn.execute("SELECT MIN(change_time) FROM change_log").fetchone()[0]
+        if not oldest or oldest >= cutoff.strftime('%Y-%m-%d'):
+            return 0
+        os.makedirs(directory, exist_ok=True)
+        month = _month_start(datetime.strptime(oldest[:10], '%Y-%m-%d').date())
+        while month < cutoff:
+            bounds = (month.strftime('%Y-%m-%d'), min(_next_month(month), cutoff).strftime('%Y-%m-%d'))
+            cursor = conn.execute(
+                f"SELECT {', '.join(CHANGE_LOG_COLUMNS)} FROM change_log "
+                "WHERE change_time >= ? AND change_time < ? ORDER BY change_time, id", bounds)
+            rows = cursor.fetchmany(CHANGE_LOG_ARCHIVE_CHUNK_ROWS)
+            if rows:
+                with open(os.path.join(directory, f"{month:%Y-%m}.ndjson.gz"), "ab") as raw:
+                    with gzip.GzipFile(fileobj=raw, mode="wb") as archive:
+                        while rows:
+                            archive.write("".join(
+                                json.dumps(dict(zip(CHANGE_LOG_COLUMNS, row))) + "\n" for row in rows
+                            ).encode("utf-8"))
+                            archived += len(rows)
+                            rows = cursor.fetchmany(CHANGE_LOG_ARCHIVE_CHUNK_ROWS)
+                    raw.flush()
+                    os.fsync(raw.fileno())
+                conn.execute("DELETE FROM change_log WHERE change_time >= ? AND change_time < ?", bounds)
+            month = _next_month(month)
+    if archived:
+        invalidate_tables("change_log")
+    return archived
+
+@cached_query("change_log")
+def search_change_log_archive(start_date, end_date, username=None, table_name=None):
+    """Archived entries in [start_date, end_date], newest first; reads only the overlapping months"""
+    start, end = start_date.strftime('%Y-%m-%d'), (end_date + timedelta(days=1)).strftime('%Y-%m-%d')
+    frames = []
+    for path in sorted(glob.glob(os.path.join(change_log_archive_dir(), "*.ndjson.gz"))):
+        month = os.path.basename(path)[:7]
+        if not (start[:7] <= month <= end_date.strftime('%Y-%m')):
+            continue
+        for chunk in pd.read_json(path, lines=True, dtype=False, chunksize=CHANGE_LOG_ARCHIVE_CHUNK_ROWS):
+            chunk = chunk.astype({'change_time': str, 'username': str, 'table_name': str})
+            mask = (chunk['change_time'] >= start) & (chunk['change_time'] < end)
+            if username:
+                mask &= chunk['username'] == username
+            if table_name:
+                mask &= chunk['table_name'] == table_name
+            frames.append(chunk[mask])
+    if not frames:
+        return pd.DataFrame(columns=list(CHANGE_LOG_COLUMNS))
+    results = pd.concat(frames, ignore_index=True).drop_duplicates('id')
+    return results.sort_values(['change_time', 'id'], ascending=False)[list(CHANGE_LOG_COLUMNS)]
+
+# Bulk import
+IMPORT_CHUNK_ROWS = 5000
+
+# Per table: insert columns, required columns, enum columns, numeric and date
+# columns, columns unique across the table, and columns that must exist elsewhere
+IMPORT_SPECS = {
+    "vehicle": {
+        "columns": ('plate_number', 'chasis', 'vehicle_type', 'make', 'model', 'year', 'fuel_type',
+                    'fuel_capacity', 'fuel_consumption', 'loading_capacity', 'assigned_for'),
+        "required": ('plate_number', 'chasis', 'vehicle_type', 'fuel_type', 'assigned_for'),
+        "choices": {'vehicle_type': VEHICLE_TYPES, 'fuel_type': FUEL_TYPES, 'assigned_for': ASSIGNMENT_TYPES},
+        "numeric": ('fuel_capacity', 'fuel_consumption'),
+        "dates": (),
+        "unique": ('plate_number', 'chasis'),
+        "references": {},
+        "record_id": 'plate_number',
+    },
+    "driver": {
+        "columns": ('name', 'id_number', 'phone', 'reporting_to'),
+        "required": ('name', 'id_number', 'reporting_to'),
+        "choices": {'reporting_to': ASSIGNMENT_TYPES},
+        "numeric": (),
+        "dates": (),
+        "unique": ('id_number',),
+        "references": {},
+        "record_id": None,  # new AUTOINCREMENT ids
+    },
+    "maintenance": {
+        "columns": ('plate_number', 'last_service_km', 'last_service_date', 'next_service_km',
+                    'next_service_date', 'maintenance_center'),
+        "required": ('plate_number', 'last_service_date', 'next_service_date', 'maintenance_center'),
+        "choices": {'maintenance_center': MAINTENANCE_CENTERS},
+        "numeric": ('last_service_km', 'next_service_km'),
+        "dates": ('last_service_date', 'next_service_date'),
+        "unique": (),
+        "references": {'plate_number': ('vehicle', 'plate_number')},
+        "record_id": None,
+    },
+    "odometer_reading": {
+        "columns": ('plate_number', 'reading_date', 'km'),
+        "required": ('plate_number', 'reading_date', 'km'),
+        "choices": {},
+        "numeric": ('km',),
+        "dates": ('reading_date',),
+        "unique": (),
+        "references": {'plate_number': ('vehicle', 'plate_number')},
+        "record_id": None,
+    },
+    "fuel_fill": {
+        "columns": ('plate_number', 'fill_date', 'liters', 'odometer_km', 'cost', 'station'),
+        "required": ('plate_number', 'fill_date', 'liters', 'odometer_km'),
+        "choices": {},
+        "numeric": ('liters', 'odometer_km', 'cost'),
+        "dates": ('fill_date',),
+        "unique": (),
+        "references": {'plate_number': ('vehicle', 'plate_number')},
+        "record_id": None,
+    },
+}
+
+def read_import_chunks(file, file_format="csv", chunk_rows=IMPORT_CHUNK_ROWS):
+    """Yield DataFrames of at most chunk_rows rows from a CSV or XLSX file"""
+    if file_format == "xlsx":
+        from openpyxl import load_workbook  # only needed for Excel imports
+
+        workbook = load_workbook(file, read_only=True, data_only=True)
+        try:
+            rows = workbook.active.iter_rows(values_only=True)
+            header = ["" if cell is None else str(cell) for cell in next(rows, ())]
+            while True:
+                batch = list(itertools.islice(rows, chunk_rows))
+                if not batch:
+                    break
+                yield pd.DataFrame(batch, columns=header)
+        finally:
+            workbook.close()
+    else:
+        yield from pd.read_csv(file, chunksize=chunk_rows, dtype=str, keep_default_na=False)
+
+def _existing_values(conn, table, column, values):
+    """Subset of `values` already present in table.column, looked up through its index"""
+    return {row[0] for row in conn.execute(
+        f"SELECT {column} FROM {table} WHERE {column} IN (SELECT value FROM json_each(?))",
+        (json.dumps(values.dropna().unique().tolist()),)
+    )}
+
+def _validate_import(conn, chunk, spec, taken):
+    """Vectorised checks for one chunk; returns (insertable rows, per-row errors)
+
+    `taken` maps each unique column to the values accepted from earlier chunks.
+    """
+    chunk.columns = [str(column).strip().lower().replace(" ", "_") for column in chunk.columns]
+    text = chunk.reindex(columns=spec['columns']).astype('string')
+    text = text.apply(lambda values: values.str.strip()).replace("", pd.NA)
+    rows = text.astype(object)
+    errors = pd.Series("", index=text.index)
+
+    def reject(mask, message):
+        errors[mask] = errors[mask] + message + "; "
+
+    for column in spec['required']:
+        reject(text[column].isna(), f"{column} is required")
+    for column, choices in spec['choices'].items():
+        canonical = text[column].str.lower().map({choice.lower(): choice for choice in choices})
+        reject(text[column].notna() & canonical.isna(), f"{column} is not one of the allowed values")
+        rows[column] = canonical.astype(object)
+    for column in spec['numeric']:
+        numbers = pd.to_numeric(text[column], errors='coerce')
+        reject(text[column].notna() & (numbers.isna() | numbers.lt(0).fillna(False)),
+               f"{column} must be a non-negative number")
+        rows[column] = numbers.astype(object)
+    for column in spec['dates']:
+        dates = pd.to_datetime(text[column], errors='coerce', format='mixed')
+        reject(text[column].notna() & dates.isna(), f"{column} is not a valid date")
+        rows[column] = dates.dt.strftime('%Y-%m-%d').astype(object)
+    for column in spec['unique']:
+        reject(text[column].duplicated() & text[column].notna(), f"duplicate {column} in file")
+        existing = _existing_values(conn, spec['table'], column, text[column]) | taken[column]
+        reject(rows[column].isin(existing), f"{column} already exists")
+    for column, (table, target) in spec['references'].items():
+        known = _existing_values(conn, table, target, text[column])
+        reject(text[column].notna() & ~rows[column].isin(known), f"unknown {column}")
+
+    invalid = errors != ""
+    report = pd.DataFrame({'row': errors.index[invalid] + 2, 'error': errors[invalid].str.rstrip("; ")})
+    return rows[~invalid].where(rows[~invalid].notna(), None), report
+
+def import_records(table, file, file_format="csv", username=None, chunk_rows=IMPORT_CHUNK_ROWS):
+    """Stream a CSV/XLSX file into `table`, returning (inserted, per-row error report).
+
+    Each chunk is validated and loaded with executemany in one transaction
+    together with its change_log entries; invalid rows are skipped and
+    reported by file line number (header = line 1).
+    """
+    spec = dict(IMPORT_SPECS[table], table=table)
+    columns = ", ".join(spec['columns'])
+    placeholders = ", ".join("?" * len(spec['columns']))
+    taken = {column: set() for column in spec['unique']}
+    inserted, reports, offset = 0, [], 0
+
+    for chunk in read_import_chunks(file, file_format, chunk_rows):
+        chunk.index = pd.RangeIndex(offset, offset + len(chunk))
+        offset += len(chunk)
+        with get_db() as conn:
+            rows, report = _validate_import(conn, chunk, spec, taken)
+            reports.append(report)
+            if rows.empty:
+                continue
+            conn.executemany(f"INSERT INTO {table} ({columns}) VALUES ({placeholders})",
+                             rows.itertuples(index=False, name=None))
+            if spec['record_id']:
+                record_ids = rows[spec['record_id']]
+            else:
+                # executemany under the write lock hands out consecutive AUTOINCREMENT ids
+                last_id = conn.execute("SELECT last_insert_rowid()").fetchone()[0]
+                record_ids = range(last_id - len(rows) + 1, last_id + 1)
+            log_changes(conn, "INSERT", table, record_ids, username)
+        for column in taken:
+            taken[column].update(rows[column])
+        inserted += len(rows)
+
+    invalidate_tables(table, "change_log")
+    return inserted, pd.concat(reports, ignore_index=True) if reports else pd.DataFrame(columns=['row', 'error'])
+
+def bulk_import(table, label="Bulk Import"):
+    """Upload widget for import_records; the last result stays visible across reruns"""
+    spec = IMPORT_SPECS[table]
+    result_key = f"{table}_import_result"
+    with st.expander(label, expanded=False):
+        st.caption(f"CSV or XLSX with a header row. Columns: {', '.join(spec['columns'])} "
+                   f"(required: {', '.join(spec['required'])})")
+        upload = st.file_uploader("Import file", type=["csv", "xlsx"], key=f"{table}_import_file")
+        if upload is not None and st.button("Import", key=f"{table}_import"):
+            try:
+                file_format = "xlsx" if upload.name.lower().endswith(".xlsx") else "csv"
+                st.session_state[result_key] = import_records(table, upload, file_format)
+            except Exception as e:
+                st.error(f"Error: {str(e)}")
+
+        if result_key in st.session_state:
+            inserted, report = st.session_state[result_key]
+            st.success(f"Imported {inserted} rows")
+            if not report.empty:
+                st.warning(f"{len(report)} rows rejected")
+                st.dataframe(report, hide_index=True)
+                st.download_button("Download Error Report", report.to_csv(index=False),
+                                   file_name=f"{table}_import_errors.csv", mime="text/csv",
+                                   key=f"{table}_import_errors")
+
+# Reference lists shared by the vehicle and driver pickers
+@cached_query("vehicle", resource=True)
+def get_plate_numbers():
+    """Sorted plate numbers; shared read-only across sessions"""
+    with get_db() as conn:
+        return [row[0] for row in conn.execute("SELECT plate_number FROM vehicle ORDER BY plate_number")]
+
+@cached_query("driver", resource=True)
+def get_driver_names():
+    """Driver id -> name in id order, so option labels are O(1) dict lookups"""
+    with get_db() as conn:
+        return dict(conn.execute("SELECT id, name FROM driver ORDER BY id").fetchall())
+
+# Maintenance forecasting
+FORECAST_WINDOW_DAYS = 90  # odometer history behind each daily km estimate
+MAINTENANCE_DUE_DAYS = 7
+MAINTENANCE_DUE_LIMIT = 10
+
+# Latest service record per vehicle: one idx_maintenance_plate seek per
+# vehicle instead of grouping the whole maintenance history
+LATEST_SERVICE_SQL = '''
+    SELECT m.plate_number, v.make, v.model, m.next_service_km, m.next_service_date,
+           m.maintenance_center, m.last_service_date
+    FROM vehicle v
+    JOIN maintenance m ON m.id = (
+        SELECT id FROM maintenance
+        WHERE plate_number = v.plate_number
+        ORDER BY last_service_date DESC, id DESC
+        LIMIT 1
+    )
+'''
+
+# Least-squares sums per vehicle, x = days relative to today; SQLite does the
+# aggregation so only one row per vehicle reaches pandas. Driving from vehicle
+# turns the date filter into one (plate_number, reading_date) range seek per
+# vehicle on the covering index, so only the window is read, already grouped.
+ODOMETER_TRENDS_SQL = '''
+    SELECT v.plate_number, COUNT(*) AS n, SUM(x) AS sx, SUM(o.km) AS sy, SUM(x * x) AS sxx,
+           SUM(x * o.km) AS sxy, MAX(o.km) AS latest_km, MAX(x) AS latest_x
+    FROM vehicle v
+    JOIN (
+        SELECT plate_number, julianday(reading_date) - julianday(?) AS x, km
+        FROM odometer_reading
+        WHERE reading_date >= date(?, ?)
+    ) o ON o.plate_number = v.plate_number
+    GROUP BY v.plate_number
+'''
+
+def forecast_service_dates(conn, today=None):
+    """Estimated km/day and service due date for every vehicle with a service record.
+
+    The rate is the slope of a least-squares line through the last
+    FORECAST_WINDOW_DAYS of odometer readings; the vehicle is due on the
+    earlier of the day it reaches next_service_km and next_service_date.
+    """
+    today = pd.Timestamp(today or date.today())
+    services = pd.read_sql(LATEST_SERVICE_SQL, conn)
+    trends = pd.read_sql(ODOMETER_TRENDS_SQL, conn, params=(
+        today.strftime('%Y-%m-%d'), today.strftime('%Y-%m-%d'), f"-{FORECAST_WINDOW_DAYS} days"))
+    forecast = services.merge(trends, on='plate_number', how='left')
+
+    n, sx, sy, sxx, sxy, latest_km, latest_x, target_km = (
+        forecast[column].to_numpy(dtype=float)
+        for column in ('n', 'sx', 'sy', 'sxx', 'sxy', 'latest_km', 'latest_x', 'next_service_km'))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        spread = n * sxx - sx * sx
+        daily_km = np.where(spread > 0, (n * sxy - sx * sy) / spread, np.nan)
+        daily_km = np.where(daily_km > 0, daily_km, np.nan)
+        remaining = target_km - latest_km
+        days_left = np.where(remaining <= 0, 0.0, remaining / daily_km)
+    # A next_service_km of 0 means the record has no km target
+    days_left = np.where(target_km > 0, days_left, np.nan)
+
+    km_due = today + pd.to_timedelta(np.ceil(latest_x + days_left), unit='D')
+    date_due = pd.to_datetime(forecast['next_service_date'], errors='coerce')
+    forecast['daily_km'] = daily_km.round(1)
+    forecast['km_due_date'] = km_due
+    forecast['due_date'] = np.fmin(km_due.to_numpy(), date_due.to_numpy())
+    forecast['due_by'] = np.where(km_due.to_numpy() < date_due.to_numpy(), "km", "date")
+    forecast.loc[date_due.isna() & km_due.notna(), 'due_by'] = "km"
+    return forecast[['plate_number', 'make', 'model', 'maintenance_center', 'latest_km', 'next_service_km',
+                     'daily_km', 'km_due_date', 'next_service_date', 'due_date', 'due_by']]
+
+@cached_query("maintenance", "vehicle", "odometer_reading")
+def get_service_forecast():
+    with get_db() as conn:
+        return forecast_service_dates(conn)
 
 # Dashboard functions
-def get_dashboard_counts():
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
+# Histogram of assignment end days (migration 7) instead of counting assignment rows
+ACTIVE_ASSIGNMENT_COUNT_SQL = "SELECT COALESCE(SUM(assignment_count), 0) FROM summary_assignments_by_end WHERE active_until >= date('now')"
 
-    cursor.execute("SELECT COUNT(*) FROM vehicle")
-    vehicle_count = cursor.fetchone()[0]
+# Read from compliance_alert, which the background scan keeps current
+COMPLIANCE_ISSUES_SQL = '''
+    SELECT a.plate_number, v.make, v.model, a.alert_type, a.bucket, a.due_date
+    FROM compliance_alert a
+    JOIN vehicle v ON a.plate_number = v.plate_number
+    WHERE a.bucket IN ('Missing', 'Overdue')
+    ORDER BY a.due_date
+    LIMIT 10
+'''
 
-    cursor.execute("SELECT COUNT(*) FROM driver")
-    driver_count = cursor.fetchone()[0]
+COMPLIANCE_ALERT_COUNTS_SQL = "SELECT bucket, alert_type, COUNT(*) AS alerts FROM compliance_alert GROUP BY 1, 2"
 
-    cursor.execute("SELECT COUNT(*) FROM assignment WHERE end_date IS NULL OR end_date >= date('now')")
-    assignment_count = cursor.fetchone()[0]
+@cached_query("vehicle", "driver", "assignment")
+def get_dashboard_metrics():
+    with get_db() as conn:
+        cursor = conn.cursor()
 
-    cursor.execute('''
-        SELECT v.plate_number, v.make, v.model, m.next_service_date, m.maintenance_center
-        FROM maintenance m
-        JOIN vehicle v ON m.plate_number = v.plate_number
-        WHERE DATE(m.next_service_date) <= DATE('now', '+7 days')
-        ORDER BY DATE(m.next_service_date)
-        LIMIT 5
-    ''')
-    maintenance_due = cursor.fetchall()
+        cursor.execute("SELECT COUNT(*) FROM vehicle")
+        vehicle_count = cursor.fetchone()[0]
 
-    cursor.execute('''
-        SELECT v.plate_number, v.make, v.model,
-               CASE
-                   WHEN c.yearly_inspection = 'No' THEN 'Inspection Missing'
-                   WHEN DATE(c.inspection_date) < DATE('now', '-1 year') THEN 'Inspection Expired'
-                   WHEN DATE(c.insurance_date) < DATE('now', '-1 year') THEN 'Insurance Expired'
-                   ELSE 'Unknown Issue'
-               END AS issue_type
-        FROM compliance c
-        JOIN vehicle v ON c.plate_number = v.plate_number
-        WHERE c.yearly_inspection = 'No'
-            OR DATE(c.inspection_date) < DATE('now', '-1 year')
-            OR DATE(c.insurance_date) < DATE('now', '-1 year')
-        LIMIT 5
-    ''')
-    compliance_issues = cursor.fetchall()
+        cursor.execute("SELECT COUNT(*) FROM driver")
+        driver_count = cursor.fetchone()[0]
 
-    conn.close()
-    return vehicle_count, driver_count, assignment_count, maintenance_due, compliance_issues
+        cursor.execute(ACTIVE_ASSIGNMENT_COUNT_SQL)
+        assignment_count = cursor.fetchone()[0]
+
+    return vehicle_count, driver_count, assignment_count
+
+def get_upcoming_maintenance():
+    """Vehicles forecast to need service within MAINTENANCE_DUE_DAYS, soonest first"""
+    forecast = get_service_forecast()
+    due = forecast[forecast['due_date'] <= pd.Timestamp(date.today() + timedelta(days=MAINTENANCE_DUE_DAYS))]
+    return due.sort_values('due_date')
+
+@cached_query("compliance_alert", "vehicle")
+def get_compliance_issues():
+    """(most urgent issues, alert counts per bucket and type)"""
+    with get_db() as conn:
+        return conn.execute(COMPLIANCE_ISSUES_SQL).fetchall(), pd.read_sql(COMPLIANCE_ALERT_COUNTS_SQL, conn)
+
+def get_dashboard_counts():
+    return (*get_dashboard_metrics(), get_upcoming_maintenance(), get_compliance_issues())
 
 def show_dashboard():
     try:
@@ -250,42 +1674,60 @@ def show_dashboard():
     st.divider()
     
     # Maintenance Due
-    st.subheader("Upcoming Maintenance (Next 7 Days)")
-    if counts[3]:
-        df_maintenance = pd.DataFrame(counts[3], columns=["Plate", "Make", "Model", "Next Service", "Center"])
-        st.dataframe(df_maintenance)
+    st.subheader(f"Upcoming Maintenance (Next {MAINTENANCE_DUE_DAYS} Days)")
+    if not counts[3].empty:
+        df_maintenance = counts[3].head(MAINTENANCE_DUE_LIMIT).rename(columns={
+            'plate_number': "Plate", 'make': "Make", 'model': "Model", 'due_date': "Due",
+            'due_by': "Due By", 'daily_km': "Km/Day", 'maintenance_center': "Center",
+        })[["Plate", "Make", "Model", "Due", "Due By", "Km/Day", "Center"]]
+        st.dataframe(df_maintenance, column_config={"Due": st.column_config.DateColumn()})
+        if len(counts[3]) > MAINTENANCE_DUE_LIMIT:
+            st.caption(f"{len(counts[3])} vehicles due; showing the {MAINTENANCE_DUE_LIMIT} soonest")
         
         # Visualization
         if len(df_maintenance) > 0:
-            fig, ax = plt.subplots()
-            sns.countplot(data=df_maintenance, x='Center', ax=ax)
-            plt.title('Maintenance Centers')
-            st.pyplot(fig)
+            render_chart("dashboard_maintenance_centers", counts[3][['maintenance_center']].rename(
+                             columns={'maintenance_center': 'Center'}),
+                         lambda ax, df: sns.countplot(data=df, x='Center', ax=ax),
+                         title='Maintenance Centers')
     else:
-        st.info("No maintenance due in next 7 days")
+        st.info(f"No maintenance due in next {MAINTENANCE_DUE_DAYS} days")
     
     st.divider()
     
     # Compliance Issues
     st.subheader("Compliance Issues")
-    if counts[4]:
-        df_compliance = pd.DataFrame(counts[4], columns=["Plate", "Make", "Model", "Issue"])
+    issues, alert_counts = counts[4]
+    by_bucket = alert_counts.groupby('bucket')['alerts'].sum()
+    for column, bucket in zip(st.columns(len(COMPLIANCE_BUCKETS)), COMPLIANCE_BUCKETS):
+        column.metric(bucket, int(by_bucket.get(bucket, 0)))
+    if issues:
+        df_compliance = pd.DataFrame(issues, columns=["Plate", "Make", "Model", "Issue", "Status", "Due"])
         st.dataframe(df_compliance)
+        st.caption("The most urgent issues; Manage Compliance lists every alert")
         
         # Visualization
-        if len(df_compliance) > 0:
-            fig, ax = plt.subplots()
-            df_compliance['Issue'].value_counts().plot.pie(autopct='%1.1f%%', ax=ax)
-            plt.title('Compliance Issue Distribution')
-            st.pyplot(fig)
+        open_issues = alert_counts[alert_counts['bucket'].isin(("Missing", "Overdue"))]
+        render_chart("dashboard_compliance_issues", open_issues.groupby('alert_type')['alerts'].sum(),
+                     lambda ax, counts: counts.plot.pie(autopct='%1.1f%%', ax=ax),
+                     title='Compliance Issue Distribution')
     else:
         st.info("No compliance issues found")
 
 # Vehicle Management
+@cached_query("vehicle")
+def get_vehicle_distribution():
+    with get_db() as conn:
+        by_type = pd.read_sql("SELECT vehicle_type, COUNT(*) AS count FROM vehicle GROUP BY vehicle_type", conn)
+        by_assignment = pd.read_sql(
+            "SELECT assignment_type AS assigned_for, vehicle_count AS count FROM (" + VEHICLES_BY_ASSIGNMENT_SQL + ")", conn)
+    return by_type, by_assignment
+
 def manage_vehicles():
     st.title("Vehicle Management")
     
     # Add new vehicle
+    bulk_import("vehicle")
     with st.expander("Add New Vehicle", expanded=False):
         with st.form("vehicle_form", clear_on_submit=True):
             plate = st.text_input("Plate Number*").upper().strip()
@@ -297,7 +1739,7 @@ def manage_vehicles():
             model = st.text_input("Model")
             year = st.text_input("Year")
             fuel_capacity = st.number_input("Fuel Capacity", min_value=0.0, format="%.2f", value=0.0)
-            fuel_consumption = st.number_input("Fuel Consumption", min_value=0.0, format="%.2f", value=0.0)
+            fuel_consumption = st.number_input("Fuel Consumption (L/100 km)", min_value=0.0, format="%.2f", value=0.0)
             loading_capacity = st.text_input("Loading Capacity")
             assigned_for = st.selectbox("Assigned For", ASSIGNMENT_TYPES)
             
@@ -305,70 +1747,74 @@ def manage_vehicles():
             if submitted:
                 if plate and chasis:
                     try:
-                        conn = sqlite3.connect(DB_PATH)
-                        cursor = conn.cursor()
-                        cursor.execute('''
-                            INSERT INTO vehicle (
-                                plate_number, chasis, vehicle_type, make, model, year, 
+                        with get_db() as conn:
+                            cursor = conn.cursor()
+                            cursor.execute('''
+                                INSERT INTO vehicle (
+                                    plate_number, chasis, vehicle_type, make, model, year, 
+                                    fuel_type, fuel_capacity, fuel_consumption, 
+                                    loading_capacity, assigned_for
+                                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                            ''', (
+                                plate, chasis, vehicle_type, make, model, year, 
                                 fuel_type, fuel_capacity, fuel_consumption, 
                                 loading_capacity, assigned_for
-                            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                        ''', (
-                            plate, chasis, vehicle_type, make, model, year, 
-                            fuel_type, fuel_capacity, fuel_consumption, 
-                            loading_capacity, assigned_for
-                        ))
-                        conn.commit()
-                        log_change("INSERT", "vehicle", plate)
+                            ))
+                            log_change(conn, "INSERT", "vehicle", plate)
+                        invalidate_tables("vehicle", "change_log")
                         st.success("Vehicle added successfully!")
                     except sqlite3.IntegrityError:
                         st.error("Plate number or chasis already exists!")
                     except Exception as e:
                         st.error(f"Error: {str(e)}")
-                    finally:
-                        conn.close()
                 else:
                     st.error("Plate and Chasis are required fields")
 
     # View and edit vehicles
     st.subheader("Existing Vehicles")
     try:
-        conn = sqlite3.connect(DB_PATH)
-        vehicles = pd.read_sql("SELECT * FROM vehicle", conn)
-        conn.close()
+        vehicles = paginated_grid(
+            "vehicles", "vehicle",
+            columns=["plate_number", "chasis", "vehicle_type", "make", "model", "year", "fuel_type",
+                     "fuel_capacity", "fuel_consumption", "loading_capacity", "assigned_for"],
+            key_column="plate_number",
+            sort_columns=("plate_number", "vehicle_type", "make", "model", "year", "assigned_for"),
+            filters={"plate_number": None, "vehicle_type": VEHICLE_TYPES, "assigned_for": ASSIGNMENT_TYPES},
+            empty_message="No vehicles found in database",
+        )
         
         if not vehicles.empty:
-            # Add delete functionality
-            st.dataframe(vehicles)
+            by_type, by_assignment = get_vehicle_distribution()
             
             # Visualization
             st.subheader("Vehicle Distribution")
             col1, col2 = st.columns(2)
             with col1:
-                if not vehicles.empty and 'vehicle_type' in vehicles:
-                    fig, ax = plt.subplots()
-                    sns.countplot(data=vehicles, x='vehicle_type', ax=ax)
-                    plt.xticks(rotation=45)
-                    plt.title('By Vehicle Type')
-                    st.pyplot(fig)
+                if not by_type.empty:
+                    render_chart("vehicles_by_type", by_type,
+                                 lambda ax, df: sns.barplot(data=df, x='vehicle_type', y='count', ax=ax),
+                                 title='By Vehicle Type', rotation=45)
             
             with col2:
-                if not vehicles.empty and 'assigned_for' in vehicles:
-                    fig, ax = plt.subplots()
-                    sns.countplot(data=vehicles, x='assigned_for', ax=ax)
-                    plt.xticks(rotation=90)
-                    plt.title('By Assignment Type')
-                    st.pyplot(fig)
-        else:
-            st.info("No vehicles found in database")
+                if not by_assignment.empty:
+                    render_chart("vehicles_by_assignment", by_assignment,
+                                 lambda ax, df: sns.barplot(data=df, x='assigned_for', y='count', ax=ax),
+                                 title='By Assignment Type', rotation=90)
     except Exception as e:
         st.error(f"Database error: {str(e)}")
 
 # Driver Management
+@cached_query("driver")
+def get_driver_distribution():
+    with get_db() as conn:
+        counts = pd.read_sql(DRIVERS_BY_REPORTING_SQL, conn)
+    return counts.sort_values('driver_count', ascending=False)
+
 def manage_drivers():
     st.title("Driver Management")
     
     # Add new driver
+    bulk_import("driver")
     with st.expander("Add New Driver", expanded=False):
         with st.form("driver_form", clear_on_submit=True):
             name = st.text_input("Full Name*")
@@ -380,61 +1826,254 @@ def manage_drivers():
             if submitted:
                 if name and id_number:
                     try:
-                        conn = sqlite3.connect(DB_PATH)
-                        cursor = conn.cursor()
-                        cursor.execute('''
-                            INSERT INTO driver (name, id_number, phone, reporting_to)
-                            VALUES (?, ?, ?, ?)
-                        ''', (name, id_number, phone, reporting_to))
-                        conn.commit()
+                        with get_db() as conn:
+                            cursor = conn.cursor()
+                            cursor.execute('''
+                                INSERT INTO driver (name, id_number, phone, reporting_to)
+                                VALUES (?, ?, ?, ?)
+                            ''', (name, id_number, phone, reporting_to))
+                            log_change(conn, "INSERT", "driver", cursor.lastrowid)
+                        invalidate_tables("driver", "change_log")
                         st.success("Driver added successfully!")
                     except sqlite3.IntegrityError:
                         st.error("ID number already exists!")
                     except Exception as e:
                         st.error(f"Error: {str(e)}")
-                    finally:
-                        conn.close()
                 else:
                     st.error("Name and ID Number are required fields")
 
     # View and manage drivers
     st.subheader("Existing Drivers")
     try:
-        conn = sqlite3.connect(DB_PATH)
-        drivers = pd.read_sql("SELECT * FROM driver", conn)
-        conn.close()
+        drivers = paginated_grid(
+            "drivers", "driver",
+            columns=["id", "name", "id_number", "phone", "reporting_to"],
+            key_column="id",
+            sort_columns=("id", "name", "id_number", "reporting_to"),
+            filters={"name": None, "id_number": None, "reporting_to": ASSIGNMENT_TYPES},
+            empty_message="No drivers found in database",
+        )
         
         if not drivers.empty:
-            st.dataframe(drivers)
+            driver_counts = get_driver_distribution()
             
             # Visualization
             st.subheader("Driver Distribution")
-            if not drivers.empty and 'reporting_to' in drivers:
-                fig, ax = plt.subplots()
-                drivers['reporting_to'].value_counts().plot.bar(ax=ax)
-                plt.xticks(rotation=90)
-                plt.title('Drivers by Reporting To')
-                st.pyplot(fig)
-        else:
-            st.info("No drivers found in database")
+            if not driver_counts.empty:
+                render_chart("drivers_by_reporting", driver_counts,
+                             lambda ax, df: df.plot.bar(x='reporting_to', y='driver_count', legend=False, ax=ax),
+                             title='Drivers by Reporting To', rotation=90)
     except Exception as e:
         st.error(f"Database error: {str(e)}")
 
-# Assignment Management
+# Assignment Management
+ACTIVE_ASSIGNMENTS_SQL = f'''
+    SELECT a.id, v.plate_number, v.vehicle_type, d.name AS driver_name, 
+           a.work_place, a.start_date, a.end_date, a.geofence_violations,
+           a.gps_position, a.last_update
+    FROM assignment a
+    JOIN vehicle v ON a.plate_number = v.plate_number
+    JOIN driver d ON a.driver_id = d.id
+    WHERE {ACTIVE_ASSIGNMENT}
+'''
+
+# Double-booking detection. Rows past the newest id seen are new bookings;
+# updates and deletes of a booking's span are logged by trigger into
+# assignment_span_change (migration 15), naming the keys to rebuild.
+
+NEW_ASSIGNMENT_SPANS_SQL = f'''
+    SELECT id, plate_number, driver_id, start_date, COALESCE(end_date, '{OPEN_END_DATE}')
+    FROM assignment
+    WHERE id > ?
+'''
+ASSIGNMENT_SPAN_CHANGES_SQL = "SELECT id, plate_number, driver_id FROM assignment_span_change WHERE id > ? ORDER BY id"
+PLATE_SPANS_SQL = f'''
+    SELECT plate_number, start_date, COALESCE(end_date, '{OPEN_END_DATE}'), id
+    FROM assignment
+    WHERE plate_number IN (SELECT value FROM json_each(?))
+'''
+DRIVER_SPANS_SQL = f'''
+    SELECT driver_id, start_date, COALESCE(end_date, '{OPEN_END_DATE}'), id
+    FROM assignment
+    WHERE driver_id IN (SELECT value FROM json_each(?))
+'''
+ASSIGNMENT_SPAN_VERSION_SQL = "SELECT (SELECT MAX(id) FROM assignment), (SELECT MAX(id) FROM assignment_span_change)"
+
+# Authoritative overlap check, run inside the booking's write transaction
+BOOKING_CLASH_SQL = f'''
+    SELECT 'vehicle', id FROM assignment
+    WHERE plate_number = ? AND start_date <= ? AND COALESCE(end_date, '{OPEN_END_DATE}') >= ?
+    UNION ALL
+    SELECT 'driver', id FROM assignment
+    WHERE driver_id = ? AND start_date <= ? AND COALESCE(end_date, '{OPEN_END_DATE}') >= ?
+    LIMIT 1
+'''
+
+class IntervalIndex:
+    """Inclusive ISO date intervals per key, sorted by start, with a running max of ends.
+
+    Among the intervals starting on or before `end`, the one reaching furthest
+    overlaps [start, end] if any does, so a lookup is a single bisect.
+    """
+
+    def __init__(self):
+        self.starts = {}
+        self.ends = {}   # (end, id) in start order
+        self.reach = {}  # running max of self.ends
+
+    def extend(self, rows):
+        """Add (key, start, end, id) rows.
+
+        Keys new to the index are sorted once; a key already present takes
+        each row by a bisect insert, and its running max only changes from
+        the insert position up to the first interval already reaching
+        further, so appending a later booking is constant work beyond the bisect.
+        """
+        fresh = {}
+        for key, start, end, record_id in rows:
+            starts = self.starts.get(key)
+            if starts is None:
+                fresh.setdefault(key, []).append((start, end, record_id))
+                continue
+            ends, reach = self.ends[key], self.reach[key]
+            position = bisect.bisect_right(starts, start)
+            starts.insert(position, start)
+            ends.insert(position, (end, record_id))
+            reach.insert(position, max(reach[position - 1], (end, record_id)) if position else (end, record_id))
+            for later in range(position + 1, len(reach)):
+                if reach[later] >= reach[position]:
+                    break
+                reach[later] = reach[position]
+        for key, intervals in fresh.items():
+            intervals.sort()
+            self.starts[key] = [start for start, _, _ in intervals]
+            self.ends[key] = [(end, record_id) for _, end, record_id in intervals]
+            self.reach[key] = list(itertools.accumulate(self.ends[key], max))
+
+    def replace(self, keys, rows):
+        """Drop every interval under `keys`, then add `rows` (their current intervals)"""
+        for key in keys:
+            self.starts.pop(key, None)
+            self.ends.pop(key, None)
+            self.reach.pop(key, None)
+        self.extend(rows)
+
+    def find_overlap(self, key, start, end):
+        """Id of an interval under `key` overlapping [start, end], or None"""
+        position = bisect.bisect_right(self.starts.get(key, ()), end)
+        if position:
+            reach_end, record_id = self.reach[key][position - 1]
+            if reach_end >= start:
+                return record_id
+        return None
+
+@st.cache_resource
+def get_interval_store():
+    """Vehicle and driver interval indexes shared by all sessions, and the newest assignment and change ids they hold"""
+    return {"plates": IntervalIndex(), "drivers": IntervalIndex(), "last_id": 0, "last_change_id": None,
+            "lock": threading.Lock()}
+
+def get_assignment_intervals():
+    """(vehicle index, driver index), first caught up with assignments added, edited or deleted since the last call"""
+    store = get_interval_store()
+    with store["lock"]:
+        with get_db() as conn:
+            # One read snapshot, so new rows and rebuilt keys agree
+            conn.execute("BEGIN")
+            if store["last_change_id"] is None:
+                # A fresh store loads every row below, so earlier changes are already reflected
+                store["last_change_id"] = conn.execute(
+                    "SELECT COALESCE(MAX(id), 0) FROM assignment_span_change").fetchone()[0]
+            changes = conn.execute(ASSIGNMENT_SPAN_CHANGES_SQL, (store["last_change_id"],)).fetchall()
+            plates = {plate for _, plate, _ in changes}
+            drivers = {driver for _, _, driver in changes}
+            if changes:
+                store["plates"].replace(plates, conn.execute(PLATE_SPANS_SQL, (json.dumps(list(plates)),)).fetchall())
+                store["drivers"].replace(drivers, conn.execute(DRIVER_SPANS_SQL, (json.dumps(list(drivers)),)).fetchall())
+                store["last_change_id"] = changes[-1][0]
+            rows = conn.execute(NEW_ASSIGNMENT_SPANS_SQL, (store["last_id"],)).fetchall()
+        if rows:
+            # Keys just rebuilt already hold their new rows
+            store["plates"].extend((plate, start, end, record_id) for record_id, plate, _, start, end in rows
+                                   if plate not in plates)
+            store["drivers"].extend((driver, start, end, record_id) for record_id, _, driver, start, end in rows
+                                    if driver not in drivers)
+            store["last_id"] = max(row[0] for row in rows)
+    return store["plates"], store["drivers"]
+
+CONFLICT_COLUMNS = ['conflict', 'booked', 'id', 'start_date', 'end_date', 'overlaps_id',
+                    'overlaps_start_date', 'overlaps_end_date']
+
+def find_assignment_conflicts(conn):
+    """Every assignment overlapping another one for the same vehicle or driver.
+
+    Sorting by (key, start) and taking a running max of ends within each key
+    gives, per row, the earlier assignment reaching furthest; it overlaps the
+    row when it reaches the row's start. A row also conflicts when it reaches
+    the start of the next row. One counterpart is reported per row.
+    """
+    spans = pd.read_sql("SELECT id, plate_number, driver_id, start_date, end_date FROM assignment", conn)
+    starts = pd.to_datetime(spans['start_date'], format='%Y-%m-%d', errors='coerce')
+    ends = pd.to_datetime(spans['end_date'].fillna(OPEN_END_DATE), format='%Y-%m-%d', errors='coerce')
+    valid = (starts.notna() & ends.notna()).to_numpy()
+    spans = spans[valid]
+    if spans.empty:
+        return pd.DataFrame(columns=CONFLICT_COLUMNS)
+    # Day numbers from the earliest date, so packed values below stay non-negative
+    start_day = starts.to_numpy()[valid].astype('datetime64[D]').astype(np.int64)
+    end_day = ends.to_numpy()[valid].astype('datetime64[D]').astype(np.int64)
+    origin = min(start_day.min(), end_day.min())
+    start_day -= origin
+    end_day -= origin
+    ids = spans['id'].to_numpy()
+
+    conflicts = []
+    for conflict, column in (("Vehicle", 'plate_number'), ("Driver", 'driver_id')):
+        codes = pd.factorize(spans[column])[0]
+        order = np.lexsort((ids, start_day, codes))
+        key, start, end, record_id = codes[order], start_day[order], end_day[order], ids[order]
+        # (end, id) packed into one integer so a grouped cummax carries the id along
+        span = int(record_id.max()) + 1
+        reach = pd.Series(end * span + record_id).groupby(key).cummax().to_numpy()
+        previous = np.r_[0, reach[:-1]]
+        overlaps_earlier = np.r_[False, key[1:] == key[:-1]] & (previous // span >= start)
+        overlaps_next = np.r_[key[1:] == key[:-1], False] & (end >= np.r_[start[1:], 0])
+        involved = overlaps_earlier | overlaps_next
+        conflicts.append(pd.DataFrame({
+            'conflict': conflict,
+            'booked': spans[column].to_numpy()[order][involved],
+            'id': record_id[involved],
+            'overlaps_id': np.where(overlaps_earlier, previous % span, np.r_[record_id[1:], 0])[involved],
+        }))
+
+    conflicts = pd.concat(conflicts, ignore_index=True)
+    dates = spans.set_index('id')[['start_date', 'end_date']]
+    conflicts = conflicts.join(dates, on='id').join(dates.add_prefix('overlaps_'), on='overlaps_id')
+    return conflicts[CONFLICT_COLUMNS].sort_values(['conflict', 'booked', 'start_date'], ignore_index=True)
+
+def get_assignment_span_version(conn):
+    """(newest assignment id, newest span change id): changes whenever any booking's dates can have"""
+    return tuple(conn.execute(ASSIGNMENT_SPAN_VERSION_SQL).fetchone())
+
+@cached_query()
+def get_assignment_conflicts(span_version):
+    """Cached per assignment span version, so GPS updates to assignment rows keep it"""
+    with get_db() as conn:
+        return find_assignment_conflicts(conn)
+
 def manage_assignments():
     st.title("Assignment Management")
     
     # Get vehicles and drivers for dropdowns
-    conn = sqlite3.connect(DB_PATH)
-    vehicles = pd.read_sql("SELECT plate_number FROM vehicle", conn)
-    drivers = pd.read_sql("SELECT id, name FROM driver", conn)
-    conn.close()
+    plates = get_plate_numbers()
+    driver_names = get_driver_names()
     
     # Add new assignment
     with st.expander("Create New Assignment", expanded=False):
         with st.form("assignment_form", clear_on_submit=True):
-            plate_number = st.selectbox("Vehicle*", vehicles['plate_number'])
-            driver_id = st.selectbox("Driver*", drivers['id'], format_func=lambda x: f"{x} - {drivers.loc[drivers['id'] == x, 'name'].values[0]}")
+            plate_number = st.selectbox("Vehicle*", plates)
+            driver_id = st.selectbox("Driver*", list(driver_names),
+                                     format_func=lambda driver_id: f"{driver_id} - {driver_names[driver_id]}")
             work_place = st.selectbox("Work Place", ASSIGNMENT_TYPES)
             col1, col2 = st.columns(2)
             start_date = col1.date_input("Start Date*", value=date.today())
@@ -456,42 +2095,60 @@ def manage_assignments():
                             st.error("Invalid GPS format. Use 'latitude,longitude' (e.g., 9.145,40.4897)")
                             return
                     
+                    if end_date and end_date < start_date:
+                        st.error("End Date must be on or after Start Date")
+                        return
+                    
+                    # Reject double bookings of the vehicle or the driver
+                    span = (start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d') if end_date else OPEN_END_DATE)
+                    plate_intervals, driver_intervals = get_assignment_intervals()
+                    clash = plate_intervals.find_overlap(plate_number, *span)
+                    if clash:
+                        st.error(f"{plate_number} is already assigned for these dates (assignment {clash})")
+                        return
+                    clash = driver_intervals.find_overlap(driver_id, *span)
+                    if clash:
+                        st.error(f"{driver_names[driver_id]} is already assigned for these dates (assignment {clash})")
+                        return
+                    
                     try:
-                        conn = sqlite3.connect(DB_PATH)
-                        cursor = conn.cursor()
-                        cursor.execute('''
-                            INSERT INTO assignment (
-                                plate_number, driver_id, work_place, start_date, 
-                                end_date, gps_position, geofence_violations, last_update
-                            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                        ''', (
-                            plate_number, driver_id, work_place, start_date.strftime('%Y-%m-%d'),
-                            end_date.strftime('%Y-%m-%d') if end_date else None,
-                            gps_position, geofence_violations, datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                        ))
-                        conn.commit()
+                        with get_db() as conn:
+                            # Another session or process may have booked since the
+                            # in-memory check; the write lock makes re-check and insert atomic
+                            conn.execute("BEGIN IMMEDIATE")
+                            clash = conn.execute(BOOKING_CLASH_SQL, (plate_number, span[1], span[0],
+                                                                     driver_id, span[1], span[0])).fetchone()
+                            if clash:
+                                booked, clash_id = clash
+                                who = plate_number if booked == "vehicle" else driver_names[driver_id]
+                                st.error(f"{who} is already assigned for these dates (assignment {clash_id})")
+                                # The in-memory index missed it, so have the next caller reload it
+                                get_interval_store.clear()
+                                return
+                            cursor = conn.cursor()
+                            cursor.execute('''
+                                INSERT INTO assignment (
+                                    plate_number, driver_id, work_place, start_date, 
+                                    end_date, gps_position, geofence_violations, last_update
+                                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                            ''', (
+                                plate_number, driver_id, work_place, start_date.strftime('%Y-%m-%d'),
+                                end_date.strftime('%Y-%m-%d') if end_date else None,
+                                gps_position, geofence_violations, datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+                            ))
+                            log_change(conn, "INSERT", "assignment", cursor.lastrowid)
+                        invalidate_tables("assignment", "change_log")
                         st.success("Assignment created successfully!")
                     except Exception as e:
                         st.error(f"Error: {str(e)}")
-                    finally:
-                        conn.close()
                 else:
                     st.error("Vehicle, Driver, and Start Date are required fields")
 
     # View and manage assignments
     st.subheader("Current Assignments")
     try:
-        conn = sqlite3.connect(DB_PATH)
-        assignments = pd.read_sql('''
-            SELECT a.id, v.plate_number, v.vehicle_type, d.name AS driver_name, 
-                   a.work_place, a.start_date, a.end_date, a.geofence_violations,
-                   a.gps_position, a.last_update
-            FROM assignment a
-            JOIN vehicle v ON a.plate_number = v.plate_number
-            JOIN driver d ON a.driver_id = d.id
-            WHERE a.end_date IS NULL OR a.end_date >= date('now')
-        ''', conn)
-        conn.close()
+        with get_db() as conn:
+            assignments = pd.read_sql(ACTIVE_ASSIGNMENTS_SQL, conn)
         
         if not assignments.empty:
             st.dataframe(assignments)
@@ -501,47 +2158,82 @@ def manage_assignments():
             col1, col2 = st.columns(2)
             with col1:
                 if not assignments.empty and 'work_place' in assignments:
-                    fig, ax = plt.subplots()
-                    assignments['work_place'].value_counts().plot.bar(ax=ax)
-                    plt.xticks(rotation=90)
-                    plt.title('Assignments by Work Place')
-                    st.pyplot(fig)
+                    render_chart("assignments_by_work_place", assignments['work_place'].value_counts(),
+                                 lambda ax, counts: counts.plot.bar(ax=ax),
+                                 title='Assignments by Work Place', rotation=90)
             
             with col2:
                 if not assignments.empty and 'vehicle_type' in assignments:
-                    fig, ax = plt.subplots()
-                    assignments['vehicle_type'].value_counts().plot.pie(autopct='%1.1f%%', ax=ax)
-                    plt.title('Vehicle Types in Assignments')
-                    st.pyplot(fig)
+                    render_chart("assignments_by_vehicle_type", assignments['vehicle_type'].value_counts(),
+                                 lambda ax, counts: counts.plot.pie(autopct='%1.1f%%', ax=ax),
+                                 title='Vehicle Types in Assignments')
         else:
             st.info("No active assignments found")
     except Exception as e:
         st.error(f"Database error: {str(e)}")
 
 # Compliance Management
+COMPLIANCE_ALERT_HORIZON_DAYS = 90
+COMPLIANCE_SCAN_INTERVAL = 3600  # seconds
+# (days until due, bucket) checked in order; a missing inspection has no due date
+COMPLIANCE_DUE_BUCKETS = ((0, "Overdue"), (7, "Due in 7 days"), (30, "Due in 30 days"),
+                          (COMPLIANCE_ALERT_HORIZON_DAYS, f"Due in {COMPLIANCE_ALERT_HORIZON_DAYS} days"))
+COMPLIANCE_BUCKETS = ("Missing", *(bucket for _, bucket in COMPLIANCE_DUE_BUCKETS))
+COMPLIANCE_ALERT_TYPES = ("Inspection Missing", "Inspection", "Insurance")
+
+def _bucket_case(column):
+    whens = " ".join(f"WHEN {column} < date(:today, '+{days} days') THEN '{bucket}'"
+                     for days, bucket in COMPLIANCE_DUE_BUCKETS)
+    return f"CASE {whens} END"
+
+# Each branch is a range probe on a stored expiry index (or the partial index
+# on missing inspections), so no per-row date math runs on the whole table
+COMPLIANCE_ALERTS_SQL = f'''
+    INSERT INTO compliance_alert (plate_number, alert_type, due_date, bucket, scanned_on)
+    SELECT plate_number, 'Inspection Missing', NULL, 'Missing', :today
+    FROM compliance WHERE yearly_inspection = 'No'
+    UNION ALL
+    SELECT plate_number, 'Inspection', inspection_expiry, {_bucket_case('inspection_expiry')}, :today
+    FROM compliance WHERE inspection_expiry < date(:today, :horizon) AND yearly_inspection IS NOT 'No'
+    UNION ALL
+    SELECT plate_number, 'Insurance', insurance_expiry, {_bucket_case('insurance_expiry')}, :today
+    FROM compliance WHERE insurance_expiry < date(:today, :horizon)
+'''
+
+def scan_compliance_alerts(conn, today=None):
+    """Replace compliance_alert with the current alerts; returns how many were written"""
+    conn.execute("DELETE FROM compliance_alert")
+    cursor = conn.execute(COMPLIANCE_ALERTS_SQL, {
+        "today": (today or date.today()).strftime('%Y-%m-%d'),
+        "horizon": f"+{COMPLIANCE_ALERT_HORIZON_DAYS} days",
+    })
+    return cursor.rowcount
+
+def refresh_compliance_alerts():
+    with get_db() as conn:
+        scan_compliance_alerts(conn)
+    invalidate_tables("compliance_alert")
+
 def manage_compliance():
     st.title("Compliance Management")
     
     # Get vehicles for dropdown
-    conn = sqlite3.connect(DB_PATH)
-    vehicles = pd.read_sql("SELECT plate_number FROM vehicle", conn)
-    conn.close()
+    plates = get_plate_numbers()
     
-    if vehicles.empty:
+    if not plates:
         st.warning("No vehicles found in database")
         return
     
     # Select vehicle
-    plate_number = st.selectbox("Select Vehicle", vehicles['plate_number'])
+    plate_number = st.selectbox("Select Vehicle", plates)
     
     if not plate_number:
         st.warning("Please select a vehicle")
         return
     
     # Get existing compliance data
-    conn = sqlite3.connect(DB_PATH)
-    compliance = pd.read_sql(f"SELECT * FROM compliance WHERE plate_number = '{plate_number}'", conn)
-    conn.close()
+    with get_db() as conn:
+        compliance = pd.read_sql("SELECT * FROM compliance WHERE plate_number = ?", conn, params=(plate_number,))
     
     # Form for compliance data
     with st.form("compliance_form"):
@@ -566,59 +2258,88 @@ def manage_compliance():
         submitted = st.form_submit_button("Save Compliance Data")
         if submitted:
             try:
-                conn = sqlite3.connect(DB_PATH)
-                cursor = conn.cursor()
-                if compliance.empty:
-                    # Insert new record
-                    cursor.execute('''
-                        INSERT INTO compliance (
-                            plate_number, insurance_type, insurance_date, yearly_inspection, 
-                            inspection_date, safety_audit, utilization_history, accident_history
-                        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                    ''', (
-                        plate_number, insurance_type, insurance_date.strftime('%Y-%m-%d'), 
-                        yearly_inspection, inspection_date.strftime('%Y-%m-%d'), 
-                        safety_audit, utilization_history, accident_history
-                    ))
-                else:
-                    # Update existing record
-                    cursor.execute('''
-                        UPDATE compliance SET
-                            insurance_type = ?,
-                            insurance_date = ?,
-                            yearly_inspection = ?,
-                            inspection_date = ?,
-                            safety_audit = ?,
-                            utilization_history = ?,
-                            accident_history = ?
-                        WHERE plate_number = ?
-                    ''', (
-                        insurance_type, insurance_date.strftime('%Y-%m-%d'), 
-                        yearly_inspection, inspection_date.strftime('%Y-%m-%d'), 
-                        safety_audit, utilization_history, accident_history, plate_number
-                    ))
-                conn.commit()
+                with get_db() as conn:
+                    cursor = conn.cursor()
+                    if compliance.empty:
+                        # Insert new record
+                        cursor.execute('''
+                            INSERT INTO compliance (
+                                plate_number, insurance_type, insurance_date, yearly_inspection, 
+                                inspection_date, safety_audit, utilization_history, accident_history
+                            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                        ''', (
+                            plate_number, insurance_type, insurance_date.strftime('%Y-%m-%d'), 
+                            yearly_inspection, inspection_date.strftime('%Y-%m-%d'), 
+                            safety_audit, utilization_history, accident_history
+                        ))
+                    else:
+                        # Update existing record
+                        cursor.execute('''
+                            UPDATE compliance SET
+                                insurance_type = ?,
+                                insurance_date = ?,
+                                yearly_inspection = ?,
+                                inspection_date = ?,
+                                safety_audit = ?,
+                                utilization_history = ?,
+                                accident_history = ?
+                            WHERE plate_number = ?
+                        ''', (
+                            insurance_type, insurance_date.strftime('%Y-%m-%d'), 
+                            yearly_inspection, inspection_date.strftime('%Y-%m-%d'), 
+                            safety_audit, utilization_history, accident_history, plate_number
+                        ))
+                    log_change(conn, "INSERT" if compliance.empty else "UPDATE", "compliance", plate_number)
+                invalidate_tables("compliance", "change_log")
+                refresh_compliance_alerts()
                 st.success("Compliance data saved successfully!")
             except Exception as e:
                 st.error(f"Error: {str(e)}")
-            finally:
-                conn.close()
+    
+    # Every open alert, as of the last scan
+    st.subheader("Compliance Alerts")
+    col1, col2 = st.columns([3, 1])
+    col1.caption(f"Expiries within {COMPLIANCE_ALERT_HORIZON_DAYS} days and missing inspections; "
+                 f"rescanned every {COMPLIANCE_SCAN_INTERVAL // 60} minutes and after each save")
+    if col2.button("Scan Now"):
+        try:
+            refresh_compliance_alerts()
+        except Exception as e:
+            st.error(f"Error: {str(e)}")
+    try:
+        paginated_grid(
+            "compliance_alerts", "compliance_alert",
+            columns=["plate_number", "alert_type", "bucket", "due_date", "scanned_on"],
+            key_column="id",
+            sort_columns=("due_date", "plate_number"),
+            filters={"bucket": COMPLIANCE_BUCKETS, "alert_type": COMPLIANCE_ALERT_TYPES, "plate_number": None},
+            empty_message="No compliance alerts",
+        )
+    except Exception as e:
+        st.error(f"Database error: {str(e)}")
 
 # Maintenance Management
+def draw_service_history(ax, maintenance):
+    ax.plot(maintenance['last_service_date'], maintenance['last_service_km'], 'o-', label='Service KM')
+    ax.set_xlabel('Service Date')
+    ax.set_ylabel('Kilometers')
+    ax.xaxis.set_major_formatter(mdates.DateFormatter('%Y-%m'))
+
 def manage_maintenance():
     st.title("Maintenance Management")
     
     # Get vehicles for dropdown
-    conn = sqlite3.connect(DB_PATH)
-    vehicles = pd.read_sql("SELECT plate_number FROM vehicle", conn)
-    conn.close()
+    plates = get_plate_numbers()
     
-    if vehicles.empty:
+    if not plates:
         st.warning("No vehicles found in database")
         return
     
+    bulk_import("maintenance", "Bulk Import Maintenance Records")
+    bulk_import("odometer_reading", "Bulk Import Odometer Readings")
+    
     # Select vehicle
-    plate_number = st.selectbox("Select Vehicle", vehicles['plate_number'])
+    plate_number = st.selectbox("Select Vehicle", plates)
     
     if not plate_number:
         st.warning("Please select a vehicle")
@@ -636,36 +2357,74 @@ def manage_maintenance():
             submitted = st.form_submit_button("Add Record")
             if submitted:
                 try:
-                    conn = sqlite3.connect(DB_PATH)
-                    cursor = conn.cursor()
-                    cursor.execute('''
-                        INSERT INTO maintenance (
-                            plate_number, last_service_km, last_service_date, 
-                            next_service_km, next_service_date, maintenance_center
-                        ) VALUES (?, ?, ?, ?, ?, ?)
-                    ''', (
-                        plate_number, last_service_km, last_service_date.strftime('%Y-%m-%d'),
-                        next_service_km, next_service_date.strftime('%Y-%m-%d'), maintenance_center
-                    ))
-                    conn.commit()
+                    with get_db() as conn:
+                        cursor = conn.cursor()
+                        cursor.execute('''
+                            INSERT INTO maintenance (
+                                plate_number, last_service_km, last_service_date, 
+                                next_service_km, next_service_date, maintenance_center
+                            ) VALUES (?, ?, ?, ?, ?, ?)
+                        ''', (
+                            plate_number, last_service_km, last_service_date.strftime('%Y-%m-%d'),
+                            next_service_km, next_service_date.strftime('%Y-%m-%d'), maintenance_center
+                        ))
+                        log_change(conn, "INSERT", "maintenance", cursor.lastrowid)
+                    invalidate_tables("maintenance", "change_log")
                     st.success("Maintenance record added successfully!")
                 except Exception as e:
                     st.error(f"Error: {str(e)}")
-                finally:
-                    conn.close()
+
+    with st.expander("Record Odometer Reading", expanded=False):
+        with st.form("odometer_form", clear_on_submit=True):
+            reading_date = st.date_input("Reading Date", value=date.today())
+            km = st.number_input("Odometer KM", min_value=0, value=0)
+            
+            submitted = st.form_submit_button("Add Reading")
+            if submitted:
+                try:
+                    with get_db() as conn:
+                        cursor = conn.execute(
+                            "INSERT INTO odometer_reading (plate_number, reading_date, km) VALUES (?, ?, ?)",
+                            (plate_number, reading_date.strftime('%Y-%m-%d'), km))
+                        log_change(conn, "INSERT", "odometer_reading", cursor.lastrowid)
+                    invalidate_tables("odometer_reading", "change_log")
+                    st.success("Odometer reading added successfully!")
+                except Exception as e:
+                    st.error(f"Error: {str(e)}")
+
+    # Service forecast
+    forecast = get_service_forecast()
+    forecast = forecast[forecast['plate_number'] == plate_number]
+    if not forecast.empty:
+        row = forecast.iloc[0]
+        col1, col2, col3 = st.columns(3)
+        col1.metric("Est. KM per Day", "-" if pd.isna(row['daily_km']) else f"{row['daily_km']:.1f}")
+        col2.metric("Reaches Service KM", "-" if pd.isna(row['km_due_date']) else f"{row['km_due_date']:%Y-%m-%d}")
+        col3.metric("Service Due", "-" if pd.isna(row['due_date']) else f"{row['due_date']:%Y-%m-%d}",
+                    help=f"Earlier of the km forecast and the scheduled date (due by {row['due_by']})")
+
+    # Distance driven according to GPS
+    distance = get_daily_distance(plate_number)
+    if not distance.empty:
+        st.subheader("GPS Distance (Last 30 Days)")
+        col1, col2, col3 = st.columns(3)
+        col1.metric("Total KM", f"{distance['km'].sum():,.0f}")
+        col2.metric("Avg KM per Active Day", f"{distance['km'].mean():,.1f}")
+        col3.metric("Trips", int(distance['trips'].sum()))
+        render_chart("gps_daily_distance", distance[['day', 'km']],
+                     lambda ax, df: ax.bar(df['day'], df['km']), title='KM per Day', rotation=45, figsize=(10, 4))
 
     # View maintenance history
     st.subheader("Maintenance History")
     try:
-        conn = sqlite3.connect(DB_PATH)
-        maintenance = pd.read_sql(f'''
-            SELECT id, last_service_km, last_service_date, 
-                   next_service_km, next_service_date, maintenance_center
-            FROM maintenance
-            WHERE plate_number = '{plate_number}'
-            ORDER BY last_service_date DESC
-        ''', conn)
-        conn.close()
+        with get_db() as conn:
+            maintenance = pd.read_sql('''
+                SELECT id, last_service_km, last_service_date, 
+                       next_service_km, next_service_date, maintenance_center
+                FROM maintenance
+                WHERE plate_number = ?
+                ORDER BY last_service_date DESC
+            ''', conn, params=(plate_number,))
         
         if not maintenance.empty:
             st.dataframe(maintenance)
@@ -676,14 +2435,9 @@ def manage_maintenance():
             maintenance.sort_values('last_service_date', inplace=True)
             
             if len(maintenance) > 1:
-                fig, ax = plt.subplots(figsize=(10, 4))
-                ax.plot(maintenance['last_service_date'], maintenance['last_service_km'], 'o-', label='Service KM')
-                ax.set_title('Service Kilometers Over Time')
-                ax.set_xlabel('Service Date')
-                ax.set_ylabel('Kilometers')
-                ax.xaxis.set_major_formatter(mdates.DateFormatter('%Y-%m'))
-                plt.xticks(rotation=45)
-                st.pyplot(fig)
+                render_chart("service_history", maintenance[['last_service_date', 'last_service_km']],
+                             draw_service_history, title='Service Kilometers Over Time',
+                             rotation=45, figsize=(10, 4))
             else:
                 st.info("At least 2 records needed for visualization")
         else:
@@ -691,54 +2445,404 @@ def manage_maintenance():
     except Exception as e:
         st.error(f"Database error: {str(e)}")
 
+# Fuel Analytics
+FUEL_PERIODS = {"Month": "M", "Quarter": "Q", "Year": "Y"}
+FUEL_PERIOD_CHOICES = 24
+# Fills this far before a period supply the odometer baseline for its first fill
+FUEL_BASELINE_DAYS = 31
+FUEL_OUTLIER_RATIO = 1.5  # L/100 km above this multiple of the rating is flagged
+FUEL_CAPACITY_TOLERANCE = 1.05
+
+FUEL_FILLS_SQL = '''
+    SELECT f.plate_number, f.fill_date, f.liters, f.odometer_km, f.cost,
+           v.assigned_for, v.fuel_capacity, v.fuel_consumption AS rated_l_per_100km
+    FROM fuel_fill f
+    JOIN vehicle v ON f.plate_number = v.plate_number
+    WHERE f.fill_date BETWEEN ? AND ?
+'''
+
+def fuel_consumption_report(conn, start_date, end_date):
+    """Per-fill, per-vehicle and per-region consumption for fills in [start_date, end_date].
+
+    Fills are treated as full-tank: the liters of a fill cover the distance
+    driven since the vehicle's previous fill. Returns (flagged fills,
+    vehicles, regions) DataFrames.
+    """
+    baseline = (pd.Timestamp(start_date) - timedelta(days=FUEL_BASELINE_DAYS)).strftime('%Y-%m-%d')
+    fills = pd.read_sql(FUEL_FILLS_SQL, conn, params=(baseline, end_date))
+    fills.sort_values(['plate_number', 'fill_date', 'odometer_km'], inplace=True, kind='stable')
+    fills['distance_km'] = fills['odometer_km'] - fills.groupby('plate_number')['odometer_km'].shift()
+    fills = fills[fills['fill_date'] >= start_date].reset_index(drop=True)
+
+    measured = fills['distance_km'] > 0
+    fills['l_per_100km'] = (100 * fills['liters'] / fills['distance_km']).where(measured)
+    # Vehicles without a rating are compared against their own median for the period
+    reference = fills['rated_l_per_100km'].where(fills['rated_l_per_100km'] > 0,
+                                                 fills.groupby('plate_number')['l_per_100km'].transform('median'))
+    fills['issue'] = np.select(
+        [fills['distance_km'] <= 0,
+         (fills['fuel_capacity'] > 0) & (fills['liters'] > fills['fuel_capacity'] * FUEL_CAPACITY_TOLERANCE),
+         fills['l_per_100km'] > reference * FUEL_OUTLIER_RATIO],
+        ["No distance since last fill", "Over tank capacity", "High consumption"],
+        default="")
+
+    fills['measured_liters'] = fills['liters'].where(measured, 0.0)
+    fills['measured_km'] = fills['distance_km'].where(measured, 0.0)
+    fills['flagged'] = fills['issue'] != ""
+    vehicles = fills.groupby('plate_number').agg(
+        assigned_for=('assigned_for', 'first'),
+        fills=('liters', 'size'),
+        liters=('liters', 'sum'),
+        cost=('cost', 'sum'),
+        measured_liters=('measured_liters', 'sum'),
+        distance_km=('measured_km', 'sum'),
+        rated_l_per_100km=('rated_l_per_100km', 'first'),
+        flagged=('flagged', 'sum'),
+    ).reset_index()
+    with np.errstate(divide='ignore', invalid='ignore'):
+        vehicles['l_per_100km'] = (100 * vehicles['measured_liters'] / vehicles['distance_km']).where(
+            vehicles['distance_km'] > 0).round(2)
+    vehicles['vs_rated_pct'] = (100 * (vehicles['l_per_100km'] / vehicles['rated_l_per_100km'] - 1)).where(
+        vehicles['rated_l_per_100km'] > 0).round(1)
+
+    regions = vehicles.groupby(vehicles['assigned_for'].fillna("Unassigned")).agg(
+        vehicles=('plate_number', 'size'),
+        liters=('liters', 'sum'),
+        cost=('cost', 'sum'),
+        measured_liters=('measured_liters', 'sum'),
+        distance_km=('distance_km', 'sum'),
+        flagged=('flagged', 'sum'),
+    ).reset_index()
+    regions['l_per_100km'] = (100 * regions['measured_liters'] / regions['distance_km']).where(
+        regions['distance_km'] > 0).round(2)
+
+    flagged = fills.loc[fills['flagged'], ['plate_number', 'fill_date', 'liters', 'distance_km', 'l_per_100km',
+                                            'rated_l_per_100km', 'issue']]
+    return (flagged.round({'l_per_100km': 2}),
+            vehicles.drop(columns='measured_liters'),
+            regions.drop(columns='measured_liters'))
+
+@cached_query("fuel_fill", "vehicle")
+def get_fuel_report(start_date, end_date):
+    with get_db() as conn:
+        return fuel_consumption_report(conn, start_date, end_date)
+
+def fuel_analytics():
+    st.title("Fuel Analytics")
+
+    plates = get_plate_numbers()
+    if not plates:
+        st.warning("No vehicles found in database")
+        return
+
+    bulk_import("fuel_fill", "Bulk Import Fuel Fills")
+
+    with st.expander("Record Fuel Fill", expanded=False):
+        with st.form("fuel_fill_form", clear_on_submit=True):
+            col1, col2 = st.columns(2)
+            plate_number = col1.selectbox("Vehicle", plates)
+            fill_date = col2.date_input("Fill Date", value=date.today())
+            liters = col1.number_input("Liters", min_value=0.0, format="%.2f", value=0.0)
+            odometer_km = col2.number_input("Odometer KM", min_value=0, value=0)
+            cost = col1.number_input("Cost", min_value=0.0, format="%.2f", value=0.0)
+            station = col2.text_input("Station")
+
+            submitted = st.form_submit_button("Add Fill")
+            if submitted:
+                try:
+                    with get_db() as conn:
+                        cursor = conn.execute(
+                            "INSERT INTO fuel_fill (plate_number, fill_date, liters, odometer_km, cost, station) "
+                            "VALUES (?, ?, ?, ?, ?, ?)",
+                            (plate_number, fill_date.strftime('%Y-%m-%d'), liters, odometer_km, cost, station))
+                        log_change(conn, "INSERT", "fuel_fill", cursor.lastrowid)
+                    invalidate_tables("fuel_fill", "change_log")
+                    st.success("Fuel fill added successfully!")
+                except Exception as e:
+                    st.error(f"Error: {str(e)}")
+
+    # Whole periods keep the cache keys stable between visits
+    col1, col2 = st.columns(2)
+    period_type = col1.selectbox("Period Type", list(FUEL_PERIODS))
+    periods = pd.period_range(end=pd.Timestamp(date.today()), periods=FUEL_PERIOD_CHOICES,
+                              freq=FUEL_PERIODS[period_type])[::-1]
+    period = col2.selectbox("Period", periods, format_func=str)
+    start_date = period.start_time.strftime('%Y-%m-%d')
+    end_date = period.end_time.strftime('%Y-%m-%d')
+
+    try:
+        flagged, vehicles, regions = get_fuel_report(start_date, end_date)
+    except Exception as e:
+        st.error(f"Database error: {str(e)}")
+        return
+
+    if vehicles.empty:
+        st.info(f"No fuel fills recorded for {period}")
+        return
+
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Liters", f"{vehicles['liters'].sum():,.0f}")
+    col2.metric("Cost", f"{vehicles['cost'].sum():,.0f}")
+    distance = vehicles['distance_km'].sum()
+    col3.metric("Fleet L/100 km",
+                f"{(regions['l_per_100km'] * regions['distance_km']).sum() / distance:.2f}" if distance else "-")
+    col4.metric("Flagged Fills", len(flagged))
+
+    st.subheader("By Region")
+    st.dataframe(regions.rename(columns={
+        'assigned_for': "Region", 'vehicles': "Vehicles", 'liters': "Liters", 'cost': "Cost",
+        'distance_km': "Distance (km)", 'flagged': "Flagged", 'l_per_100km': "L/100 km",
+    }), hide_index=True)
+    render_chart("fuel_regions", regions[['assigned_for', 'l_per_100km']].dropna(),
+                 lambda ax, df: sns.barplot(data=df, x='assigned_for', y='l_per_100km', ax=ax),
+                 title='Consumption by Region (L/100 km)', rotation=45)
+
+    st.subheader("Actual vs Rated Consumption")
+    st.dataframe(vehicles.sort_values('vs_rated_pct', ascending=False).rename(columns={
+        'plate_number': "Plate", 'assigned_for': "Region", 'fills': "Fills", 'liters': "Liters",
+        'cost': "Cost", 'distance_km': "Distance (km)", 'rated_l_per_100km': "Rated L/100 km",
+        'flagged': "Flagged", 'l_per_100km': "Actual L/100 km", 'vs_rated_pct': "vs Rated (%)",
+    }), hide_index=True)
+
+    st.subheader("Flagged Fills")
+    if flagged.empty:
+        st.info("No suspicious fills in this period")
+    else:
+        st.dataframe(flagged.rename(columns={
+            'plate_number': "Plate", 'fill_date': "Date", 'liters': "Liters", 'distance_km': "Distance (km)",
+            'l_per_100km': "L/100 km", 'rated_l_per_100km': "Rated L/100 km", 'issue': "Issue",
+        }), hide_index=True)
+
 # Report Generation
+# Report aggregates read the trigger-maintained summary tables (migration 7)
+VEHICLES_BY_ASSIGNMENT_SQL = '''
+    SELECT NULLIF(assigned_for, '') AS assignment_type, vehicle_count
+    FROM summary_vehicles_by_assignment
+    WHERE vehicle_count > 0
+'''
+
+DRIVERS_BY_REPORTING_SQL = '''
+    SELECT NULLIF(reporting_to, '') AS reporting_to, driver_count
+    FROM summary_drivers_by_reporting
+    WHERE driver_count > 0
+'''
+
+ONGOING_ASSIGNMENTS_SQL = '''
+    SELECT COALESCE(SUM(assignment_count), 0) AS ongoing_count
+    FROM summary_assignments_by_end
+    WHERE active_until >= date('now')
+'''
+
+UNASSIGNED_COUNT_SQL = '''
+    SELECT COALESCE(SUM(vehicle_count), 0) AS unassigned_count
+    FROM summary_vehicles_by_end
+    WHERE active_until < date('now')
+'''
+
+UNASSIGNED_VEHICLES_SQL = '''
+    SELECT v.*
+    FROM vehicle_active_until u
+    JOIN vehicle v ON v.plate_number = u.plate_number
+    WHERE u.active_until < date('now')
+'''
+
+# Active assignments via idx_assignment_active_until, plus one row for each
+# driver who has never been assigned
+DRIVER_ASSIGNMENTS_SQL = f'''
+    SELECT d.name, d.id_number, d.phone, d.reporting_to,
+           v.plate_number, v.vehicle_type, a.work_place,
+           a.start_date, a.end_date
+    FROM assignment a
+    JOIN driver d ON d.id = a.driver_id
+    LEFT JOIN vehicle v ON a.plate_number = v.plate_number
+    WHERE {ACTIVE_ASSIGNMENT}
+    UNION ALL
+    SELECT d.name, d.id_number, d.phone, d.reporting_to, NULL, NULL, NULL, NULL, NULL
+    FROM driver d
+    WHERE NOT EXISTS (SELECT 1 FROM assignment WHERE driver_id = d.id LIMIT 1)
+'''
+
+ASSIGNMENT_HISTORY_SQL = '''
+    SELECT a.id, a.plate_number, v.vehicle_type, d.name AS driver_name, d.id_number,
+           a.work_place, a.start_date, a.end_date, a.geofence_violations, a.last_update
+    FROM assignment a
+    LEFT JOIN vehicle v ON a.plate_number = v.plate_number
+    LEFT JOIN driver d ON a.driver_id = d.id
+    WHERE a.start_date BETWEEN ? AND ?
+    ORDER BY a.start_date, a.id
+'''
+
+# Report exports
+EXPORT_CHUNK_ROWS = 10000
+EXPORT_PREVIEW_ROWS = 1000
+XLSX_MAX_ROWS = 1048576  # per sheet, header included
+
+# Report name -> (query, tables it reads, sheet name)
+EXPORT_REPORTS = {
+    "unassigned_vehicles": (UNASSIGNED_VEHICLES_SQL, ("vehicle", "assignment"), "Unassigned Vehicles"),
+    "driver_assignments": (DRIVER_ASSIGNMENTS_SQL, ("driver", "assignment", "vehicle"), "Driver Assignments"),
+    "assignment_history": (ASSIGNMENT_HISTORY_SQL, ("assignment", "assignment_position", "driver", "vehicle"),
+                           "Assignment History"),
+}
+EXPORT_FORMATS = {
+    "CSV": ("csv", "text/csv"),
+    "Excel": ("xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+    "Parquet": ("parquet", "application/vnd.apache.parquet"),
+}
+
+@st.cache_resource
+def get_export_store():
+    """Scratch directory and lock for generated export files, one per server process"""
+    return tempfile.mkdtemp(prefix="fleet-exports-"), threading.Lock()
+
+def _write_csv(path, columns, chunks, sheet_name):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(columns)
+        for rows in chunks:
+            writer.writerows(rows)
+
+def _write_xlsx(path, columns, chunks, sheet_name):
+    import xlsxwriter  # only needed for Excel exports
+
+    # constant_memory flushes each row to disk once the next one starts
+    workbook = xlsxwriter.Workbook(path, {'constant_memory': True})
+    try:
+        sheet, row_number, sheets = None, XLSX_MAX_ROWS, 0
+        for rows in itertools.chain(chunks, [[]]):
+            for row in rows:
+                if row_number == XLSX_MAX_ROWS:
+                    sheets += 1
+                    sheet = workbook.add_worksheet(f"{sheet_name[:27]} {sheets}" if sheets > 1 else sheet_name[:31])
+                    sheet.write_row(0, 0, columns)
+                    row_number = 1
+                sheet.write_row(row_number, 0, row)
+                row_number += 1
+        if sheet is None:
+            workbook.add_worksheet(sheet_name[:31]).write_row(0, 0, columns)
+    finally:
+        workbook.close()
+
+def _write_parquet(path, columns, chunks, sheet_name):
+    import pyarrow as pa  # only needed for Parquet exports
+    import pyarrow.parquet as pq
+
+    writer = None
+    try:
+        for rows in chunks:
+            values = list(zip(*rows))
+            if writer is None:
+                # Types come from the first chunk; all-NULL columns fall back to text
+                arrays = [pa.array(column) for column in values]
+                schema = pa.schema([(name, pa.string() if array.type == pa.null() else array.type)
+                                    for name, array in zip(columns, arrays)])
+                writer = pq.ParquetWriter(path, schema)
+            arrays = [pa.array(column, type=field.type) for column, field in zip(values, schema)]
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+        if writer is None:
+            schema = pa.schema([(name, pa.string()) for name in columns])
+            writer = pq.ParquetWriter(path, schema)
+    finally:
+        if writer is not None:
+            writer.close()
+
+EXPORT_WRITERS = {"csv": _write_csv, "xlsx": _write_xlsx, "parquet": _write_parquet}
+
+def export_report(report, file_format, params=()):
+    """Path of `report` streamed to disk as file_format, reused until its tables change.
+
+    Rows are fetched EXPORT_CHUNK_ROWS at a time and written as they arrive,
+    so memory stays flat however large the report is.
+    """
+    sql, tables, sheet_name = EXPORT_REPORTS[report]
+    versions = get_table_versions()
+    # date('now') in the queries makes every report a function of the day too
+    version = (date.today().isoformat(), tuple(params), tuple(versions[table] for table in tables))
+    digest = hashlib.sha256(repr((file_format, version)).encode()).hexdigest()[:16]
+    directory, lock = get_export_store()
+    path = os.path.join(directory, f"{report}-{digest}.{file_format}")
+
+    with lock:
+        if os.path.exists(path):
+            return path
+        for stale in glob.glob(os.path.join(directory, f"{report}-*.{file_format}")):
+            os.remove(stale)
+        partial = path + ".part"
+        with get_db() as conn:
+            cursor = conn.execute(sql, params)
+            columns = [description[0] for description in cursor.description]
+            chunks = iter(lambda: cursor.fetchmany(EXPORT_CHUNK_ROWS), [])
+            EXPORT_WRITERS[file_format](partial, columns, chunks, sheet_name)
+        os.replace(partial, path)
+    return path
+
+def read_export(report, file_format, params=()):
+    with open(export_report(report, file_format, params), "rb") as f:
+        return f.read()
+
+def get_report_preview(report, params=()):
+    """First EXPORT_PREVIEW_ROWS rows of a report and its total row count"""
+    # Keyed on the report's own table versions, like exports, so a write only
+    # refreshes the previews that read what it changed
+    versions = get_table_versions()
+    tables = EXPORT_REPORTS[report][1]
+    return _load_report_preview(report, tuple(params), tuple(versions[table] for table in tables))
+
+@cached_query()
+def _load_report_preview(report, params, versions):
+    sql = EXPORT_REPORTS[report][0]
+    with get_db() as conn:
+        preview = pd.read_sql(f"SELECT * FROM ({sql}) LIMIT {EXPORT_PREVIEW_ROWS}", conn, params=params)
+        total = conn.execute(f"SELECT COUNT(*) FROM ({sql})", params).fetchone()[0]
+    return preview, total
+
+def export_buttons(report, params=()):
+    """Download buttons that build the file on click, off the script thread, and skip the rerun"""
+    for column, (label, (file_format, mime)) in zip(st.columns(len(EXPORT_FORMATS)), EXPORT_FORMATS.items()):
+        column.download_button(
+            f"Download {label}",
+            data=lambda file_format=file_format: read_export(report, file_format, params),
+            file_name=f"{report}_{date.today()}.{file_format}",
+            mime=mime,
+            on_click="ignore",
+            key=f"export_{report}_{file_format}",
+        )
+
+def show_report(report, params=(), empty_message="No rows found"):
+    preview, total = get_report_preview(report, params)
+    if not total:
+        st.info(empty_message)
+        return
+    st.dataframe(preview)
+    if total > len(preview):
+        st.caption(f"Showing the first {len(preview)} of {total} rows; downloads include all rows")
+    export_buttons(report, params)
+
+@cached_query("vehicle", "driver", "assignment")
+def get_assignment_summary():
+    """Summary-table lookups: a few rows each, whatever the assignment history size"""
+    with get_db() as conn:
+        assignment_counts = pd.read_sql(VEHICLES_BY_ASSIGNMENT_SQL, conn)
+        driver_counts = pd.read_sql(DRIVERS_BY_REPORTING_SQL, conn)
+        ongoing_assignments = conn.execute(ONGOING_ASSIGNMENTS_SQL).fetchone()[0]
+        unassigned_vehicles = conn.execute(UNASSIGNED_COUNT_SQL).fetchone()[0]
+    return assignment_counts, driver_counts, ongoing_assignments, unassigned_vehicles
+
 def generate_reports():
     st.title("Report Generation")
     
     report_type = st.selectbox("Select Report Type", [
         "Assignment Summary",
         "Unassigned Vehicles",
-        "Driver Assignments"
+        "Driver Assignments",
+        "Assignment History",
+        "Double Bookings"
     ])
     
     if report_type == "Assignment Summary":
         st.subheader("Assignment Summary Report")
         try:
-            conn = sqlite3.connect(DB_PATH)
-            
-            # Assignment counts by type
-            assignment_counts = pd.read_sql('''
-                SELECT assigned_for AS assignment_type, COUNT(*) AS vehicle_count
-                FROM vehicle
-                GROUP BY assigned_for
-            ''', conn)
-            
-            # Driver counts by reporting to
-            driver_counts = pd.read_sql('''
-                SELECT reporting_to, COUNT(*) AS driver_count
-                FROM driver
-                GROUP BY reporting_to
-            ''', conn)
-            
-            # Ongoing assignments
-            ongoing_assignments = pd.read_sql('''
-                SELECT COUNT(*) AS ongoing_count
-                FROM assignment
-                WHERE end_date IS NULL OR end_date >= date('now')
-            ''', conn).iloc[0]['ongoing_count']
-            
-            # Unassigned vehicles
-            unassigned_vehicles = pd.read_sql('''
-                SELECT COUNT(*) AS unassigned_count
-                FROM vehicle
-                WHERE plate_number NOT IN (
-                    SELECT plate_number
-                    FROM assignment
-                    WHERE end_date IS NULL OR end_date >= date('now')
-                )
-            ''', conn).iloc[0]['unassigned_count']
-            
-            conn.close()
+            assignment_counts, driver_counts, ongoing_assignments, unassigned_vehicles = get_assignment_summary()
             
             # Display metrics
             col1, col2 = st.columns(2)
@@ -748,19 +2852,17 @@ def generate_reports():
             # Visualizations
             st.subheader("Vehicles by Assignment Type")
             if not assignment_counts.empty:
-                fig, ax = plt.subplots()
-                sns.barplot(data=assignment_counts, x='assignment_type', y='vehicle_count', ax=ax)
-                plt.xticks(rotation=90)
-                st.pyplot(fig)
+                render_chart("report_vehicles_by_assignment", assignment_counts,
+                             lambda ax, df: sns.barplot(data=df, x='assignment_type', y='vehicle_count', ax=ax),
+                             rotation=90)
             else:
                 st.info("No assignment data available")
             
             st.subheader("Drivers by Reporting To")
             if not driver_counts.empty:
-                fig, ax = plt.subplots()
-                sns.barplot(data=driver_counts, x='reporting_to', y='driver_count', ax=ax)
-                plt.xticks(rotation=90)
-                st.pyplot(fig)
+                render_chart("report_drivers_by_reporting", driver_counts,
+                             lambda ax, df: sns.barplot(data=df, x='reporting_to', y='driver_count', ax=ax),
+                             rotation=90)
             else:
                 st.info("No driver data available")
                 
@@ -770,229 +2872,756 @@ def generate_reports():
     elif report_type == "Unassigned Vehicles":
         st.subheader("Unassigned Vehicles Report")
         try:
-            conn = sqlite3.connect(DB_PATH)
-            unassigned = pd.read_sql('''
-                SELECT v.*
-                FROM vehicle v
-                WHERE v.plate_number NOT IN (
-                    SELECT a.plate_number
-                    FROM assignment a
-                    WHERE a.end_date IS NULL OR a.end_date >= date('now')
-                )
-            ''', conn)
-            conn.close()
-            
-            if not unassigned.empty:
-                st.dataframe(unassigned)
-                
-                # Export button
-                if st.button("Export to Excel"):
-                    output = BytesIO()
-                    with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-                        unassigned.to_excel(writer, sheet_name='Unassigned Vehicles', index=False)
-                    st.download_button(
-                        label="Download Excel",
-                        data=output.getvalue(),
-                        file_name=f"unassigned_vehicles_{date.today()}.xlsx",
-                        mime="application/vnd.ms-excel"
-                    )
-            else:
-                st.info("All vehicles are currently assigned")
-                
+            show_report("unassigned_vehicles", empty_message="All vehicles are currently assigned")
         except Exception as e:
             st.error(f"Database error: {str(e)}")
     
     elif report_type == "Driver Assignments":
         st.subheader("Driver Assignments Report")
         try:
-            conn = sqlite3.connect(DB_PATH)
-            assignments = pd.read_sql('''
-                SELECT d.name, d.id_number, d.phone, d.reporting_to,
-                       v.plate_number, v.vehicle_type, a.work_place,
-                       a.start_date, a.end_date
-                FROM driver d
-                LEFT JOIN assignment a ON d.id = a.driver_id
-                LEFT JOIN vehicle v ON a.plate_number = v.plate_number
-                WHERE a.end_date IS NULL OR a.end_date >= date('now')
-            ''', conn)
-            conn.close()
+            show_report("driver_assignments", empty_message="No active assignments found")
+        except Exception as e:
+            st.error(f"Database error: {str(e)}")
+    
+    elif report_type == "Assignment History":
+        st.subheader("Assignment History Report")
+        col1, col2 = st.columns(2)
+        start_date = col1.date_input("From", value=date.today() - timedelta(days=365))
+        end_date = col2.date_input("To", value=date.today())
+        try:
+            show_report("assignment_history", (start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d')),
+                        empty_message="No assignments started in this period")
+        except Exception as e:
+            st.error(f"Database error: {str(e)}")
+    
+    elif report_type == "Double Bookings":
+        st.subheader("Double Bookings Report")
+        try:
+            with get_db() as conn:
+                span_version = get_assignment_span_version(conn)
+            conflicts = get_assignment_conflicts(span_version)
             
-            if not assignments.empty:
-                st.dataframe(assignments)
-                
-                # Export button
-                if st.button("Export to Excel"):
-                    output = BytesIO()
-                    with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-                        assignments.to_excel(writer, sheet_name='Driver Assignments', index=False)
-                    st.download_button(
-                        label="Download Excel",
-                        data=output.getvalue(),
-                        file_name=f"driver_assignments_{date.today()}.xlsx",
-                        mime="application/vnd.ms-excel"
-                    )
+            col1, col2 = st.columns(2)
+            col1.metric("Double-Booked Vehicle Assignments", int((conflicts['conflict'] == "Vehicle").sum()))
+            col2.metric("Double-Booked Driver Assignments", int((conflicts['conflict'] == "Driver").sum()))
+            
+            if conflicts.empty:
+                st.info("No overlapping assignments found")
             else:
-                st.info("No active assignments found")
-                
+                st.dataframe(conflicts.head(EXPORT_PREVIEW_ROWS).rename(columns={
+                    'conflict': "Conflict", 'booked': "Vehicle / Driver ID", 'id': "Assignment",
+                    'start_date': "Start", 'end_date': "End", 'overlaps_id': "Overlaps",
+                    'overlaps_start_date': "Other Start", 'overlaps_end_date': "Other End",
+                }), hide_index=True)
+                if len(conflicts) > EXPORT_PREVIEW_ROWS:
+                    st.caption(f"Showing the first {EXPORT_PREVIEW_ROWS:,} of {len(conflicts):,} rows")
+                st.download_button("Download CSV", data=conflicts.to_csv(index=False),
+                                   file_name="double_bookings.csv", mime="text/csv", on_click="ignore")
         except Exception as e:
             st.error(f"Database error: {str(e)}")
 
+# Geofencing
+GEOFENCE_CELL_DEGREES = 0.25  # grid bucket size for the spatial index
+
+def parse_polygon(text):
+    """Parse "lat, lon" lines (or a JSON [[lat, lon], ...] list) into a vertex list"""
+    text = text.strip()
+    if text.startswith('['):
+        vertices = [tuple(float(v) for v in pair) for pair in json.loads(text)]
+    else:
+        vertices = [tuple(float(v) for v in line.split(',')) for line in text.splitlines() if line.strip()]
+    if any(len(v) != 2 for v in vertices):
+        raise ValueError("Each vertex needs exactly a latitude and a longitude")
+    if vertices and vertices[0] == vertices[-1]:
+        vertices = vertices[:-1]
+    if len(vertices) < 3:
+        raise ValueError("A geofence needs at least 3 vertices")
+    if not all(-90 <= lat <= 90 and -180 <= lon <= 180 for lat, lon in vertices):
+        raise ValueError("Coordinates out of range")
+    return vertices
+
+def points_in_polygon(lat, lon, polygon):
+    """Even-odd ray casting, looping over the polygon's edges and vectorised over points"""
+    inside = np.zeros(len(lat), dtype=bool)
+    lat1, lon1 = polygon[:, 0], polygon[:, 1]
+    lat2, lon2 = np.roll(lat1, -1), np.roll(lon1, -1)
+    for a_lat, a_lon, b_lat, b_lon in zip(lat1, lon1, lat2, lon2):
+        if a_lat == b_lat:
+            continue  # horizontal edges never cross the east-west ray
+        crosses = (a_lat > lat) != (b_lat > lat)
+        lon_at = a_lon + (lat - a_lat) * (b_lon - a_lon) / (b_lat - a_lat)
+        inside ^= crosses & (lon < lon_at)
+    return inside
+
+class GeofenceIndex:
+    """Region polygons bucketed on a lat/lon grid for batch point-in-fence tests"""
+
+    def __init__(self, fences, cell_size=GEOFENCE_CELL_DEGREES):
+        # fences: iterable of (fence_id, work_place, [(lat, lon), ...])
+        self.cell_size = cell_size
+        self.polygons = {}
+        self.work_places = set()
+        buckets = []
+        for fence_id, work_place, vertices in fences:
+            polygon = np.asarray(vertices, dtype=float)
+            self.polygons[fence_id] = polygon
+            self.work_places.add(work_place)
+            (row_min, col_min), (row_max, col_max) = np.floor(
+                [polygon.min(axis=0) / cell_size, polygon.max(axis=0) / cell_size]).astype(int)
+            for row in range(row_min, row_max + 1):
+                for col in range(col_min, col_max + 1):
+                    buckets.append((self._cell_key(row, col), work_place, fence_id))
+        self.buckets = pd.DataFrame(buckets, columns=['cell', 'work_place', 'fence_id'])
+
+    @staticmethod
+    def _cell_key(row, col):
+        return row * 1_000_003 + col
+
+    def __len__(self):
+        return len(self.polygons)
+
+    def contains(self, lat, lon, work_place):
+        """True where a point lies inside at least one fence of its own work_place"""
+        lat, lon = np.asarray(lat, dtype=float), np.asarray(lon, dtype=float)
+        inside = np.zeros(len(lat), dtype=bool)
+        if self.buckets.empty or not len(lat):
+            return inside
+        points = pd.DataFrame({
+            'cell': self._cell_key(np.floor(lat / self.cell_size).astype(np.int64),
+                                   np.floor(lon / self.cell_size).astype(np.int64)),
+            'work_place': np.asarray(work_place, dtype=object),
+            'point': np.arange(len(lat)),
+        })
+        # Only (point, fence) pairs sharing a grid cell and a region get the exact test
+        candidates = points.merge(self.buckets, on=['cell', 'work_place'])
+        for fence_id, group in candidates.groupby('fence_id', sort=False):
+            index = group['point'].to_numpy()
+            index = index[~inside[index]]
+            if len(index):
+                inside[index] = points_in_polygon(lat[index], lon[index], self.polygons[fence_id])
+        return inside
+
+    def violations(self, lat, lon, work_place):
+        """True where a point is outside every fence of its region; unfenced regions never violate"""
+        fenced = pd.Series(work_place, dtype=object).isin(self.work_places).to_numpy()
+        return fenced & ~self.contains(lat, lon, work_place)
+
+@cached_query("geofence", resource=True)
+def get_geofence_index():
+    with get_db() as conn:
+        rows = conn.execute("SELECT id, work_place, polygon FROM geofence").fetchall()
+    return GeofenceIndex((fence_id, work_place, json.loads(polygon)) for fence_id, work_place, polygon in rows)
+
+def count_fence_excursions(conn, pings, outside):
+    """New excursions per assignment: outside pings whose previous ping was inside.
+
+    The previous state of each vehicle's first ping in the batch comes from
+    its latest stored ping, so an excursion spanning batches counts once.
+    """
+    state = pd.DataFrame({
+        'plate_number': pings['plate_number'].to_numpy(),
+        'ping_time': pings['ping_time'].to_numpy(),
+        'assignment_id': pings['assignment_id'].to_numpy(),
+        'outside': outside,
+    }).sort_values(['plate_number', 'ping_time'], kind='stable')
+    stored = dict(conn.execute(
+        "SELECT value, (SELECT outside_fence FROM gps_ping WHERE plate_number = value "
+        "ORDER BY ping_time DESC LIMIT 1) FROM json_each(?)",
+        (json.dumps(state['plate_number'].unique().tolist()),)
+    ).fetchall())
+    previous = state.groupby('plate_number')['outside'].shift(1)
+    previous = previous.fillna(state['plate_number'].map(stored)).fillna(0).astype(bool)
+    started = state[state['outside'] & ~previous & state['assignment_id'].notna()]
+    return started.groupby('assignment_id').size()
+
+# GPS ingestion
+GPS_PING_COLUMNS = ('plate_number', 'ping_time', 'lat', 'lon', 'speed', 'heading')
+GPS_INGEST_CHUNK_ROWS = 50000
+
+def _clean_gps_pings(pings):
+    """Coerce a ping frame to GPS_PING_COLUMNS, returning (valid rows, rejected count)"""
+    pings = pd.DataFrame(pings).reindex(columns=GPS_PING_COLUMNS)
+    pings['plate_number'] = pings['plate_number'].astype('string').str.strip().str.upper()
+    for column in ('lat', 'lon', 'speed', 'heading'):
+        pings[column] = pd.to_numeric(pings[column], errors='coerce')
+    pings['ping_time'] = pd.to_datetime(pings['ping_time'], errors='coerce', format='mixed')
+    valid = (
+        pings['plate_number'].notna() & pings['ping_time'].notna()
+        & pings['lat'].between(-90, 90) & pings['lon'].between(-180, 180)
+    )
+    pings = pings[valid].copy()
+    pings['ping_time'] = pings['ping_time'].dt.strftime('%Y-%m-%d %H:%M:%S')
+    return pings, int((~valid).sum())
+
+def ingest_gps_pings(pings):
+    """Bulk load pings (DataFrame or iterable of dicts/tuples in GPS_PING_COLUMNS order).
+
+    Rows are validated vectorially, attached to the vehicle's active
+    assignment, checked against the fences of that assignment's work_place
+    and written with executemany in a single transaction; the assignment's
+    current position is moved to its newest ping and each new excursion
+    outside its fences adds one geofence violation. Returns (inserted, rejected).
+    """
+    if not isinstance(pings, pd.DataFrame):
+        pings = pd.DataFrame.from_records(list(pings), columns=GPS_PING_COLUMNS)
+    pings, rejected = _clean_gps_pings(pings)
+    if pings.empty:
+        return 0, rejected
+    fences = get_geofence_index()
+
+    with get_db() as conn:
+        # Ascending ids, so the newest active assignment per plate wins
+        assignment_ids, work_places = {}, {}
+        for plate, assignment_id, work_place in conn.execute(
+            f"SELECT plate_number, id, work_place FROM assignment WHERE {ACTIVE_ASSIGNMENT} ORDER BY id"
+        ):
+            assignment_ids[plate] = assignment_id
+            work_places[plate] = work_place
+        # Nullable ints, so a batch with no assigned plate stays valid
+        pings['assignment_id'] = pings['plate_number'].map(assignment_ids).astype('Int64')
+        pings['outside_fence'] = 0
+        excursions = pd.Series(dtype=int)
+        if len(fences):
+            outside = fences.violations(pings['lat'].to_numpy(), pings['lon'].to_numpy(),
+                                        pings['plate_number'].map(work_places).to_numpy())
+            excursions = count_fence_excursions(conn, pings, outside)
+            pings['outside_fence'] = outside.astype(int)
+        pings = pings.astype('object').where(pings.notna(), None)
+        conn.executemany(
+            "INSERT INTO gps_ping (assignment_id, plate_number, ping_time, lat, lon, speed, heading, outside_fence) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            pings[['assignment_id', *GPS_PING_COLUMNS, 'outside_fence']].itertuples(index=False, name=None)
+        )
+        moved = conn.executemany(
+            "UPDATE assignment SET geofence_violations = COALESCE(geofence_violations, 0) + ? WHERE id = ?",
+            [(int(count), int(assignment_id)) for assignment_id, count in excursions.items()]
+        ).rowcount > 0
+
+        latest = pings.sort_values('ping_time').drop_duplicates('plate_number', keep='last')
+        latest = latest[latest['assignment_id'].notna()]
+        moved |= conn.executemany(
+            "UPDATE assignment SET gps_position = ?, last_update = ? "
+            "WHERE id = ? AND (last_update IS NULL OR last_update < ?)",
+            [(f"{row.lat},{row.lon}", row.ping_time, row.assignment_id, row.ping_time)
+             for row in latest.itertuples(index=False)]
+        ).rowcount > 0
+    # Pings only touch the position columns, which have their own cache key,
+    # so dashboard, profile and summary caches on "assignment" survive a batch
+    invalidate_tables("gps_ping", *(("assignment_position",) if moved else ()))
+    return len(pings), rejected
+
+def ingest_gps_file(file, file_format="csv"):
+    """Stream a CSV or NDJSON ping file into gps_ping chunk by chunk"""
+    if file_format == "ndjson":
+        chunks = pd.read_json(file, lines=True, chunksize=GPS_INGEST_CHUNK_ROWS, dtype=False)
+    else:
+        chunks = pd.read_csv(file, chunksize=GPS_INGEST_CHUNK_ROWS)
+    inserted = rejected = 0
+    for chunk in chunks:
+        chunk_inserted, chunk_rejected = ingest_gps_pings(chunk)
+        inserted += chunk_inserted
+        rejected += chunk_rejected
+    return inserted, rejected
+
+# Trip reconstruction
+TRIP_STOP_SPEED_KMH = 5  # pings slower than this are stationary
+TRIP_MIN_STOP_SECONDS = 300  # stationary this long ends a trip
+TRIP_MAX_GAP_SECONDS = 900  # so does a silence this long
+TRIP_PLATE_BATCH = 500
+TRIP_BACKFILL_DAYS = 30
+TRIP_SUMMARY_INTERVAL = 900  # seconds between daily_distance refreshes
+EARTH_RADIUS_KM = 6371.0088
+
+TRIP_PINGS_SQL = '''
+    SELECT plate_number, ping_time, lat, lon, speed
+    FROM gps_ping
+    WHERE plate_number IN (SELECT value FROM json_each(?))
+      AND ping_time >= ? AND ping_time < ?
+'''
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance in km between coordinate arrays"""
+    lat1, lon1, lat2, lon2 = (np.radians(values) for values in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+def segment_trips(pings):
+    """Split ping tracks into trips and stops; returns (trips, daily distance) DataFrames.
+
+    A trip ends at a stationary run of TRIP_MIN_STOP_SECONDS or a gap of
+    TRIP_MAX_GAP_SECONDS. Steps inside stops are GPS drift and are not
+    counted; a step is credited to the day of the ping it ends at. Pings
+    without a speed use the speed implied by their step.
+    """
+    pings = pings.sort_values(['plate_number', 'ping_time'], kind='stable')
+    plate = pings['plate_number'].to_numpy()
+    times = pd.to_datetime(pings['ping_time'], format='%Y-%m-%d %H:%M:%S')
+    seconds = times.to_numpy().astype('datetime64[s]').astype(np.int64)
+    lat, lon = pings['lat'].to_numpy(float), pings['lon'].to_numpy(float)
+
+    same_vehicle = np.r_[False, plate[1:] == plate[:-1]]
+    gap = np.r_[0, np.diff(seconds)]
+    step_km = np.where(same_vehicle, haversine_km(np.r_[lat[:1], lat[:-1]], np.r_[lon[:1], lon[:-1]], lat, lon), 0.0)
+    breaks = ~same_vehicle | (gap > TRIP_MAX_GAP_SECONDS)
+    speed = pings['speed'].to_numpy(float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        speed = np.where(np.isnan(speed), np.where(gap > 0, step_km / gap * 3600, 0.0), speed)
+    moving = speed >= TRIP_STOP_SPEED_KMH
+
+    # Runs of pings in the same moving state, cut at breaks; long stationary runs are stops
+    new_run = breaks | np.r_[True, moving[1:] != moving[:-1]]
+    run = np.cumsum(new_run) - 1
+    first = np.flatnonzero(new_run)
+    last = np.r_[first[1:] - 1, len(seconds) - 1]
+    stopped = ~moving & ((seconds[last] - seconds[first])[run] >= TRIP_MIN_STOP_SECONDS)
+
+    in_trip = ~stopped
+    counted = in_trip & ~breaks
+    trip = np.cumsum(in_trip & (breaks | np.r_[True, stopped[:-1]]))
+    steps = pd.DataFrame({
+        'plate_number': plate,
+        'ping_time': times.to_numpy(),
+        'trip': np.where(in_trip, trip, 0),
+        'distance_km': np.where(counted, step_km, 0.0),
+        'driving_seconds': np.where(counted & moving, gap, 0),
+        'speed': speed,
+    })
+
+    trips = steps[in_trip].groupby('trip').agg(
+        plate_number=('plate_number', 'first'),
+        start_time=('ping_time', 'min'),
+        end_time=('ping_time', 'max'),
+        distance_km=('distance_km', 'sum'),
+        max_speed=('speed', 'max'),
+        pings=('speed', 'size'),
+    )
+    trips = trips[trips['pings'] > 1].reset_index(drop=True)
+
+    steps['day'] = steps['ping_time'].dt.strftime('%Y-%m-%d')
+    daily = steps.groupby(['plate_number', 'day']).agg(
+        km=('distance_km', 'sum'), driving_seconds=('driving_seconds', 'sum')).reset_index()
+    trip_days = trips.assign(day=trips['start_time'].dt.strftime('%Y-%m-%d')).groupby(['plate_number', 'day']).size()
+    daily['trips'] = trip_days.reindex(pd.MultiIndex.from_frame(daily[['plate_number', 'day']]), fill_value=0).to_numpy()
+    daily['driving_minutes'] = (daily.pop('driving_seconds') / 60).round(1)
+    daily['km'] = daily['km'].round(2)
+    return trips, daily[daily['km'] > 0]
+
+def summarize_trips(conn, start_day, end_day):
+    """Rebuild trip and daily_distance rows for start_day..end_day (dates); returns trips written"""
+    window_start = datetime.combine(start_day, datetime.min.time())
+    window_end = datetime.combine(end_day + timedelta(days=1), datetime.min.time())
+    # Pings just before the window supply the first step into it
+    lead = window_start - timedelta(seconds=TRIP_MAX_GAP_SECONDS)
+    bounds = (window_start.strftime('%Y-%m-%d %H:%M:%S'), window_end.strftime('%Y-%m-%d %H:%M:%S'))
+    conn.execute("DELETE FROM trip WHERE start_time >= ? AND start_time < ?", bounds)
+    conn.execute("DELETE FROM daily_distance WHERE day BETWEEN ? AND ?",
+                 (start_day.strftime('%Y-%m-%d'), end_day.strftime('%Y-%m-%d')))
+
+    plates = [row[0] for row in conn.execute("SELECT plate_number FROM vehicle ORDER BY plate_number")]
+    written = 0
+    for offset in range(0, len(plates), TRIP_PLATE_BATCH):
+        pings = pd.read_sql(TRIP_PINGS_SQL, conn, params=(
+            json.dumps(plates[offset:offset + TRIP_PLATE_BATCH]), lead.strftime('%Y-%m-%d %H:%M:%S'), bounds[1]))
+        if pings.empty:
+            continue
+        trips, daily = segment_trips(pings)
+        trips = trips[trips['start_time'] >= window_start]
+        daily = daily[daily['day'] >= bounds[0][:10]]
+        conn.executemany(
+            "INSERT INTO trip (plate_number, start_time, end_time, distance_km, max_speed, pings) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            zip(trips['plate_number'], trips['start_time'].dt.strftime('%Y-%m-%d %H:%M:%S'),
+                trips['end_time'].dt.strftime('%Y-%m-%d %H:%M:%S'), trips['distance_km'].round(3),
+                trips['max_speed'], trips['pings'].astype(int).tolist()))
+        conn.executemany(
+            "INSERT INTO daily_distance (plate_number, day, km, trips, driving_minutes) VALUES (?, ?, ?, ?, ?)",
+            daily[['plate_number', 'day', 'km', 'trips', 'driving_minutes']].astype('object').itertuples(
+                index=False, name=None))
+        written += len(trips)
+    return written
+
+def refresh_daily_distance():
+    """Re-segment every day since the last summarized one (at least yesterday, for late pings)"""
+    today = date.today()
+    with get_db() as conn:
+        last = conn.execute("SELECT MAX(day) FROM daily_distance").fetchone()[0]
+    if last:
+        day = min(datetime.strptime(last, '%Y-%m-%d').date(), today - timedelta(days=1))
+    else:
+        day = today - timedelta(days=TRIP_BACKFILL_DAYS)
+    # One transaction per day keeps the write lock short
+    while day <= today:
+        with get_db() as conn:
+            summarize_trips(conn, day, day)
+        day += timedelta(days=1)
+    invalidate_tables("trip", "daily_distance")
+
+DAILY_DISTANCE_SQL = '''
+    SELECT day, km, trips, driving_minutes
+    FROM daily_distance
+    WHERE plate_number = ? AND day >= ?
+    ORDER BY day
+'''
+
+@cached_query("daily_distance")
+def get_daily_distance(plate, days=30):
+    """GPS km per day for one vehicle over the last `days` days"""
+    with get_db() as conn:
+        return pd.read_sql(DAILY_DISTANCE_SQL, conn, params=(
+            plate, (date.today() - timedelta(days=days)).strftime('%Y-%m-%d')))
+
 # Real-time GPS Tracking
+# Latest ping per vehicle via idx_gps_ping_plate_time, falling back to the
+# position typed into the assignment form for vehicles without telematics
+GPS_POSITIONS_SQL = f'''
+    SELECT a.id, v.plate_number, v.vehicle_type, d.name AS driver_name, 
+           a.work_place, a.gps_position, p.lat, p.lon,
+           COALESCE(p.ping_time, a.last_update) AS last_update,
+           a.position_version AS row_version
+    FROM assignment a
+    JOIN vehicle v ON a.plate_number = v.plate_number
+    JOIN driver d ON a.driver_id = d.id
+    LEFT JOIN gps_ping p ON p.id = (
+        SELECT id FROM gps_ping
+        WHERE plate_number = a.plate_number
+        ORDER BY ping_time DESC
+        LIMIT 1
+    )
+    WHERE {ACTIVE_ASSIGNMENT}
+        AND (p.id IS NOT NULL OR a.gps_position IS NOT NULL)
+'''
+
+# Rows whose position was written since the previous tick. position_version
+# is a write counter (migration 16); last_update is the device's ping time, so
+# a late-uploaded batch can sit below another vehicle's newest ping
+GPS_POSITION_DELTA_SQL = GPS_POSITIONS_SQL + "        AND a.position_version > ?\n"
+
+TRACKING_REFRESH_SECONDS = (15, 30, 60)
+TRACKING_RESYNC_SECONDS = 600  # full reload also drops assignments that ended
+
+MAP_CENTER = [9.145, 40.4897]  # Center of Ethiopia
+MAP_HEIGHT = 500
+GPS_TEXT_PATTERN = r'^\s*(-?\d+(?:\.\d+)?)\s*,\s*(-?\d+(?:\.\d+)?)\s*$'
+
+# Markers are built client-side by Leaflet from a compact row array
+MARKER_CALLBACK = """
+function (row) {
+    var marker = L.marker(new L.LatLng(row[0], row[1]));
+    marker.bindPopup(row[2]);
+    marker.bindTooltip(row[3]);
+    return marker;
+}
+"""
+
+def resolve_positions(assignments):
+    """Vectorised lat/lon for each row: latest ping, else the parsed "lat,lon" text"""
+    parsed = assignments['gps_position'].astype('string').str.extract(GPS_TEXT_PATTERN)
+    positions = assignments.copy()
+    positions['lat'] = pd.to_numeric(positions['lat'], errors='coerce').fillna(pd.to_numeric(parsed[0], errors='coerce'))
+    positions['lon'] = pd.to_numeric(positions['lon'], errors='coerce').fillna(pd.to_numeric(parsed[1], errors='coerce'))
+    valid = positions['lat'].between(-90, 90) & positions['lon'].between(-180, 180)
+    return positions[valid]
+
+@st.cache_data(max_entries=8, show_spinner=False)
+def build_tracking_map(positions):
+    """Clustered map HTML; cached on the position snapshot so unchanged fleets skip rendering"""
+    def escaped(column):
+        return positions[column].fillna('').astype(str).map(html.escape)
+
+    popups = escaped('plate_number') + '<br>' + escaped('driver_name') + '<br>' + escaped('work_place')
+    tooltips = escaped('vehicle_type') + ' - ' + escaped('driver_name')
+    rows = list(zip(positions['lat'].round(6), positions['lon'].round(6), popups, tooltips))
+
+    m = folium.Map(location=MAP_CENTER, zoom_start=6)
+    FastMarkerCluster(rows, callback=MARKER_CALLBACK).add_to(m)
+    return folium.Figure(height=MAP_HEIGHT).add_child(m).render()
+
+def refresh_tracking_positions(force=False):
+    """Patch this session's position snapshot with rows changed since its high-water mark"""
+    state = st.session_state
+    snapshot = state.get("tracking_positions")
+    now = time.monotonic()
+    if force or snapshot is None or now - state.tracking_synced_at > TRACKING_RESYNC_SECONDS:
+        with get_db() as conn:
+            assignments = pd.read_sql(GPS_POSITIONS_SQL, conn)
+        snapshot = resolve_positions(assignments).set_index('id')
+        state.tracking_synced_at = now
+        changed = len(snapshot)
+    else:
+        with get_db() as conn:
+            delta = pd.read_sql(GPS_POSITION_DELTA_SQL, conn, params=(state.tracking_high_water,))
+        previous = snapshot['row_version'].reindex(delta['id'])
+        changed = int((previous.values != delta['row_version'].values).sum())
+        if changed:
+            snapshot = pd.concat([
+                snapshot.drop(delta['id'], errors='ignore'),
+                resolve_positions(delta).set_index('id'),
+            ])
+
+    state.tracking_positions = snapshot
+    state.tracking_high_water = int(snapshot['row_version'].max()) if not snapshot.empty else 0
+    return snapshot, changed
+
+def manage_geofences():
+    with st.expander("Geofences", expanded=False):
+        st.caption("Pings outside every fence of their assignment's work place count as violations; "
+                   "work places without fences are not checked.")
+        with st.form("geofence_form", clear_on_submit=True):
+            work_place = st.selectbox("Work Place*", ASSIGNMENT_TYPES)
+            name = st.text_input("Fence Name*")
+            polygon = st.text_area("Vertices*", placeholder="One 'latitude,longitude' per line, e.g.\n9.10,38.70\n9.10,38.80\n8.95,38.80")
+            submitted = st.form_submit_button("Add Geofence")
+            if submitted:
+                try:
+                    if not name:
+                        raise ValueError("Fence name is required")
+                    vertices = parse_polygon(polygon)
+                    with get_db() as conn:
+                        cursor = conn.execute("INSERT INTO geofence (work_place, name, polygon) VALUES (?, ?, ?)",
+                                              (work_place, name, json.dumps(vertices)))
+                        log_change(conn, "INSERT", "geofence", cursor.lastrowid)
+                    invalidate_tables("geofence", "change_log")
+                    st.success("Geofence added successfully!")
+                except Exception as e:
+                    st.error(f"Error: {str(e)}")
+
+        with get_db() as conn:
+            fences = pd.read_sql("SELECT id, work_place, name, polygon FROM geofence ORDER BY work_place, name", conn)
+        if fences.empty:
+            st.info("No geofences defined")
+            return
+        fences['vertices'] = fences['polygon'].map(lambda polygon: len(json.loads(polygon)))
+        st.dataframe(fences[['id', 'work_place', 'name', 'vertices']], hide_index=True)
+        fence_id = st.selectbox("Fence", fences['id'], key="geofence_delete",
+                                format_func=dict(zip(fences['id'], fences['work_place'] + " / " + fences['name'])).get)
+        if st.button("Delete Geofence"):
+            with get_db() as conn:
+                conn.execute("DELETE FROM geofence WHERE id = ?", (int(fence_id),))
+                log_change(conn, "DELETE", "geofence", fence_id)
+            invalidate_tables("geofence", "change_log")
+            st.rerun()
+
 def realtime_gps_tracking():
     st.title("Real-time Vehicle Tracking")
     
-    # Get active assignments with GPS positions
-    conn = sqlite3.connect(DB_PATH)
-    query = '''
-        SELECT a.id, v.plate_number, v.vehicle_type, d.name AS driver_name, 
-               a.work_place, a.gps_position, a.last_update
-        FROM assignment a
-        JOIN vehicle v ON a.plate_number = v.plate_number
-        JOIN driver d ON a.driver_id = d.id
-        WHERE (a.end_date IS NULL OR a.end_date >= date('now'))
-            AND a.gps_position IS NOT NULL
-    '''
-    assignments = pd.read_sql(query, conn)
-    conn.close()
-    
-    if assignments.empty:
-        st.warning("No active assignments with GPS data found")
-        return
-    
-    # Create map
-    st.subheader("Vehicle Locations")
-    map_center = [9.145, 40.4897]  # Center of Ethiopia
-    m = folium.Map(location=map_center, zoom_start=6)
-    
-    # Add markers
-    for _, row in assignments.iterrows():
-        if row['gps_position']:
+    with st.expander("Import GPS Pings", expanded=False):
+        st.caption("CSV or NDJSON with columns: " + ", ".join(GPS_PING_COLUMNS))
+        upload = st.file_uploader("Ping file", type=["csv", "ndjson", "jsonl"], key="gps_ping_file")
+        if upload is not None and st.button("Import Pings"):
             try:
-                lat, lon = map(float, row['gps_position'].split(','))
-                popup = f"{row['plate_number']}<br>{row['driver_name']}<br>{row['work_place']}"
-                folium.Marker(
-                    [lat, lon],
-                    popup=popup,
-                    tooltip=f"{row['vehicle_type']} - {row['driver_name']}"
-                ).add_to(m)
-            except:
-                continue
-    
-    # Display map
-    folium_static(m)
+                file_format = "csv" if upload.name.lower().endswith(".csv") else "ndjson"
+                inserted, rejected = ingest_gps_file(upload, file_format)
+                st.success(f"Imported {inserted} pings ({rejected} rejected)")
+            except Exception as e:
+                st.error(f"Error: {str(e)}")
     
-    # Update button
-    if st.button("Refresh Locations"):
-        st.rerun()
+    if st.session_state.get("role") == "admin":
+        manage_geofences()
     
-    # Display table
-    st.subheader("Assignment Details")
-    st.dataframe(assignments[['plate_number', 'driver_name', 'work_place', 'last_update']])
+    col1, col2 = st.columns(2)
+    auto_refresh = col1.toggle("Auto-refresh", value=False, key="tracking_auto_refresh")
+    interval = col2.selectbox("Every (seconds)", TRACKING_REFRESH_SECONDS, key="tracking_interval",
+                              disabled=not auto_refresh)
+
+    # Only this fragment reruns on each tick; it polls for changed rows and
+    # re-renders the map only when the position snapshot actually changed
+    @st.fragment(run_every=interval if auto_refresh else None)
+    def live_positions():
+        with timed_page("GPS Tracking (live)"):
+            show_live_positions()
+
+    def show_live_positions():
+        positions, changed = refresh_tracking_positions(force=st.session_state.pop("tracking_force", False))
+        
+        if positions.empty:
+            st.warning("No active assignments with GPS data found")
+            return
+        
+        # Create map
+        st.subheader("Vehicle Locations")
+        map_columns = ['plate_number', 'driver_name', 'work_place', 'vehicle_type', 'lat', 'lon']
+        st.iframe(build_tracking_map(positions[map_columns].sort_values('plate_number').reset_index(drop=True)),
+                  height=MAP_HEIGHT + 10)
+        
+        # Update button
+        st.button("Refresh Locations", on_click=lambda: st.session_state.update(tracking_force=True))
+        st.caption(f"{changed} updated since last refresh at {datetime.now().strftime('%H:%M:%S')}")
+        
+        # Display table
+        st.subheader("Assignment Details")
+        st.dataframe(positions.sort_values('last_update', ascending=False)[['plate_number', 'driver_name', 'work_place', 'last_update']])
+
+    live_positions()
+
+# Dashboard and report queries whose plans must stay index-driven
+HOT_QUERIES = {
+    "dashboard_active_assignments": ACTIVE_ASSIGNMENT_COUNT_SQL,
+    "dashboard_compliance_issues": COMPLIANCE_ISSUES_SQL,
+    "active_assignments": ACTIVE_ASSIGNMENTS_SQL,
+    "report_vehicles_by_assignment": VEHICLES_BY_ASSIGNMENT_SQL,
+    "report_drivers_by_reporting": DRIVERS_BY_REPORTING_SQL,
+    "report_ongoing_assignments": ONGOING_ASSIGNMENTS_SQL,
+    "report_unassigned_count": UNASSIGNED_COUNT_SQL,
+    "report_unassigned_vehicles": UNASSIGNED_VEHICLES_SQL,
+    "report_driver_assignments": DRIVER_ASSIGNMENTS_SQL,
+    "report_assignment_history": ASSIGNMENT_HISTORY_SQL,
+    "gps_positions": GPS_POSITIONS_SQL,
+    "gps_position_delta": GPS_POSITION_DELTA_SQL,
+    "fuel_fills": FUEL_FILLS_SQL,
+    "assignment_new_spans": NEW_ASSIGNMENT_SPANS_SQL,
+    "assignment_span_changes": ASSIGNMENT_SPAN_CHANGES_SQL,
+    "booking_clash": BOOKING_CLASH_SQL,
+    "trip_pings": TRIP_PINGS_SQL,
+    "daily_distance": DAILY_DISTANCE_SQL,
+    "perf_metrics": PERF_METRICS_SQL,
+    "latest_service": LATEST_SERVICE_SQL,
+    "odometer_trends": ODOMETER_TRENDS_SQL,
+}
 
 # One-page summary
+SEARCH_RESULT_LIMIT = 20
+
+class PrefixIndex:
+    """Sorted search keys with bisect lookups, for type-ahead over plates and names"""
+
+    def __init__(self, entries):
+        # entries: iterable of (search text, value); one value may have several texts
+        pairs = sorted({(text.strip().upper(), value) for text, value in entries if text and text.strip()})
+        self.keys = [key for key, _ in pairs]
+        self.values = [value for _, value in pairs]
+
+    def search(self, prefix, limit=SEARCH_RESULT_LIMIT):
+        """Up to `limit` distinct values with a key starting with `prefix`, exact matches first"""
+        prefix = prefix.strip().upper()
+        if not prefix:
+            return []
+        start = bisect.bisect_left(self.keys, prefix)
+        end = bisect.bisect_left(self.keys, prefix + "\U0010ffff", lo=start)
+        matches = []
+        for value in self.values[start:end]:
+            if value not in matches:
+                matches.append(value)
+                if len(matches) == limit:
+                    break
+        return matches
+
+@cached_query("vehicle", "driver", resource=True)
+def get_search_indexes():
+    """Plate and driver prefix indexes; drivers match on any word of the name or the ID number"""
+    with get_db() as conn:
+        drivers = conn.execute("SELECT id, name, id_number FROM driver").fetchall()
+    driver_keys = [(word, driver_id) for driver_id, name, id_number in drivers
+                   for word in [name, id_number, *name.split()[1:]]]
+    labels = {driver_id: f"{driver_id} - {name}" for driver_id, name, _ in drivers}
+    return PrefixIndex((plate, plate) for plate in get_plate_numbers()), PrefixIndex(driver_keys), labels
+
+def _json_rows(columns, query):
+    """Scalar subquery returning the rows of `query` as a JSON array of objects"""
+    pairs = ", ".join(f"'{column}', {column}" for column in columns)
+    return f"(SELECT json_group_array(json_object({pairs})) FROM ({query}))"
+
+# (section, columns, query) per profile; each profile is one statement with
+# one JSON column per section, so a lookup is a single round trip
+VEHICLE_PROFILE_SECTIONS = (
+    ("vehicle", IMPORT_SPECS["vehicle"]["columns"], "SELECT * FROM vehicle WHERE plate_number = :key"),
+    ("compliance", ('plate_number', 'insurance_type', 'insurance_date', 'yearly_inspection', 'inspection_date',
+                    'safety_audit', 'utilization_history', 'accident_history'),
+     "SELECT * FROM compliance WHERE plate_number = :key"),
+    ("maintenance", ('id', *IMPORT_SPECS["maintenance"]["columns"]),
+     "SELECT * FROM maintenance WHERE plate_number = :key ORDER BY last_service_date DESC"),
+    ("assignments", ('start_date', 'end_date', 'driver_name', 'id_number', 'phone', 'work_place'), '''
+        SELECT a.start_date, a.end_date, d.name AS driver_name, d.id_number, d.phone, a.work_place
+        FROM assignment a
+        JOIN driver d ON a.driver_id = d.id
+        WHERE a.plate_number = :key
+        ORDER BY a.start_date DESC'''),
+    ("utilization", ('day', 'km', 'trips', 'driving_minutes'), '''
+        SELECT day, km, trips, driving_minutes
+        FROM daily_distance
+        WHERE plate_number = :key
+        ORDER BY day DESC
+        LIMIT 30'''),
+)
+
+DRIVER_ASSIGNMENT_COLUMNS = ('start_date', 'end_date', 'plate_number', 'vehicle_type', 'make', 'model', 'work_place')
+DRIVER_ASSIGNMENTS_BY_ID_SQL = '''
+        SELECT a.start_date, a.end_date, v.plate_number, v.vehicle_type, v.make, v.model, a.work_place
+        FROM assignment a
+        JOIN vehicle v ON a.plate_number = v.plate_number
+        WHERE a.driver_id = :key'''
+DRIVER_PROFILE_SECTIONS = (
+    ("driver", ('id', *IMPORT_SPECS["driver"]["columns"]), "SELECT * FROM driver WHERE id = :key"),
+    ("current_assignment", DRIVER_ASSIGNMENT_COLUMNS,
+     DRIVER_ASSIGNMENTS_BY_ID_SQL + f"\n            AND {ACTIVE_ASSIGNMENT}"),
+    ("assignment_history", DRIVER_ASSIGNMENT_COLUMNS, DRIVER_ASSIGNMENTS_BY_ID_SQL + "\n        ORDER BY a.start_date DESC"),
+)
+
+def _profile_sql(sections):
+    return "SELECT " + ",\n       ".join(_json_rows(columns, query) for _, columns, query in sections)
+
+VEHICLE_PROFILE_SQL = _profile_sql(VEHICLE_PROFILE_SECTIONS)
+DRIVER_PROFILE_SQL = _profile_sql(DRIVER_PROFILE_SECTIONS)
+
+def _load_profile(sql, sections, key):
+    # Constant SQL text, so sqlite3's statement cache reuses the prepared statement
+    with get_db() as conn:
+        row = conn.execute(sql, {"key": key}).fetchone()
+    return {name: pd.DataFrame(json.loads(value), columns=list(columns))
+            for (name, columns, _), value in zip(sections, row)}
+
+@cached_query("vehicle", "compliance", "maintenance", "assignment", "driver", "daily_distance")
+def get_vehicle_profile(plate):
+    return _load_profile(VEHICLE_PROFILE_SQL, VEHICLE_PROFILE_SECTIONS, plate)
+
+@cached_query("driver", "assignment", "vehicle")
+def get_driver_profile(driver_id):
+    return _load_profile(DRIVER_PROFILE_SQL, DRIVER_PROFILE_SECTIONS, driver_id)
+
+def show_section(title, data, empty_message):
+    st.subheader(title)
+    if not data.empty:
+        st.dataframe(data)
+    else:
+        st.info(empty_message)
+
 def vehicle_driver_summary():
     st.title("Vehicle & Driver Summary")
     
-    search_type = st.radio("Search by:", ["Vehicle Plate", "Driver ID"])
+    search_type = st.radio("Search by:", ["Vehicle Plate", "Driver"])
+    plate_index, driver_index, driver_labels = get_search_indexes()
     
     if search_type == "Vehicle Plate":
-        plate = st.text_input("Enter Vehicle Plate Number").upper().strip()
-        if plate:
+        query = st.text_input("Enter Vehicle Plate Number (or its beginning)")
+        matches = plate_index.search(query)
+        if query and not matches:
+            st.warning("Vehicle not found")
+        elif matches:
+            plate = matches[0] if len(matches) == 1 else st.selectbox("Matching vehicles", matches)
             try:
-                conn = sqlite3.connect(DB_PATH)
-                
-                # Vehicle details
-                vehicle = pd.read_sql(f"SELECT * FROM vehicle WHERE plate_number = '{plate}'", conn)
-                if vehicle.empty:
-                    st.warning("Vehicle not found")
-                    return
-                
-                st.subheader("Vehicle Details")
-                st.dataframe(vehicle)
-                
-                # Compliance
-                compliance = pd.read_sql(f"SELECT * FROM compliance WHERE plate_number = '{plate}'", conn)
-                st.subheader("Compliance")
-                if not compliance.empty:
-                    st.dataframe(compliance)
-                else:
-                    st.info("No compliance records")
-                
-                # Maintenance
-                maintenance = pd.read_sql(f"SELECT * FROM maintenance WHERE plate_number = '{plate}' ORDER BY last_service_date DESC", conn)
-                st.subheader("Maintenance History")
-                if not maintenance.empty:
-                    st.dataframe(maintenance)
-                else:
-                    st.info("No maintenance records")
-                
-                # Assignments
-                assignments = pd.read_sql(f'''
-                    SELECT a.start_date, a.end_date, d.name AS driver_name, 
-                           d.id_number, d.phone, a.work_place
-                    FROM assignment a
-                    JOIN driver d ON a.driver_id = d.id
-                    WHERE a.plate_number = '{plate}'
-                    ORDER BY a.start_date DESC
-                ''', conn)
-                st.subheader("Assignment History")
-                if not assignments.empty:
-                    st.dataframe(assignments)
-                else:
-                    st.info("No assignment records")
-                
-                conn.close()
-                
+                profile = get_vehicle_profile(plate)
+                show_section("Vehicle Details", profile["vehicle"], "Vehicle not found")
+                show_section("Compliance", profile["compliance"], "No compliance records")
+                show_section("Maintenance History", profile["maintenance"], "No maintenance records")
+                show_section("Assignment History", profile["assignments"], "No assignment records")
+                show_section("Utilization (GPS, Last 30 Active Days)", profile["utilization"], "No GPS distance recorded")
             except Exception as e:
                 st.error(f"Database error: {str(e)}")
     
-    else:  # Driver ID
-        driver_id = st.text_input("Enter Driver ID")
-        if driver_id:
+    else:  # Driver
+        query = st.text_input("Enter Driver ID, ID Number or Name")
+        matches = driver_index.search(query)
+        if query.strip().isdigit() and int(query) in driver_labels:
+            matches = [int(query)] + [driver_id for driver_id in matches if driver_id != int(query)]
+        if query and not matches:
+            st.warning("Driver not found")
+        elif matches:
+            driver_id = matches[0] if len(matches) == 1 else st.selectbox(
+                "Matching drivers", matches, format_func=driver_labels.get)
             try:
-                conn = sqlite3.connect(DB_PATH)
-                
-                # Driver details
-                driver = pd.read_sql(f"SELECT * FROM driver WHERE id = '{driver_id}'", conn)
-                if driver.empty:
-                    st.warning("Driver not found")
-                    return
-                
-                st.subheader("Driver Details")
-                st.dataframe(driver)
-                
-                # Current assignment
-                current_assignment = pd.read_sql(f'''
-                    SELECT a.start_date, a.end_date, v.plate_number, 
-                           v.vehicle_type, v.make, v.model, a.work_place
-                    FROM assignment a
-                    JOIN vehicle v ON a.plate_number = v.plate_number
-                    WHERE a.driver_id = '{driver_id}'
-                        AND (a.end_date IS NULL OR a.end_date >= date('now'))
-                ''', conn)
-                st.subheader("Current Assignment")
-                if not current_assignment.empty:
-                    st.dataframe(current_assignment)
-                else:
-                    st.info("No current assignment")
-                
-                # Assignment history
-                assignment_history = pd.read_sql(f'''
-                    SELECT a.start_date, a.end_date, v.plate_number, 
-                           v.vehicle_type, v.make, v.model, a.work_place
-                    FROM assignment a
-                    JOIN vehicle v ON a.plate_number = v.plate_number
-                    WHERE a.driver_id = '{driver_id}'
-                    ORDER BY a.start_date DESC
-                ''', conn)
-                st.subheader("Assignment History")
-                if not assignment_history.empty:
-                    st.dataframe(assignment_history)
-                else:
-                    st.info("No assignment history")
-                
-                conn.close()
-                
+                profile = get_driver_profile(int(driver_id))
+                show_section("Driver Details", profile["driver"], "Driver not found")
+                show_section("Current Assignment", profile["current_assignment"], "No current assignment")
+                show_section("Assignment History", profile["assignment_history"], "No assignment history")
             except Exception as e:
                 st.error(f"Database error: {str(e)}")
 
@@ -1024,9 +3653,8 @@ def manage_users():
     # View existing users
     st.subheader("Existing Users")
     try:
-        conn = sqlite3.connect(DB_PATH)
-        users = pd.read_sql("SELECT username, role FROM users", conn)
-        conn.close()
+        with get_db() as conn:
+            users = pd.read_sql("SELECT username, role FROM users", conn)
         
         if not users.empty:
             st.dataframe(users)
@@ -1057,11 +3685,11 @@ def login_sidebar():
     password = st.sidebar.text_input("Password", type="password")
     
     if st.sidebar.button("Login"):
-        user = verify_user(username, password)
-        if user:
+        role = verify_user(username, password)
+        if role:
             st.session_state.logged_in = True
             st.session_state.username = username
-            st.session_state.role = get_user_role(username)
+            st.session_state.role = role
             st.sidebar.success("Logged in successfully!")
             st.rerun()
         else:
@@ -1140,6 +3768,11 @@ def main():
     </style>
     """, unsafe_allow_html=True)
 
+    start_periodic_job("change_log_retention", CHANGE_LOG_ARCHIVE_INTERVAL, archive_change_log)
+    start_periodic_job("trip_summary", TRIP_SUMMARY_INTERVAL, refresh_daily_distance)
+    start_periodic_job("compliance_alerts", COMPLIANCE_SCAN_INTERVAL, refresh_compliance_alerts)
+    start_periodic_job("metrics_flush", METRICS_FLUSH_INTERVAL, flush_metrics)
+    
     # Check login status
     if not login_sidebar():
         st.warning("Please login from the sidebar")
@@ -1156,10 +3789,12 @@ def main():
         "Reports",
         "GPS Tracking",
         "Summary Lookup",
+        "Fuel Analytics",
     ]
     
     if st.session_state.get("role") == "admin":
         nav_options.append("Change Log")
+        nav_options.append("Performance")
         nav_options.append("User Management")
     
     nav_options.append("Logout")
@@ -1173,32 +3808,38 @@ def main():
         st.session_state.pop("role", None)
         st.rerun()
     
-    # Page routing
-    if app_mode == "Dashboard":
-        show_dashboard()
-    elif app_mode == "Manage Vehicles":
-        manage_vehicles()
-    elif app_mode == "Manage Drivers":
-        manage_drivers()
-    elif app_mode == "Manage Assignments":
-        manage_assignments()
-    elif app_mode == "Manage Compliance":
-        manage_compliance()
-    elif app_mode == "Manage Maintenance":
-        manage_maintenance()
-    elif app_mode == "Reports":
-        generate_reports()
-    elif app_mode == "GPS Tracking":
-        realtime_gps_tracking()
-    elif app_mode == "Summary Lookup":
-        vehicle_driver_summary()
-    elif app_mode == "User Management":
-        manage_users()
-    elif app_mode == "Change Log":
-        view_change_log()
-    elif app_mode == "Logout":
+    # Page routing, timed per run; Logout only resets the session
+    if app_mode == "Logout":
         st.session_state.logged_in = False
         st.rerun()
 
+    with timed_page(app_mode):
+        if app_mode == "Dashboard":
+            show_dashboard()
+        elif app_mode == "Manage Vehicles":
+            manage_vehicles()
+        elif app_mode == "Manage Drivers":
+            manage_drivers()
+        elif app_mode == "Manage Assignments":
+            manage_assignments()
+        elif app_mode == "Manage Compliance":
+            manage_compliance()
+        elif app_mode == "Manage Maintenance":
+            manage_maintenance()
+        elif app_mode == "Reports":
+            generate_reports()
+        elif app_mode == "GPS Tracking":
+            realtime_gps_tracking()
+        elif app_mode == "Summary Lookup":
+            vehicle_driver_summary()
+        elif app_mode == "Fuel Analytics":
+            fuel_analytics()
+        elif app_mode == "User Management":
+            manage_users()
+        elif app_mode == "Change Log":
+            view_change_log()
+        elif app_mode == "Performance":
+            view_performance()
+
 if __name__ == "__main__":
     main()
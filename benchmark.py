@@ -0,0 +1,868 @@
+"""Performance checks for the fleet database.
+
+Usage:
+    python benchmark.py check-plans [--assignments 100000]
+    python benchmark.py gps-ingest [--pings 500000]
+    python benchmark.py geofence [--points 1000000]
+    python benchmark.py import [--rows 100000] [--format csv|xlsx]
+    python benchmark.py login [--sessions 4] [--logins 200] [--tune]
+    python benchmark.py forecast [--vehicles 10000] [--days 90]
+    python benchmark.py fuel [--vehicles 3000] [--years 3]
+    python benchmark.py conflicts [--assignments 1000000] [--lookups 10000]
+    python benchmark.py trips [--vehicles 1000] [--hours 10]
+    python benchmark.py generate [--vehicles 1000] [--db fleet.db] [--seed 42]
+    python benchmark.py suite [--scales 1000 10000 100000] [--output benchmark_results.json]
+                              [--baseline previous.json] [--pages]
+
+check-plans is the query plan regression check. check.sh runs it and exits
+non-zero on a regression; run it before merging any change to SQL in app.py.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+import app
+
+
+def seed_fleet(conn, vehicles, drivers, assignments, seed=42):
+    """Fill an empty database with random vehicles, drivers and assignments"""
+    rng = random.Random(seed)
+    today = date.today()
+    plates = [f"AA-{i:06d}" for i in range(vehicles)]
+
+    conn.executemany(
+        "INSERT INTO vehicle (plate_number, chasis, vehicle_type, make, model, year, fuel_type, assigned_for) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        [(plate, f"CH{i:08d}", rng.choice(app.VEHICLE_TYPES), "Toyota", "Hilux",
+          str(rng.randint(2005, 2024)), rng.choice(app.FUEL_TYPES), rng.choice(app.ASSIGNMENT_TYPES))
+         for i, plate in enumerate(plates)]
+    )
+    conn.executemany(
+        "INSERT INTO driver (name, id_number, phone, reporting_to) VALUES (?, ?, ?, ?)",
+        [(f"Driver {i}", f"ID{i:08d}", f"09{i:08d}", rng.choice(app.ASSIGNMENT_TYPES)) for i in range(drivers)]
+    )
+
+    rows = []
+    for _ in range(assignments):
+        start = today - timedelta(days=rng.randint(0, 5 * 365))
+        # Most history is closed; a small share is open-ended or still running
+        roll = rng.random()
+        if roll < 0.02:
+            end = None
+        else:
+            end = (start + timedelta(days=rng.randint(1, 180))).strftime('%Y-%m-%d')
+        rows.append((rng.choice(plates), rng.randint(1, drivers), rng.choice(app.ASSIGNMENT_TYPES),
+                     start.strftime('%Y-%m-%d'), end, "9.03,38.74", 0, start.strftime('%Y-%m-%d %H:%M:%S')))
+    conn.executemany(
+        "INSERT INTO assignment (plate_number, driver_id, work_place, start_date, end_date, "
+        "gps_position, geofence_violations, last_update) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        rows
+    )
+
+    conn.executemany(
+        "INSERT INTO maintenance (plate_number, last_service_km, last_service_date, next_service_km, "
+        "next_service_date, maintenance_center) VALUES (?, ?, ?, ?, ?, ?)",
+        [(plate, 10000, (today - timedelta(days=rng.randint(0, 365))).strftime('%Y-%m-%d'), 20000,
+          (today + timedelta(days=rng.randint(-30, 120))).strftime('%Y-%m-%d'), rng.choice(app.MAINTENANCE_CENTERS))
+         for plate in plates for _ in range(3)]
+    )
+    conn.executemany(
+        "INSERT INTO compliance (plate_number, insurance_type, insurance_date, yearly_inspection, inspection_date, "
+        "safety_audit, utilization_history, accident_history) VALUES (?, ?, ?, ?, ?, ?, '', '')",
+        [(plate, rng.choice(app.INSURANCE_TYPES), (today - timedelta(days=rng.randint(0, 400))).strftime('%Y-%m-%d'),
+          'No' if rng.random() < 0.05 else 'Yes', (today - timedelta(days=rng.randint(0, 400))).strftime('%Y-%m-%d'),
+          rng.choice(app.SAFETY_TYPES))
+         for plate in plates]
+    )
+    conn.execute("ANALYZE")
+
+
+def check_plans(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "plans.db")
+        with app.get_db(db_path) as conn:
+            seed_fleet(conn, args.vehicles, args.drivers, args.assignments)
+        with app.get_db(db_path) as conn:
+            reads = app.find_unbounded_reads(conn, app.HOT_QUERIES)
+
+    for name, detail in reads:
+        print(f"UNBOUNDED READ in {name}: {detail}")
+    if reads:
+        return 1
+    print(f"{len(app.HOT_QUERIES)} hot queries use indexes on a {args.assignments}-assignment database")
+    return 0
+
+
+def synthetic_pings(plates, count, seed=42):
+    """Random-walk pings around Addis Ababa, one every 30 s per vehicle"""
+    rng = np.random.default_rng(seed)
+    vehicle = rng.integers(0, len(plates), count)
+    start = pd.Timestamp(datetime.now().replace(microsecond=0)) - pd.Timedelta(seconds=30 * count // len(plates))
+    return pd.DataFrame({
+        'plate_number': np.asarray(plates)[vehicle],
+        'ping_time': start + pd.to_timedelta(np.arange(count) * 30 // len(plates), unit='s'),
+        'lat': 9.03 + rng.normal(0, 0.5, count),
+        'lon': 38.74 + rng.normal(0, 0.5, count),
+        'speed': rng.uniform(0, 90, count).round(1),
+        'heading': rng.uniform(0, 360, count).round(0),
+    })
+
+
+def bench_gps_ingest(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        app.DB_PATH = os.path.join(tmp, "gps.db")
+        with app.get_db() as conn:
+            seed_fleet(conn, args.vehicles, args.vehicles, args.vehicles)
+            plates = [row[0] for row in conn.execute("SELECT plate_number FROM vehicle")]
+            conn.executemany("INSERT INTO geofence (work_place, name, polygon) VALUES (?, ?, ?)",
+                             [(work_place, f"Fence {fence_id}", json.dumps(ring))
+                              for fence_id, work_place, ring in synthetic_fences(args.fences_per_region)])
+        app.invalidate_tables("geofence")
+        pings = synthetic_pings(plates, args.pings)
+
+        started = time.perf_counter()
+        for offset in range(0, len(pings), app.GPS_INGEST_CHUNK_ROWS):
+            app.ingest_gps_pings(pings.iloc[offset:offset + app.GPS_INGEST_CHUNK_ROWS])
+        api_rate = len(pings) / (time.perf_counter() - started)
+
+        csv_path = os.path.join(tmp, "pings.csv")
+        pings.to_csv(csv_path, index=False)
+        started = time.perf_counter()
+        inserted, rejected = app.ingest_gps_file(csv_path)
+        file_rate = inserted / (time.perf_counter() - started)
+
+        # Batches where no ping maps to an active assignment: a vehicle
+        # without one, and a plate the fleet does not know
+        with app.get_db() as conn:
+            conn.execute("INSERT INTO vehicle (plate_number, vehicle_type, chasis) VALUES (?, ?, ?)",
+                         ("BENCH-IDLE", "Pickup", "BENCH-IDLE-CHASIS"))
+        unassigned_ok = all(
+            app.ingest_gps_pings(synthetic_pings([plate], 100))[0] == 100
+            for plate in ("BENCH-IDLE", "BENCH-UNKNOWN")
+        )
+
+    print(f"Python API: {api_rate:,.0f} pings/s")
+    print(f"CSV file:   {file_rate:,.0f} pings/s ({rejected} rejected)")
+    print(f"Unassigned batches: {'ok' if unassigned_ok else 'FAILED'}")
+    return 0 if unassigned_ok and min(api_rate, file_rate) >= args.target else 1
+
+
+def synthetic_fences(per_region, vertices=24, seed=42):
+    """Jagged rings scattered over Ethiopia, `per_region` for each work place"""
+    rng = np.random.default_rng(seed)
+    fences = []
+    for work_place in app.ASSIGNMENT_TYPES:
+        for _ in range(per_region):
+            center_lat, center_lon = rng.uniform(4, 14), rng.uniform(34, 47)
+            angles = np.linspace(0, 2 * np.pi, vertices, endpoint=False)
+            radius = rng.uniform(0.3, 1.5) * rng.uniform(0.6, 1.0, vertices)
+            ring = np.column_stack([center_lat + radius * np.sin(angles), center_lon + radius * np.cos(angles)])
+            fences.append((len(fences) + 1, work_place, ring.tolist()))
+    return fences
+
+
+def bench_geofence(args):
+    fences = synthetic_fences(args.fences_per_region)
+    started = time.perf_counter()
+    index = app.GeofenceIndex(fences)
+    build_time = time.perf_counter() - started
+
+    rng = np.random.default_rng(7)
+    lat, lon = rng.uniform(3.5, 14.5, args.points), rng.uniform(33, 48, args.points)
+    work_place = np.asarray(app.ASSIGNMENT_TYPES, dtype=object)[rng.integers(0, len(app.ASSIGNMENT_TYPES), args.points)]
+
+    started = time.perf_counter()
+    outside = index.violations(lat, lon, work_place)
+    rate = args.points / (time.perf_counter() - started)
+
+    # Cross-check a sample against brute force over every fence of the region
+    sample = rng.choice(args.points, 2000, replace=False)
+    for i in sample:
+        inside = any(app.points_in_polygon(lat[i:i + 1], lon[i:i + 1], np.asarray(ring))[0]
+                     for _, region, ring in fences if region == work_place[i])
+        if inside == outside[i]:
+            print(f"Mismatch at point {i}")
+            return 1
+
+    print(f"{len(fences)} fences indexed in {build_time * 1000:.0f} ms")
+    print(f"{rate:,.0f} points/s ({outside.mean():.1%} outside their region's fences)")
+    return 0 if rate >= args.target else 1
+
+
+def synthetic_import_files(rows, seed=42):
+    """Vehicle, driver and maintenance import frames with ~1% deliberately bad rows"""
+    rng = np.random.default_rng(seed)
+    plates = np.array([f"IM-{i:06d}" for i in range(rows)], dtype=object)
+    vehicles = pd.DataFrame({
+        'plate_number': plates,
+        'chasis': [f"IMC{i:08d}" for i in range(rows)],
+        'vehicle_type': rng.choice(app.VEHICLE_TYPES, rows),
+        'make': "Toyota",
+        'model': "Hilux",
+        'year': rng.integers(2005, 2025, rows).astype(str),
+        'fuel_type': rng.choice(app.FUEL_TYPES, rows),
+        'fuel_capacity': rng.uniform(60, 200, rows).round(1),
+        'fuel_consumption': rng.uniform(6, 30, rows).round(1),
+        'loading_capacity': "1000kg",
+        'assigned_for': rng.choice(app.ASSIGNMENT_TYPES, rows),
+    })
+    drivers = pd.DataFrame({
+        'name': [f"Import Driver {i}" for i in range(rows)],
+        'id_number': [f"IMD{i:08d}" for i in range(rows)],
+        'phone': [f"09{i:08d}" for i in range(rows)],
+        'reporting_to': rng.choice(app.ASSIGNMENT_TYPES, rows),
+    })
+    last_service = pd.Timestamp(date.today()) - pd.to_timedelta(rng.integers(0, 365, rows), unit='D')
+    maintenance = pd.DataFrame({
+        'plate_number': rng.choice(plates, rows),
+        'last_service_km': rng.integers(0, 200000, rows),
+        'last_service_date': last_service.strftime('%Y-%m-%d'),
+        'next_service_km': rng.integers(200000, 210000, rows),
+        'next_service_date': (last_service + pd.Timedelta(days=90)).strftime('%Y-%m-%d'),
+        'maintenance_center': rng.choice(app.MAINTENANCE_CENTERS, rows),
+    })
+    bad = rng.choice(rows, max(rows // 100, 1), replace=False)
+    vehicles.loc[bad, 'fuel_type'] = "Kerosene"
+    drivers.loc[bad, 'reporting_to'] = ""
+    maintenance.loc[bad, 'next_service_date'] = "not a date"
+    return {"vehicle": vehicles, "driver": drivers, "maintenance": maintenance}
+
+
+def bench_import(args):
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        app.DB_PATH = os.path.join(tmp, "import.db")
+        for table, frame in synthetic_import_files(args.rows).items():
+            path = os.path.join(tmp, f"{table}.{args.format}")
+            if args.format == "xlsx":
+                frame.to_excel(path, index=False)
+            else:
+                frame.to_csv(path, index=False)
+            started = time.perf_counter()
+            inserted, errors = app.import_records(table, path, args.format, username="benchmark")
+            results[table] = len(frame) / (time.perf_counter() - started)
+            print(f"{table:<12} {results[table]:>10,.0f} rows/s ({inserted} inserted, {len(errors)} rejected)")
+    return 0 if min(results.values()) >= args.target else 1
+
+
+def bench_login(args):
+    if args.tune:
+        for exponent in range(12, 18):
+            started = time.perf_counter()
+            app.hash_password("correct horse", n=2 ** exponent)
+            print(f"n=2**{exponent}: {(time.perf_counter() - started) * 1000:6.1f} ms")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app.DB_PATH = os.path.join(tmp, "login.db")
+        users = [f"user{i}" for i in range(args.sessions)]
+        for username in users:
+            app.create_user(username, f"{username}-password")
+
+        def login(i):
+            username = users[i % len(users)]
+            password = f"{username}-password" if i % 10 else "wrong"  # every tenth attempt fails
+            started = time.perf_counter()
+            app.verify_user(username, password)
+            return time.perf_counter() - started
+
+        latencies = np.array([login(i) for i in range(min(args.logins, 20))]) * 1000
+        print(f"Single session: median {np.median(latencies):.0f} ms, p95 {np.percentile(latencies, 95):.0f} ms")
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(args.sessions) as pool:
+            concurrent = np.array(list(pool.map(login, range(args.logins)))) * 1000
+        rate = args.logins / (time.perf_counter() - started)
+        print(f"{args.sessions} concurrent sessions: {rate:.1f} logins/s, "
+              f"median {np.median(concurrent):.0f} ms, p95 {np.percentile(concurrent, 95):.0f} ms")
+
+        # Legacy SHA-256 row: first login upgrades it, second pays the scrypt cost
+        with app.get_db() as conn:
+            conn.execute("UPDATE users SET password = ? WHERE username = 'user0'",
+                         (app.hashlib.sha256(b"user0-password").hexdigest(),))
+        assert app.verify_user("user0", "user0-password") == "user"
+        with app.get_db() as conn:
+            upgraded = conn.execute("SELECT password FROM users WHERE username = 'user0'").fetchone()[0]
+        print(f"Legacy hash upgraded on login: {upgraded.startswith('scrypt$')}")
+
+    # Simultaneous logins share the CPU, so the tail under concurrency is the real bound
+    return 0 if max(np.median(latencies), np.percentile(concurrent, 95)) <= args.target_ms else 1
+
+
+def synthetic_odometer(plates, days, seed=42):
+    """One reading a day per vehicle, each driving a steady 20-300 km/day with noise"""
+    rng = np.random.default_rng(seed)
+    daily = rng.uniform(20, 300, len(plates))
+    dates = pd.date_range(end=pd.Timestamp(date.today()), periods=days).strftime('%Y-%m-%d')
+    km = 10000 + np.cumsum(daily[:, None] * rng.uniform(0.5, 1.5, (len(plates), days)), axis=1)
+    return pd.DataFrame({
+        'plate_number': np.repeat(plates, days),
+        'reading_date': np.tile(dates, len(plates)),
+        'km': km.ravel().astype(int),
+    })
+
+
+def bench_forecast(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "forecast.db")
+        with app.get_db(db_path) as conn:
+            seed_fleet(conn, args.vehicles, 100, 100)
+            plates = [row[0] for row in conn.execute("SELECT plate_number FROM vehicle")]
+            readings = synthetic_odometer(plates, args.days)
+            conn.executemany("INSERT INTO odometer_reading (plate_number, reading_date, km) VALUES (?, ?, ?)",
+                             readings.itertuples(index=False))
+            conn.execute("ANALYZE")
+
+        timings = []
+        for _ in range(args.repeat):
+            with app.get_db(db_path) as conn:
+                started = time.perf_counter()
+                forecast = app.forecast_service_dates(conn)
+                timings.append(time.perf_counter() - started)
+
+    best = min(timings)
+    print(f"{len(forecast):,} service records from {len(readings):,} readings: best {best * 1000:.0f} ms "
+          f"over {args.repeat} runs")
+    print(f"Due within {app.MAINTENANCE_DUE_DAYS} days: "
+          f"{(forecast['due_date'] <= pd.Timestamp(date.today() + timedelta(days=app.MAINTENANCE_DUE_DAYS))).sum():,}"
+          f" ({(forecast['due_by'] == 'km').sum():,} due by km)")
+    return 0 if best <= args.target else 1
+
+
+def synthetic_fuel_fills(plates, years, seed=42):
+    """Weekly full-tank fills per vehicle; about 1% are inflated to look like theft"""
+    rng = np.random.default_rng(seed)
+    weeks = years * 52
+    rated = rng.uniform(8, 16, len(plates))
+    distance = rng.uniform(100, 600, (len(plates), weeks))
+    liters = distance * rated[:, None] / 100 * rng.normal(1.05, 0.08, distance.shape)
+    liters[rng.random(liters.shape) < 0.01] *= 2.5
+    dates = (pd.Timestamp(date.today()) - pd.to_timedelta(np.arange(weeks)[::-1] * 7, unit='D')).strftime('%Y-%m-%d')
+    fills = pd.DataFrame({
+        'plate_number': np.repeat(plates, weeks),
+        'fill_date': np.tile(dates, len(plates)),
+        'liters': liters.ravel().round(2),
+        'odometer_km': (10000 + np.cumsum(distance, axis=1)).ravel().astype(int),
+    })
+    fills['cost'] = (fills['liters'] * 80).round(2)
+    return fills, dict(zip(plates, rated.round(1)))
+
+
+def bench_fuel(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "fuel.db")
+        with app.get_db(db_path) as conn:
+            seed_fleet(conn, args.vehicles, 100, 100)
+            plates = [row[0] for row in conn.execute("SELECT plate_number FROM vehicle")]
+            fills, rated = synthetic_fuel_fills(plates, args.years)
+            conn.executemany("UPDATE vehicle SET fuel_capacity = 120, fuel_consumption = ? WHERE plate_number = ?",
+                             [(rating, plate) for plate, rating in rated.items()])
+            conn.executemany("INSERT INTO fuel_fill (plate_number, fill_date, liters, odometer_km, cost) "
+                             "VALUES (?, ?, ?, ?, ?)", fills.itertuples(index=False))
+            conn.execute("ANALYZE")
+
+        today = pd.Timestamp(date.today())
+        worst = 0
+        for label, freq in app.FUEL_PERIODS.items():
+            period = pd.Period(today, freq=freq) - 1
+            with app.get_db(db_path) as conn:
+                started = time.perf_counter()
+                flagged, vehicles, regions = app.fuel_consumption_report(
+                    conn, period.start_time.strftime('%Y-%m-%d'), period.end_time.strftime('%Y-%m-%d'))
+                elapsed = time.perf_counter() - started
+            worst = max(worst, elapsed)
+            print(f"{label:<8} {period}: {elapsed * 1000:6.0f} ms, {vehicles['fills'].sum():,} fills, "
+                  f"{len(flagged):,} flagged, {len(regions)} regions")
+
+    print(f"{len(fills):,} fills in the ledger")
+    return 0 if worst <= args.target else 1
+
+
+def bench_conflicts(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        app.DB_PATH = os.path.join(tmp, "conflicts.db")
+        with app.get_db() as conn:
+            seed_fleet(conn, args.vehicles, args.vehicles, args.assignments)
+
+        with app.get_db() as conn:
+            started = time.perf_counter()
+            conflicts = app.find_assignment_conflicts(conn)
+            scan = time.perf_counter() - started
+        print(f"Conflict scan: {scan:.2f} s over {args.assignments:,} assignments, "
+              f"{len(conflicts):,} conflicting rows")
+
+        started = time.perf_counter()
+        plates, drivers = app.get_assignment_intervals()
+        print(f"Interval index build: {time.perf_counter() - started:.2f} s")
+
+        rng = random.Random(7)
+        probes = []
+        for _ in range(args.lookups):
+            start = date.today() - timedelta(days=rng.randint(0, 5 * 365))
+            probes.append((f"AA-{rng.randrange(args.vehicles):06d}", rng.randint(1, args.vehicles),
+                           start.strftime('%Y-%m-%d'), (start + timedelta(days=rng.randint(1, 30))).strftime('%Y-%m-%d')))
+        started = time.perf_counter()
+        for plate, driver, start, end in probes:
+            plates.find_overlap(plate, start, end)
+            drivers.find_overlap(driver, start, end)
+        lookup = (time.perf_counter() - started) / args.lookups
+        print(f"Form validation: {lookup * 1e6:.1f} us per vehicle + driver check")
+
+        # A new row is picked up without rebuilding the index
+        with app.get_db() as conn:
+            conn.execute("INSERT INTO assignment (plate_number, driver_id, start_date) VALUES ('AA-000000', 1, '2999-01-01')")
+        started = time.perf_counter()
+        plates, _ = app.get_assignment_intervals()
+        print(f"Incremental update: {(time.perf_counter() - started) * 1000:.1f} ms, "
+              f"new row found: {plates.find_overlap('AA-000000', '2999-06-01', '2999-06-01') is not None}")
+
+    return 0 if scan <= args.target else 1
+
+
+def synthetic_tracks(plates, hours, seed=42):
+    """A day of 30 s pings per vehicle: 40 min driving, 20 min parked, repeated.
+
+    Returns the pings and the distance each vehicle actually drove.
+    """
+    rng = np.random.default_rng(seed)
+    steps = hours * 120
+    minute = np.arange(steps) // 2
+    driving = (minute % 60) < 40
+    speed = np.where(driving, rng.uniform(30, 90, (len(plates), steps)), 0.0)
+    heading = np.radians(rng.uniform(0, 360, (len(plates), 1)) + np.cumsum(rng.normal(0, 5, (len(plates), steps)), axis=1))
+    step_km = speed * 30 / 3600
+    lat = 9.03 + np.cumsum(step_km * np.cos(heading) / 111.2, axis=1)
+    lon = 38.74 + np.cumsum(step_km * np.sin(heading) / (111.2 * np.cos(np.radians(9.03))), axis=1)
+    # Parked vehicles still report a few metres of GPS drift
+    parked = ~driving[None, :].repeat(len(plates), axis=0)
+    lat += np.where(parked, rng.normal(0, 0.00003, lat.shape), 0)
+    start = pd.Timestamp(date.today()) + pd.Timedelta(hours=6)
+    pings = pd.DataFrame({
+        'plate_number': np.repeat(plates, steps),
+        'ping_time': np.tile((start + pd.to_timedelta(np.arange(steps) * 30, unit='s')).strftime('%Y-%m-%d %H:%M:%S'),
+                             len(plates)),
+        'lat': lat.ravel(),
+        'lon': lon.ravel(),
+        'speed': speed.ravel().round(1),
+    })
+    # The first step of each drive starts from the parked position, so its distance counts
+    return pings, pd.Series(step_km[:, 1:].sum(axis=1), index=plates)
+
+
+def bench_trips(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "trips.db")
+        with app.get_db(db_path) as conn:
+            seed_fleet(conn, args.vehicles, 100, 100)
+            plates = [row[0] for row in conn.execute("SELECT plate_number FROM vehicle")]
+            pings, driven = synthetic_tracks(plates, args.hours)
+            conn.executemany("INSERT INTO gps_ping (plate_number, ping_time, lat, lon, speed) VALUES (?, ?, ?, ?, ?)",
+                             pings.itertuples(index=False, name=None))
+            conn.execute("ANALYZE")
+
+        with app.get_db(db_path) as conn:
+            started = time.perf_counter()
+            trips = app.summarize_trips(conn, date.today(), date.today())
+            elapsed = time.perf_counter() - started
+            daily = pd.read_sql("SELECT plate_number, km, trips FROM daily_distance", conn).set_index('plate_number')
+
+    error = (daily['km'] / driven.reindex(daily.index) - 1).abs().max()
+    rate = len(pings) / elapsed
+    print(f"{len(pings):,} pings segmented in {elapsed:.2f} s ({rate:,.0f} pings/s), {trips:,} trips")
+    print(f"Trips per vehicle: {daily['trips'].min()}-{daily['trips'].max()} "
+          f"(expected {args.hours}), worst daily km error {error:.2%}")
+    return 0 if rate >= args.target else 1
+
+
+FIRST_NAMES = ("Abebe", "Almaz", "Bekele", "Chaltu", "Dawit", "Eleni", "Fikru", "Genet", "Hailu", "Hirut",
+               "Kebede", "Lemlem", "Mulugeta", "Meron", "Negash", "Rahel", "Solomon", "Tigist", "Yonas", "Zewdu")
+LAST_NAMES = ("Alemu", "Bekele", "Desta", "Gebre", "Haile", "Kassa", "Mekonnen", "Tadesse", "Tesfaye", "Wolde")
+VEHICLE_MODELS = (("Toyota", "Hilux"), ("Toyota", "Land Cruiser"), ("Toyota", "Prado"), ("Toyota", "Hiace"),
+                  ("Isuzu", "FSR"), ("Isuzu", "D-Max"), ("Nissan", "Patrol"), ("Mitsubishi", "L200"))
+FLEET_USERS = ("admin", "fleet.officer", "dispatcher", "maintenance", "compliance", "region.lead")
+
+
+def zipf_choice(rng, options, size, exponent=1.0):
+    """Categorical draw where the first options are the most common, as in real fleets"""
+    weights = 1 / np.arange(1, len(options) + 1) ** exponent
+    return np.asarray(options, dtype=object)[rng.choice(len(options), size, p=weights / weights.sum())]
+
+
+def _days_ago(today, days):
+    return (np.datetime64(today) - np.asarray(days).astype(int).astype('timedelta64[D]')).astype(str)
+
+
+def generate_fleet(conn, vehicles, seed=42):
+    """Fill an empty database with a realistic, reproducible fleet of `vehicles` vehicles.
+
+    Per vehicle: about six back-to-back assignments (lognormal lengths,
+    ~85% of vehicles currently assigned), three service records, a
+    compliance record (~8% lapsed), weekly odometer readings for 90 days,
+    five GPS pings in the last hour when assigned and five change_log
+    entries in working hours. Drivers outnumber vehicles by 10%.
+    Returns row counts per table.
+    """
+    rng = np.random.default_rng(seed)
+    today = date.today()
+    plates = np.array([f"AA-{i:06d}" for i in range(vehicles)], dtype=object)
+    drivers = max(1, int(vehicles * 1.1))
+
+    models = np.array(VEHICLE_MODELS, dtype=object)[rng.choice(len(VEHICLE_MODELS), vehicles)]
+    regions = zipf_choice(rng, app.ASSIGNMENT_TYPES, vehicles, 0.5)
+    conn.executemany(
+        "INSERT INTO vehicle (plate_number, chasis, vehicle_type, make, model, year, fuel_type, fuel_capacity, "
+        "fuel_consumption, loading_capacity, assigned_for) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        zip(plates, (f"CH{i:09d}" for i in range(vehicles)), zipf_choice(rng, app.VEHICLE_TYPES, vehicles),
+            models[:, 0], models[:, 1],
+            (today.year - np.minimum(rng.gamma(2, 3, vehicles), 25).astype(int)).astype(str),
+            zipf_choice(rng, app.FUEL_TYPES, vehicles, 2), rng.choice((70.0, 80.0, 90.0, 150.0), vehicles),
+            np.clip(rng.normal(12, 2.5, vehicles), 6, 30).round(1), rng.choice(("1 t", "2 t", "5 t"), vehicles),
+            regions))
+    conn.executemany(
+        "INSERT INTO driver (name, id_number, phone, reporting_to) VALUES (?, ?, ?, ?)",
+        zip((f"{first} {last}" for first, last in zip(zipf_choice(rng, FIRST_NAMES, drivers, 0.3),
+                                                      zipf_choice(rng, LAST_NAMES, drivers, 0.3))),
+            (f"ID{i:08d}" for i in range(drivers)), (f"09{n:08d}" for n in rng.integers(0, 10 ** 8, drivers)),
+            zipf_choice(rng, app.ASSIGNMENT_TYPES, drivers, 0.5)))
+
+    # Assignments run backwards from an anchor end date, newest first per vehicle
+    per_vehicle = rng.poisson(5, vehicles) + 1
+    owner = np.repeat(np.arange(vehicles), per_vehicle)
+    duration = np.maximum(1, rng.lognormal(4.2, 0.8, len(owner))).astype(int)
+    span = duration + rng.exponential(10, len(owner)).astype(int)
+    back = pd.Series(span).groupby(owner).cumsum().to_numpy() - span
+    anchor = rng.uniform(-20, 120, vehicles).astype(int)
+    end_offset = anchor[owner] - back
+    start_offset = end_offset - duration
+    newest = np.r_[True, owner[1:] != owner[:-1]]
+    end_dates = _days_ago(today, -end_offset).astype(object)
+    end_dates[newest & (end_offset > 0) & (rng.random(len(owner)) < 0.3)] = None
+    start_dates = _days_ago(today, -start_offset)
+    region_lat = 9.03 + rng.normal(0, 1.5, vehicles)
+    region_lon = 38.74 + rng.normal(0, 1.5, vehicles)
+    conn.executemany(
+        "INSERT INTO assignment (plate_number, driver_id, work_place, start_date, end_date, gps_position, "
+        "geofence_violations, last_update) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        zip(plates[owner], rng.integers(1, drivers + 1, len(owner)).tolist(), regions[owner], start_dates, end_dates,
+            (f"{lat:.5f},{lon:.5f}" for lat, lon in zip(region_lat[owner], region_lon[owner])),
+            rng.poisson(0.3, len(owner)).tolist(), (f"{day} 08:00:00" for day in start_dates)))
+
+    services = np.repeat(np.arange(vehicles), 3)
+    service_age = rng.uniform(0, 730, len(services)).astype(int)
+    service_km = rng.integers(5000, 250000, len(services))
+    conn.executemany(
+        "INSERT INTO maintenance (plate_number, last_service_km, last_service_date, next_service_km, "
+        "next_service_date, maintenance_center) VALUES (?, ?, ?, ?, ?, ?)",
+        zip(plates[services], service_km.tolist(), _days_ago(today, service_age),
+            (service_km + rng.choice((5000, 10000), len(services))).tolist(), _days_ago(today, service_age - 180),
+            zipf_choice(rng, app.MAINTENANCE_CENTERS, len(services))))
+
+    conn.executemany(
+        "INSERT INTO compliance (plate_number, insurance_type, insurance_date, yearly_inspection, inspection_date, "
+        "safety_audit, utilization_history, accident_history) VALUES (?, ?, ?, ?, ?, ?, '', '')",
+        zip(plates, zipf_choice(rng, app.INSURANCE_TYPES, vehicles, 2), _days_ago(today, rng.uniform(0, 400, vehicles)),
+            np.where(rng.random(vehicles) < 0.03, "No", "Yes"), _days_ago(today, rng.uniform(0, 400, vehicles)),
+            zipf_choice(rng, app.SAFETY_TYPES, vehicles, 2)))
+
+    readings = np.repeat(np.arange(vehicles), 13)
+    daily_km = rng.lognormal(4, 0.6, vehicles)
+    reading_age = np.tile(np.arange(12, -1, -1) * 7, vehicles)
+    conn.executemany(
+        "INSERT INTO odometer_reading (plate_number, reading_date, km) VALUES (?, ?, ?)",
+        zip(plates[readings], _days_ago(today, reading_age),
+            (service_km[readings * 3] + daily_km[readings] * (90 - reading_age)).astype(int).tolist()))
+
+    active = pd.unique(owner[newest & (end_offset >= 0)])
+    pinged = np.repeat(active, 5)
+    ping_times = pd.Timestamp(datetime.now().replace(microsecond=0)) - pd.to_timedelta(
+        np.tile(np.arange(4, -1, -1) * 600, len(active)), unit='s')
+    conn.executemany(
+        "INSERT INTO gps_ping (plate_number, ping_time, lat, lon, speed, heading) VALUES (?, ?, ?, ?, ?, ?)",
+        zip(plates[pinged], ping_times.strftime('%Y-%m-%d %H:%M:%S'),
+            region_lat[pinged] + rng.normal(0, 0.01, len(pinged)), region_lon[pinged] + rng.normal(0, 0.01, len(pinged)),
+            rng.uniform(0, 90, len(pinged)).round(1), rng.uniform(0, 360, len(pinged)).round(0)))
+
+    changes = vehicles * 5
+    tables = zipf_choice(rng, app.AUDITED_TABLES, changes)
+    change_times = (pd.Timestamp(today) - pd.to_timedelta(rng.integers(0, 150, changes), unit='D')
+                    + pd.to_timedelta(np.clip(rng.normal(13, 2.5, changes), 7, 19) * 3600, unit='s'))
+    conn.executemany(
+        "INSERT INTO change_log (username, change_type, table_name, record_id, change_time) VALUES (?, ?, ?, ?, ?)",
+        zip(zipf_choice(rng, FLEET_USERS, changes), zipf_choice(rng, app.CHANGE_TYPES, changes, 1.5), tables,
+            np.where(np.isin(tables, ("vehicle", "compliance")), plates[rng.integers(0, vehicles, changes)],
+                     rng.integers(1, vehicles, changes).astype(str)),
+            change_times.sort_values().strftime('%Y-%m-%d %H:%M:%S')))
+
+    app.scan_compliance_alerts(conn)
+    conn.execute("ANALYZE")
+    return {table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+            for table in ("vehicle", "driver", "assignment", "maintenance", "compliance", "odometer_reading",
+                          "gps_ping", "change_log", "compliance_alert")}
+
+
+def generate(args):
+    with app.get_db(args.db) as conn:
+        if conn.execute("SELECT COUNT(*) FROM vehicle").fetchone()[0]:
+            print(f"{args.db} already has vehicles; generate into an empty database")
+            return 1
+        started = time.perf_counter()
+        counts = generate_fleet(conn, args.vehicles, args.seed)
+    print(f"Generated in {time.perf_counter() - started:.1f} s: "
+          + ", ".join(f"{count:,} {table}" for table, count in counts.items()))
+    return 0
+
+
+def suite_cases():
+    """Data functions behind each page, named page.function"""
+    today = date.today()
+    history = ((today - timedelta(days=365)).strftime('%Y-%m-%d'), today.strftime('%Y-%m-%d'))
+
+    def gps_positions():
+        with app.get_db() as conn:
+            assignments = pd.read_sql(app.GPS_POSITIONS_SQL, conn)
+        return app.build_tracking_map(app.resolve_positions(assignments))
+
+    def double_bookings():
+        with app.get_db() as conn:
+            span_version = app.get_assignment_span_version(conn)
+        return app.get_assignment_conflicts(span_version)
+
+    return {
+        "dashboard.counts": app.get_dashboard_counts,
+        "vehicles.distribution": app.get_vehicle_distribution,
+        "vehicles.grid_count": lambda: app.count_rows("vehicle", "", ()),
+        "drivers.distribution": app.get_driver_distribution,
+        "assignments.interval_index": app.get_assignment_intervals,
+        "maintenance.forecast": app.get_service_forecast,
+        "compliance.alert_scan": app.refresh_compliance_alerts,
+        "reports.assignment_summary": app.get_assignment_summary,
+        "reports.unassigned_vehicles": lambda: app.get_report_preview("unassigned_vehicles"),
+        "reports.driver_assignments": lambda: app.get_report_preview("driver_assignments"),
+        "reports.assignment_history": lambda: app.get_report_preview("assignment_history", history),
+        "reports.double_bookings": double_bookings,
+        "gps.positions_map": gps_positions,
+        "summary.search_indexes": app.get_search_indexes,
+        "summary.vehicle_profile": lambda: app.get_vehicle_profile("AA-000000"),
+        "summary.driver_profile": lambda: app.get_driver_profile(1),
+        "change_log.count": lambda: app.count_rows("change_log", "", ()),
+    }
+
+
+def clear_caches():
+    """Forget every cached result, as after a server restart, but keep the connection pool"""
+    st.cache_data.clear()
+    app.invalidate_tables(*app._CACHES_BY_TABLE)
+    app.get_interval_store.clear()
+
+
+def time_case(func, repeat):
+    """(cold ms, warm ms): medians over `repeat` runs with and without cleared caches"""
+    cold, warm = [], []
+    for _ in range(repeat):
+        clear_caches()
+        started = time.perf_counter()
+        func()
+        cold.append(time.perf_counter() - started)
+        started = time.perf_counter()
+        func()
+        warm.append(time.perf_counter() - started)
+    return round(float(np.median(cold)) * 1000, 2), round(float(np.median(warm)) * 1000, 2)
+
+
+def time_pages(db_dir, repeat):
+    """Full script runs per navigation page with Streamlit's AppTest, as an admin"""
+    from streamlit.testing.v1 import AppTest
+
+    cwd = os.getcwd()
+    os.chdir(db_dir)  # app.py opens fleet.db relative to the working directory
+    st.cache_resource.clear()
+    try:
+        at = AppTest.from_file(os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py"),
+                               default_timeout=600)
+        at.session_state["logged_in"] = True
+        at.session_state["username"] = "admin"
+        at.session_state["role"] = "admin"
+        at.run()
+        pages = [page for page in at.sidebar.selectbox[0].options if page != "Logout"]
+        timings = {}
+        for page in pages:
+            runs = []
+            for _ in range(repeat):
+                at.sidebar.selectbox[0].select(page)
+                started = time.perf_counter()
+                at.run()
+                runs.append(time.perf_counter() - started)
+            if at.exception:
+                raise RuntimeError(f"{page}: {at.exception[0].message}")
+            timings[f"page.{page}"] = round(float(np.median(runs)) * 1000, 2)
+        return timings
+    finally:
+        os.chdir(cwd)
+        st.cache_resource.clear()
+
+
+def compare_results(results, baseline, tolerance):
+    """Print cold-time changes against a previous report; returns the number of regressions"""
+    regressions = 0
+    for scale, current in results["scales"].items():
+        previous = baseline.get("scales", {}).get(scale)
+        if not previous:
+            continue
+        for name, timing in current["cases"].items():
+            before = previous["cases"].get(name, {}).get("cold_ms")
+            if not before:
+                continue
+            change = timing["cold_ms"] / before - 1
+            # Ignore jitter on sub-5 ms timings
+            slower = change > tolerance and timing["cold_ms"] - before > 5
+            regressions += slower
+            print(f"{scale:>7} {name:<32} {before:>10.1f} -> {timing['cold_ms']:>10.1f} ms "
+                  f"({change:+.0%}){'  REGRESSION' if slower else ''}")
+    return regressions
+
+
+def bench_suite(args):
+    results = {
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "seed": args.seed,
+        "repeat": args.repeat,
+        "environment": {
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "pandas": pd.__version__,
+            "numpy": np.__version__,
+            "streamlit": st.__version__,
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+        },
+        "scales": {},
+    }
+    cases = suite_cases()
+    for scale in args.scales:
+        with tempfile.TemporaryDirectory() as tmp:
+            app.DB_PATH = os.path.join(tmp, "fleet.db")
+            clear_caches()
+            started = time.perf_counter()
+            with app.get_db() as conn:
+                rows = generate_fleet(conn, scale, args.seed)
+            generated = time.perf_counter() - started
+            print(f"{scale:,} vehicles: generated {sum(rows.values()):,} rows in {generated:.1f} s")
+
+            timings = {}
+            for name, func in cases.items():
+                cold, warm = time_case(func, args.repeat)
+                timings[name] = {"cold_ms": cold, "warm_ms": warm}
+                print(f"  {name:<32} cold {cold:>10.1f} ms   warm {warm:>8.2f} ms")
+            if args.pages:
+                for name, elapsed in time_pages(tmp, args.repeat).items():
+                    timings[name] = {"cold_ms": elapsed, "warm_ms": None}
+                    print(f"  {name:<32} run  {elapsed:>10.1f} ms")
+            app.get_connection_pool.clear()
+        results["scales"][str(scale)] = {"rows": rows, "generate_seconds": round(generated, 2), "cases": timings}
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Wrote {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            return 1 if compare_results(results, json.load(f), args.tolerance) else 0
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    plans = commands.add_parser("check-plans", help="fail if a hot query reads a history table without an index bound")
+    plans.add_argument("--vehicles", type=int, default=3000)
+    plans.add_argument("--drivers", type=int, default=3000)
+    plans.add_argument("--assignments", type=int, default=100000)
+    plans.set_defaults(func=check_plans)
+
+    gps = commands.add_parser("gps-ingest", help="measure bulk GPS ping ingestion throughput")
+    gps.add_argument("--vehicles", type=int, default=3000)
+    gps.add_argument("--pings", type=int, default=500000)
+    gps.add_argument("--fences-per-region", type=int, default=10)
+    gps.add_argument("--target", type=float, default=50000, help="minimum acceptable pings/s")
+    gps.set_defaults(func=bench_gps_ingest)
+
+    fence = commands.add_parser("geofence", help="measure batch geofence evaluation throughput")
+    fence.add_argument("--points", type=int, default=1000000)
+    fence.add_argument("--fences-per-region", type=int, default=10)
+    fence.add_argument("--target", type=float, default=100000, help="minimum acceptable points/s")
+    fence.set_defaults(func=bench_geofence)
+
+    bulk = commands.add_parser("import", help="measure bulk CSV/XLSX import throughput")
+    bulk.add_argument("--rows", type=int, default=100000)
+    bulk.add_argument("--format", choices=("csv", "xlsx"), default="csv")
+    bulk.add_argument("--target", type=float, default=20000, help="minimum acceptable rows/s")
+    bulk.set_defaults(func=bench_import)
+
+    auth = commands.add_parser("login", help="measure password verification latency and concurrent login throughput")
+    auth.add_argument("--sessions", type=int, default=4, help="logins hashing at the same time")
+    auth.add_argument("--logins", type=int, default=200)
+    auth.add_argument("--tune", action="store_true", help="print the hash cost for a range of scrypt n values")
+    auth.add_argument("--target-ms", type=float, default=250,
+                      help="maximum acceptable single-session median and concurrent p95 login latency")
+    auth.set_defaults(func=bench_login)
+
+    forecast = commands.add_parser("forecast", help="measure the fleet-wide maintenance forecast pass")
+    forecast.add_argument("--vehicles", type=int, default=10000)
+    forecast.add_argument("--days", type=int, default=90, help="daily odometer readings per vehicle")
+    forecast.add_argument("--repeat", type=int, default=3)
+    forecast.add_argument("--target", type=float, default=1.0, help="maximum acceptable seconds per pass")
+    forecast.set_defaults(func=bench_forecast)
+
+    fuel = commands.add_parser("fuel", help="measure the fuel analytics pass for a month, quarter and year")
+    fuel.add_argument("--vehicles", type=int, default=3000)
+    fuel.add_argument("--years", type=int, default=3)
+    fuel.add_argument("--target", type=float, default=2.0, help="maximum acceptable seconds for the widest period")
+    fuel.set_defaults(func=bench_fuel)
+
+    overlap = commands.add_parser("conflicts", help="measure the double-booking scan and interval index lookups")
+    overlap.add_argument("--vehicles", type=int, default=3000)
+    overlap.add_argument("--assignments", type=int, default=1000000)
+    overlap.add_argument("--lookups", type=int, default=10000)
+    overlap.add_argument("--target", type=float, default=10.0, help="maximum acceptable scan seconds")
+    overlap.set_defaults(func=bench_conflicts)
+
+    tracks = commands.add_parser("trips", help="measure trip segmentation and daily distance throughput")
+    tracks.add_argument("--vehicles", type=int, default=1000)
+    tracks.add_argument("--hours", type=int, default=10, help="hours of 30 s pings per vehicle")
+    tracks.add_argument("--target", type=float, default=200000, help="minimum acceptable pings/s")
+    tracks.set_defaults(func=bench_trips)
+
+    fleet = commands.add_parser("generate", help="fill an empty database with a seeded synthetic fleet")
+    fleet.add_argument("--vehicles", type=int, default=1000)
+    fleet.add_argument("--db", default=app.DB_PATH)
+    fleet.add_argument("--seed", type=int, default=42)
+    fleet.set_defaults(func=generate)
+
+    suite = commands.add_parser("suite", help="time every page's data functions at several fleet sizes")
+    suite.add_argument("--scales", type=int, nargs="+", default=[1000, 10000, 100000])
+    suite.add_argument("--seed", type=int, default=42)
+    suite.add_argument("--repeat", type=int, default=3)
+    suite.add_argument("--output", default="benchmark_results.json")
+    suite.add_argument("--baseline", help="earlier --output file to compare cold timings against")
+    suite.add_argument("--tolerance", type=float, default=0.25, help="slowdown flagged as a regression")
+    suite.add_argument("--pages", action="store_true", help="also time full page runs with AppTest")
+    suite.set_defaults(func=bench_suite)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
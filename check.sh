@@ -0,0 +1,5 @@
+#!/bin/bash
+# Pre-merge checks, run by hand or in CI; setup.sh only installs dependencies
+set -e
+# Fails when a hot query plan regresses to an unbounded history read
+python benchmark.py check-plans